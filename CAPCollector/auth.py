@@ -1,15 +1,33 @@
-"""Stronger password auth for CAP Collector."""
+"""Stronger password auth and API tokens for CAP Collector."""
 
 __author__ = "shakusa@google.com (Steve Hakusa)"
 
+import base64
+import hashlib
+import hmac
+import os
 import re
+import time
 
+from core import models
+from django.conf import settings
 from django.contrib.auth.forms import PasswordChangeForm
 from django.contrib.auth.forms import SetPasswordForm
+from django.contrib.auth.models import Group
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
+from django.dispatch import receiver
 from django.forms import ValidationError
 from django.utils.translation import ugettext as _
 
 
+ALERT_CREATOR_CACHE_KEY = "alert_creator:%(generation)s:%(user_id)s"
+ALERT_CREATORS_GENERATION_CACHE_KEY = "alert_creators:generation"
+
+
 def validate_strong_password(password):
   """Validates that the given password is sufficiently strong.
 
@@ -52,3 +70,108 @@ class ValidatingPasswordChangeForm(PasswordChangeForm):
   def clean_new_password1(self):
     password = self.cleaned_data["new_password1"]
     return validate_strong_password(password)
+
+
+def get_token_digest(token):
+  """Returns keyed digest of an API token as stored in the database.
+
+  Args:
+    token: A string, the API token.
+  Returns:
+    Hex encoded HMAC-SHA256 of the token keyed by SECRET_KEY.
+  """
+  return hmac.new(settings.SECRET_KEY, token.encode("utf-8"),
+                  hashlib.sha256).hexdigest()
+
+
+def create_api_token(user, name):
+  """Creates a new API token of the user.
+
+  Only the token digest is stored, the token can't be recovered later.
+
+  Args:
+    user: A django.contrib.auth.models.User, the token owner.
+    name: A string, the token name (e.g. the publishing script).
+  Returns:
+    The API token string.
+  """
+  token = base64.urlsafe_b64encode(os.urandom(30))
+  models.ApiToken.objects.create(user=user, name=name,
+                                 digest=get_token_digest(token))
+  return token
+
+
+def get_request_token(request):
+  """Returns the API token of "Authorization: Token <token>" header or None."""
+  authorization = request.META.get("HTTP_AUTHORIZATION", "").split()
+  if len(authorization) == 2 and authorization[0] == "Token":
+    return authorization[1]
+  return None
+
+
+def authenticate_token(token):
+  """Returns the active user owning the API token.
+
+  Args:
+    token: A string, the API token.
+  Returns:
+    A django.contrib.auth.models.User or None if the token is unknown or
+    revoked.
+  """
+  try:
+    api_token = models.ApiToken.objects.select_related("user").get(
+        digest=get_token_digest(token), revoked=False)
+  except models.ApiToken.DoesNotExist:
+    return None
+  if not api_token.user.is_active:
+    return None
+  return api_token.user
+
+
+def is_alert_creator(user):
+  """Checks whether the user may release alerts.
+
+  The group membership is cached in the shared default cache for
+  ALERT_CREATORS_CACHE_TIMEOUT seconds or until users or groups change (see
+  invalidate_alert_creators).
+
+  Args:
+    user: A django.contrib.auth.models.User.
+  Returns:
+    True if the user is in ALERT_CREATORS_GROUP_NAME group.
+  """
+  generation = cache.get(ALERT_CREATORS_GENERATION_CACHE_KEY)
+  if generation is None:
+    # Use current time to never reuse generations after a cache eviction.
+    cache.add(ALERT_CREATORS_GENERATION_CACHE_KEY, int(time.time() * 1000),
+              None)
+    generation = cache.get(ALERT_CREATORS_GENERATION_CACHE_KEY)
+  cache_key = ALERT_CREATOR_CACHE_KEY % {"generation": generation,
+                                         "user_id": user.pk}
+  is_creator = cache.get(cache_key)
+  if is_creator is None:
+    is_creator = user.groups.filter(
+        name=settings.ALERT_CREATORS_GROUP_NAME).exists()
+    cache.set(cache_key, is_creator, settings.ALERT_CREATORS_CACHE_TIMEOUT)
+  return is_creator
+
+
+def invalidate_alert_creators():
+  """Invalidates cached group membership of all users."""
+  try:
+    cache.incr(ALERT_CREATORS_GENERATION_CACHE_KEY)
+  except ValueError:
+    # The generation key is missing, start a new one.
+    cache.set(ALERT_CREATORS_GENERATION_CACHE_KEY, int(time.time() * 1000),
+              None)
+
+
+# Connected in every process since core.admin (and core.views) import this
+# module. Deleting a group removes its memberships without m2m_changed.
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def on_alert_creators_changed(sender, **kwargs):
+  """Invalidates cached group membership on user or group changes."""
+  if kwargs.get("action", "post_").startswith("post_"):
+    invalidate_alert_creators()
@@ -17,6 +17,10 @@ from settings_prod import *
 SITE_URL = SITE_SCHEME + "://" + SITE_DOMAIN
 
 CAP_SCHEMA_FILE = "cap1.2.xsd"
+# Schema files (in SCHEMA_DIR) alerts are validated against. Add e.g. CAP 1.2
+# profile schemas here. Schemas must target CAP_NS, the namespace alerts are
+# parsed in.
+CAP_SCHEMA_FILES = [CAP_SCHEMA_FILE]
 CAP_NS = "urn:oasis:names:tc:emergency:cap:1.2"
 CERT_NS = "http://www.w3.org/2000/09/xmldsig#"
 
@@ -38,6 +42,133 @@ SCHEMA_DIR = os.path.join(BASE_DIR, "schema")
 # See https://docs.djangoproject.com/en/dev/topics/auth/ for managing Users.
 ALERT_CREATORS_GROUP_NAME = "can release alerts"
 
+# Time in seconds the group membership of alert creators is cached in the
+# default cache (see CACHES). User and group changes invalidate it.
+ALERT_CREATORS_CACHE_TIMEOUT = 300
+
+# Maximum number of alerts accepted by a single batch post request and number
+# of threads used to validate and sign them.
+ALERT_BATCH_MAX_SIZE = 100
+ALERT_BATCH_THREADS = 4
+
+# Number of processes signing alerts and time in seconds to wait for a
+# signature. Alerts are signed in the request thread if set to 0.
+SIGNING_PROCESSES = 2
+SIGNING_TIMEOUT = 10
+
+# Whether posted alerts are queued and created by worker threads (post
+# requests are answered with 202 Accepted and a job status URL). Alerts of a
+# sender are created in the order they were posted.
+ALERT_INGEST_ASYNC = False
+# Number of ingestion worker threads per process.
+ALERT_INGEST_WORKERS = 2
+# Time in seconds between checks for jobs queued by other processes.
+ALERT_INGEST_POLL_INTERVAL = 1
+# Time in seconds after which a running job is considered abandoned.
+ALERT_INGEST_JOB_TIMEOUT = 300
+# Time in seconds finished jobs are kept for status requests.
+ALERT_INGEST_JOB_RETENTION = 86400
+
+# Cache alias used to store materialized (pre-rendered) feeds. It must be a
+# shared cache backend (see CACHES) so that publishing an alert invalidates the
+# feed in all worker processes.
+FEED_CACHE_ALIAS = "default"
+
+# Upper bound (in seconds) for how long a materialized feed is served from the
+# cache. Feeds are also invalidated on alert publishing and on the earliest
+# expiration time among the cached alerts.
+FEED_CACHE_TIMEOUT = 300
+
+# Set to True to stream feeds entry by entry instead of serving materialized
+# feeds. Streamed feeds are not cached and not prettified, but their memory
+# usage does not grow with the number of active alerts (alerts are read in
+# chunks, see utils.IterateAlerts).
+FEED_STREAMING = False
+
+# Maximum number of alerts per feed page (see "limit" feed URL parameter).
+FEED_MAX_PAGE_SIZE = 1000
+
+# Time in seconds the changes feed (feed/changes.xml) lags behind. Alerts are
+# stamped with their modification time before their transaction commits, so
+# changes are only reported up to this long ago to not skip a late commit for
+# clients holding a newer changes token. Keep it above the longest alert
+# saving transaction.
+FEED_CHANGES_SAFETY_LAG = 10
+
+# Maximum number of parsed alerts kept in memory by each process and their
+# maximum approximate total size in bytes.
+PARSED_ALERT_CACHE_SIZE = 1000
+PARSED_ALERT_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+# Maximum number of geocode preview polygons kept in memory by each process,
+# their maximum approximate total size in bytes and time in seconds between
+# checks for new polygon imports. With GEOCODE_PREVIEW_WARM_UP all polygons
+# are loaded when the application starts (once with gunicorn --preload).
+GEOCODE_PREVIEW_CACHE_SIZE = 10000
+GEOCODE_PREVIEW_CACHE_MAX_BYTES = 64 * 1024 * 1024
+GEOCODE_PREVIEW_VERSION_CHECK_INTERVAL = 60
+GEOCODE_PREVIEW_WARM_UP = False
+
+# Tolerances in degrees geocode preview polygons are simplified with at import
+# time. Previews are served at the largest tolerance below the requested one
+# (a map pixel size at the "zoom" parameter).
+GEOCODE_PREVIEW_TOLERANCES = (0.001, 0.005, 0.02)
+
+# Spatial index of geocode preview polygon bounding boxes written by the
+# importer and loaded by each process, and its grid cell size in degrees
+# (about the size of a district). Set the file to None to build the index
+# from the database in each process.
+GEOCODE_PREVIEW_INDEX_FILE = os.path.join(BASE_DIR, "run",
+                                          "geocode_preview_index.json")
+GEOCODE_PREVIEW_INDEX_CELL_SIZE = 1.0
+
+# Directory to publish static feed.xml, feed.html and feed/<uuid>.{xml,html}
+# files to whenever an alert is published, so that a web server (see
+# example/nginx.example.conf) can serve them without the application.
+# Run "python manage.py publish_static_feeds --watch" to also refresh the feeds
+# when alerts expire. Set to None to disable static publishing.
+STATIC_FEED_DIR = None
+
+# Set to True to serve new alert notifications to Server-Sent Events and
+# long-poll subscribers at /notifications. Subscribers keep a worker busy while
+# connected, so only enable it with threaded or asynchronous gunicorn workers
+# (see example/gunicorn.example.conf.py). A few clients can occupy all sync
+# workers.
+ALERT_NOTIFICATIONS_ENABLED = False
+
+# Journal file used to push new alert notifications to subscribers connected to
+# any worker process on this host. Set to None to only notify subscribers
+# connected to the publishing process.
+ALERT_NOTIFICATIONS_JOURNAL = os.path.join(BASE_DIR, "run",
+                                           "notifications.journal")
+
+# Maximum time (in seconds) a long-poll notifications request waits for new
+# alerts before returning an empty response.
+ALERT_NOTIFICATIONS_LONG_POLL_TIMEOUT = 25
+
+# Maximum time (in seconds) a Server-Sent Events connection is kept open.
+# Clients reconnect automatically and resume from the last received event.
+ALERT_NOTIFICATIONS_SSE_DURATION = 300
+
+# WebSub (PubSubHubbub) hub advertised in the alert feed and pinged whenever
+# an alert is published, e.g. "https://pubsubhubbub.appspot.com/".
+WEBSUB_HUB_URL = None
+
+# Subscribers receiving the alert feed directly whenever an alert is
+# published, as a list of (callback URL, secret) tuples. The content is signed
+# with the secret (X-Hub-Signature header) unless the secret is None.
+WEBSUB_SUBSCRIBERS = []
+
+# Number of WebSub notifier worker threads per process.
+WEBSUB_WORKERS = 2
+
+# Maximum number of pending WebSub notifications per process. Notifications
+# are dropped when the queue is full.
+WEBSUB_QUEUE_SIZE = 100
+
+# Maximum number of retries of a failed WebSub request.
+WEBSUB_MAX_RETRIES = 3
+
 
 ###### Django framework settings (only modify for advanced configuration) ######
 
@@ -59,6 +190,20 @@ TEMPLATE_DIRS = (
     os.path.join(BASE_DIR, "templates"),
 )
 
+# The settings for all caches to be used with Django.
+# See https://docs.djangoproject.com/en/dev/ref/settings/#caches
+# Materialized feeds (see FEED_CACHE_ALIAS) and alert creators membership are
+# invalidated through the cache, so it must be shared by all worker processes.
+# A process-local backend (e.g. LocMemCache) keeps serving stale feeds in the
+# workers that didn't publish the alert. The database cache works out of the
+# box (run "python manage.py createcachetable"), memcached is faster.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "capcollector_cache",
+    },
+}
+
 # A tuple of strings designating all applications that are enabled in this
 # Django installation.
 # See https://docs.djangoproject.com/en/dev/ref/settings/#std:setting-INSTALLED_APPS
@@ -1,5 +1,5 @@
-"""CAPCollector project production settings."""
 # -*- coding: utf-8 -*-
+"""CAPCollector project production settings."""
 from sensitive import *
 
 ###### Standard configuration.  You need to set these variables.  ######
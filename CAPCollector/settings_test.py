@@ -16,6 +16,22 @@ SITE_URL = SITE_SCHEME + "://" + SITE_DOMAIN + ":" + SITE_PORT
 
 ALLOWED_HOSTS = [SITE_DOMAIN]
 
+# Tests run in a single process.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+}
+
+# Sign alerts in the test process.
+SIGNING_PROCESSES = 0
+
+# Notify subscribers through the in-process publisher.
+ALERT_NOTIFICATIONS_JOURNAL = None
+
+# Keep geocode preview spatial index in memory.
+GEOCODE_PREVIEW_INDEX_FILE = None
+
 LANGUAGES = (
     ("en-us", "English"),
     ("hi", "Hindi"),
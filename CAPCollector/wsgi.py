@@ -21,3 +21,18 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "CAPCollector.settings")
 application = get_wsgi_application()
+
+# Compile alert schemas before serving the first request. With gunicorn
+# --preload this happens once in the master process.
+from core import schemas
+schemas.GetRegistry()
+
+# Load geocode preview polygons and their spatial index before serving the
+# first request. The database connection is closed so that forked workers
+# don't share it.
+from django.conf import settings
+if settings.GEOCODE_PREVIEW_WARM_UP:
+  from core import polygons
+  from django.db import connection
+  polygons.GetPolygonStore().warm_up()
+  connection.close()
@@ -0,0 +1,50 @@
+"""CAP dateTime parsing micro-benchmark.
+
+Compares utils.ParseCapDateTime with the generic dateutil parser on CAP
+dateTime values.
+
+Run
+$ python benchmarks/cap_date_time.py [iterations]
+"""
+
+import os
+import sys
+import timeit
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "CAPCollector.settings")
+
+import django
+django.setup()
+
+from core import utils
+from dateutil import parser
+
+
+VALUES = (
+    "2014-08-16T00:32:11+00:00",
+    "2014-08-16T06:02:11+05:30",
+    "2014-08-15T16:32:11-08:00",
+)
+
+
+def main():
+  iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+  results = {}
+  for parse_function in (parser.parse, utils.ParseCapDateTime):
+    for value in VALUES:
+      assert parse_function(value) == parser.parse(value), value
+    seconds = min(timeit.repeat(
+        lambda: [parse_function(value) for value in VALUES],
+        number=iterations, repeat=3))
+    results[parse_function] = seconds / iterations / len(VALUES)
+    print "%-16s %6.2f us per value" % (
+        parse_function.__name__, results[parse_function] * 1e6)
+  print "Speedup: %.1fx" % (
+      results[parser.parse] / results[utils.ParseCapDateTime])
+
+
+if __name__ == "__main__":
+  main()
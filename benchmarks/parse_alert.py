@@ -0,0 +1,160 @@
+"""ParseAlert benchmark.
+
+Compares the single pass CAP parser (utils.ParseAlert) with the previous
+per-field XPath implementation on the alerts and templates from
+tests/fixtures and checks that both produce the same dictionaries.
+
+Run
+$ python benchmarks/parse_alert.py [iterations]
+"""
+
+import json
+import logging
+import os
+import sys
+import timeit
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "CAPCollector.settings")
+
+import django
+django.setup()
+
+import lxml
+
+from core import utils
+from dateutil import parser
+from django.conf import settings
+from django.core.urlresolvers import reverse
+from django.utils.translation import ugettext
+
+
+FIXTURES = ("test_alerts.json", "test_templates.json")
+
+
+def XPathParseAlert(xml_string, feed_type, alert_uuid):
+  """Previous per-field XPath ParseAlert implementation."""
+
+  def GetFirstText(xml_element):
+    """Returns the first text item from an XML element."""
+    if xml_element and len(xml_element):
+      return xml_element[0].text
+    return ""
+
+  def GetAllText(xml_element):
+    """Returns an array of text items from multiple elements."""
+    if xml_element and len(xml_element):
+      return [item.text for item in xml_element]
+    return []
+
+  def GetNameValuePairs(xml_elements):
+    """Returns a list of dictionaries for paired elements."""
+    pair_list = []
+    for xml_element in xml_elements:
+      name_element, value_element = xml_element.getchildren()
+      pair_list.append({
+          "name": name_element.text,
+          "value": value_element.text})
+    return pair_list
+
+  def GetCapElement(element_name, xml_tree):
+    """Extracts elements from CAP XML tree."""
+    element = "//p:" + element_name
+    finder = lxml.etree.XPath(element, namespaces={"p": settings.CAP_NS})
+    return finder(xml_tree)
+
+  alert_dict = {}
+  try:
+    xml_tree = lxml.etree.fromstring(xml_string)
+    expires_str = GetFirstText(GetCapElement("expires", xml_tree))
+
+    # Extract the other needed values from the CAP XML.
+    sender = GetFirstText(GetCapElement("sender", xml_tree))
+    sender_name = GetFirstText(GetCapElement("senderName", xml_tree))
+    name = sender
+    if sender_name:
+      name = name + ": " + sender_name
+
+    title = GetFirstText(GetCapElement("headline", xml_tree))
+    if not title:
+      title = ugettext("Alert Message")  # Force a default.
+
+    link = "%s%s" % (settings.SITE_URL,
+                     reverse("alert", args=[alert_uuid, feed_type]))
+    expires = parser.parse(expires_str) if expires_str else None
+    sent_str = GetFirstText(GetCapElement("sent", xml_tree))
+    sent = parser.parse(sent_str) if sent_str else None
+
+    alert_dict = {
+        "title": title,
+        "event": GetFirstText(GetCapElement("event", xml_tree)),
+        "link": link,
+        "web": GetFirstText(GetCapElement("web", xml_tree)),
+        "name": name,
+        "sender": sender,
+        "sender_name": sender_name,
+        "expires": expires,
+        "msg_type": GetFirstText(GetCapElement("msgType", xml_tree)),
+        "references": GetFirstText(GetCapElement("references", xml_tree)),
+        "alert_id": GetFirstText(GetCapElement("identifier", xml_tree)),
+        "category": GetFirstText(GetCapElement("category", xml_tree)),
+        "response_type": GetFirstText(GetCapElement("responseType", xml_tree)),
+        "sent": sent,
+        "description": GetFirstText(GetCapElement("description", xml_tree)),
+        "instruction": GetFirstText(GetCapElement("instruction", xml_tree)),
+        "urgency": GetFirstText(GetCapElement("urgency", xml_tree)),
+        "severity": GetFirstText(GetCapElement("severity", xml_tree)),
+        "certainty": GetFirstText(GetCapElement("certainty", xml_tree)),
+        "language": GetFirstText(GetCapElement("language", xml_tree)),
+        "parameters": GetNameValuePairs(GetCapElement("parameter", xml_tree)),
+        "event_codes": GetNameValuePairs(GetCapElement("eventCode", xml_tree)),
+        "area_desc": GetFirstText(GetCapElement("areaDesc", xml_tree)),
+        "geocodes": GetNameValuePairs(GetCapElement("geocode", xml_tree)),
+        "circles": GetAllText(GetCapElement("circle", xml_tree)),
+        "polys": GetAllText(GetCapElement("polygon", xml_tree)),
+    }
+    # Non-CAP-compliant fields used for message templates.
+    expiresDurationMinutes = GetFirstText(
+        GetCapElement("expiresDurationMinutes", xml_tree))
+    if expiresDurationMinutes:
+      alert_dict["expiresDurationMinutes"] = expiresDurationMinutes
+  # We don't expect any invalid XML alerts.
+  except lxml.etree.XMLSyntaxError as e:
+    logging.exception(e)
+  return alert_dict
+
+
+def LoadFixtureContents():
+  """Returns CAP XML contents of all fixture objects."""
+  contents = []
+  for fixture in FIXTURES:
+    with open(os.path.join(BASE_DIR, "tests", "fixtures", fixture)) as f:
+      contents.extend(obj["fields"]["content"].encode("utf-8")
+                      for obj in json.load(f) if "content" in obj["fields"])
+  return contents
+
+
+def main():
+  iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+  contents = LoadFixtureContents()
+
+  for content in contents:
+    new_dict = utils.ParseAlert(content, "xml", "uuid")
+    new_dict.pop("infos", None)
+    assert new_dict == XPathParseAlert(content, "xml", "uuid"), content
+
+  results = {}
+  for parse_function in (XPathParseAlert, utils.ParseAlert):
+    seconds = min(timeit.repeat(
+        lambda: [parse_function(content, "xml", "uuid")
+                 for content in contents], number=iterations, repeat=3))
+    results[parse_function] = seconds / iterations / len(contents)
+    print "%-16s %8.1f us per alert" % (
+        parse_function.__name__, results[parse_function] * 1e6)
+  print "Speedup: %.1fx" % (
+      results[XPathParseAlert] / results[utils.ParseAlert])
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,71 @@
+"""ParsedAlert memory benchmark.
+
+Compares memory used by 10k parsed alerts stored as ParseAlert dictionaries
+and as compact ParsedAlert records. Alerts are parsed from the valid alert in
+tests/fixtures/test_alerts.json.
+
+Run
+$ python benchmarks/parsed_alert_memory.py [alerts]
+"""
+
+import json
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "CAPCollector.settings")
+
+import django
+django.setup()
+
+from core import utils
+
+
+def GetContainersSize(value, seen=None):
+  """Returns memory size of containers and objects reachable from value.
+
+  Strings and other scalars are shared between both representations, so
+  they are not counted.
+  """
+  seen = seen if seen is not None else set()
+  if id(value) in seen:
+    return 0
+  seen.add(id(value))
+  if isinstance(value, dict):
+    return sys.getsizeof(value) + sum(
+        GetContainersSize(item, seen) for item in value.itervalues())
+  if isinstance(value, (list, tuple)):
+    return sys.getsizeof(value) + sum(
+        GetContainersSize(item, seen) for item in value)
+  if hasattr(value, "__slots__"):
+    return sys.getsizeof(value) + sum(
+        GetContainersSize(getattr(value, name), seen)
+        for name in value.__slots__ if hasattr(value, name))
+  return 0
+
+
+def main():
+  count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+  with open(os.path.join(BASE_DIR, "tests", "fixtures",
+                         "test_alerts.json")) as f:
+    alert = json.load(f)[-1]["fields"]
+  content = alert["content"].encode("utf-8")
+
+  alert_dicts = [utils.ParseAlert(content, "xml", str(i))
+                 for i in range(count)]
+  parsed_alerts = [utils.ParsedAlert.FromDict(alert_dict)
+                   for alert_dict in alert_dicts]
+
+  dicts_size = GetContainersSize(alert_dicts)
+  records_size = GetContainersSize(parsed_alerts)
+  print "%d alerts" % count
+  print "ParseAlert dicts:   %8.1f KiB (%d bytes per alert)" % (
+      dicts_size / 1024.0, dicts_size / count)
+  print "ParsedAlert records: %7.1f KiB (%d bytes per alert)" % (
+      records_size / 1024.0, records_size / count)
+  print "Saved: %.0f%%" % (100.0 * (dicts_size - records_size) / dicts_size)
+
+
+if __name__ == "__main__":
+  main()
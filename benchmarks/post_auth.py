@@ -0,0 +1,75 @@
+"""Alert post authentication benchmark.
+
+Compares requests per second of alert posts authenticated with the session
+login and uid/password re-authentication against posts authenticated with an
+API token. Posted XML is malformed so that the alert is rejected right after
+authentication and the requests measure authentication cost.
+
+Runs against a temporary test database.
+
+Run
+$ python benchmarks/post_auth.py [requests]
+"""
+
+import os
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "CAPCollector.settings")
+
+import django
+django.setup()
+
+from CAPCollector import auth
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment
+
+
+USERNAME = "publisher"
+PASSWORD = "Publisher1234"
+
+
+def Measure(name, client, requests, data, **headers):
+  """Prints requests per second of alert posts."""
+  response = client.post("/post/", data, **headers)
+  assert response.status_code == 200, response.status_code
+  start = time.time()
+  for _ in range(requests):
+    client.post("/post/", data, **headers)
+  per_second = requests / (time.time() - start)
+  print "%-10s %8.1f requests/s" % (name, per_second)
+  return per_second
+
+
+def main():
+  requests = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+  setup_test_environment()
+  old_name = connection.creation.create_test_db(verbosity=0)
+  try:
+    user = User.objects.create_user(USERNAME, password=PASSWORD)
+    group, _ = Group.objects.get_or_create(
+        name=settings.ALERT_CREATORS_GROUP_NAME)
+    user.groups.add(group)
+
+    password_client = Client()
+    password_client.login(username=USERNAME, password=PASSWORD)
+    password = Measure("password", password_client, requests, {
+        "uid": USERNAME, "password": PASSWORD, "xml": "<some_xml>"})
+
+    token = auth.create_api_token(user, "benchmark")
+    token_per_second = Measure("token", Client(), requests,
+                               {"xml": "<some_xml>"},
+                               HTTP_AUTHORIZATION="Token " + token)
+    print "Speedup: %.1fx" % (token_per_second / password)
+  finally:
+    connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+  main()
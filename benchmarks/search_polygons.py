@@ -0,0 +1,69 @@
+"""Geocode preview polygon spatial search benchmark.
+
+Compares map viewport queries answered by the spatial index (see
+polygons.GridIndex) against a linear scan of all bounding boxes. Indexed
+boxes are district-sized (0.3 to 1 degree) and randomly spread over a
+country-sized area, viewports are 2 degrees wide.
+
+Run
+$ python benchmarks/search_polygons.py [polygons]
+"""
+
+import os
+import random
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "CAPCollector.settings")
+
+import django
+django.setup()
+
+from core import polygons
+from django.conf import settings
+
+
+QUERIES = 1000
+AREA = (8.0, 68.0, 36.0, 97.0)
+
+
+def GetRandomBox(size):
+  """Returns random box of size degrees within AREA."""
+  lat = random.uniform(AREA[0], AREA[2] - size)
+  lng = random.uniform(AREA[1], AREA[3] - size)
+  return (lat, lng, lat + size, lng + size)
+
+
+def Measure(name, search, queries):
+  """Prints queries per second of a search function."""
+  start = time.time()
+  results = [search(box) for box in queries]
+  per_second = len(queries) / (time.time() - start)
+  print "%-8s %10.1f queries/s" % (name, per_second)
+  return per_second, results
+
+
+def main():
+  count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+  random.seed(0)
+  index = polygons.GridIndex(settings.GEOCODE_PREVIEW_INDEX_CELL_SIZE)
+  for number in range(count):
+    index.insert("district|%d" % number,
+                 GetRandomBox(random.uniform(0.3, 1.0)))
+  queries = [GetRandomBox(2.0) for _ in range(QUERIES)]
+
+  boxes = index.boxes.items()
+  scan_per_second, scan_results = Measure(
+      "scan", lambda box: sorted(key for key, other in boxes
+                                 if polygons.BoxesIntersect(other, box)),
+      queries)
+  index_per_second, index_results = Measure("index", index.search, queries)
+  assert scan_results == index_results
+  print "Polygons: %d, speedup: %.1fx" % (count,
+                                          index_per_second / scan_per_second)
+
+
+if __name__ == "__main__":
+  main()
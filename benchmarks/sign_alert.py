@@ -0,0 +1,98 @@
+"""Alert signing benchmark.
+
+Measures alert signing throughput with the testdata/credentials key pair:
+  - loading the credentials for every signature (previous behavior),
+  - with cached credentials (signing.LoadKey),
+  - in the signing process pool, one request at a time (pool-seq) and with
+    concurrent requests to one process per core (pool).
+
+Run
+$ python benchmarks/sign_alert.py [alerts]
+"""
+
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "CAPCollector.settings")
+
+import django
+django.setup()
+
+import lxml
+
+from core import signing
+from django.conf import settings
+
+
+USERNAME = "test_user"
+
+
+def LoadAlertContent():
+  """Returns CAP XML content of the first fixture alert."""
+  with open(os.path.join(BASE_DIR, "tests", "fixtures",
+                         "test_alerts.json")) as f:
+    return json.load(f)[0]["fields"]["content"].encode("utf-8")
+
+
+def SignUncached(xml_string):
+  signing._keys.clear()  # pylint: disable=protected-access
+  return signing.SignString(xml_string, USERNAME)
+
+
+def SignCached(xml_string):
+  return signing.SignString(xml_string, USERNAME)
+
+
+def SignPooled(xml_string):
+  return signing.SignInPool(lxml.etree.fromstring(xml_string), USERNAME)
+
+
+def Measure(name, sign_function, content, alerts):
+  """Prints signing throughput of sign_function called sequentially."""
+  assert sign_function(content) is not None
+  start = time.time()
+  for _ in range(alerts):
+    sign_function(content)
+  per_second = alerts / (time.time() - start)
+  print "%-10s %8.1f alerts/s %8.1f alerts/s per core" % (
+      name, per_second, per_second)
+  return per_second
+
+
+def MeasurePool(content, alerts, processes):
+  """Prints signing throughput of the pool fed by concurrent requests."""
+  pool = signing.GetPool()
+  xml_string = lxml.etree.tostring(lxml.etree.fromstring(content))
+  pool.apply(signing.SignString, (xml_string, USERNAME))
+  start = time.time()
+  results = [pool.apply_async(signing.SignString, (xml_string, USERNAME))
+             for _ in range(alerts)]
+  for result in results:
+    assert result.get() is not None
+  per_second = alerts / (time.time() - start)
+  print "%-10s %8.1f alerts/s %8.1f alerts/s per core" % (
+      "pool", per_second, per_second / processes)
+  pool.terminate()
+
+
+def main():
+  alerts = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+  processes = multiprocessing.cpu_count()
+  settings.CREDENTIALS_DIR = os.path.join(BASE_DIR, "testdata", "credentials")
+  settings.SIGNING_PROCESSES = processes
+  content = LoadAlertContent()
+
+  uncached = Measure("uncached", SignUncached, content, alerts)
+  cached = Measure("cached", SignCached, content, alerts)
+  print "Speedup: %.1fx" % (cached / uncached)
+  Measure("pool-seq", SignPooled, content, alerts)
+  MeasurePool(content, alerts, processes)
+
+
+if __name__ == "__main__":
+  main()
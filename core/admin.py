@@ -32,9 +32,23 @@ class ValidatingUserAdmin(UserAdmin):
   change_password_form = ValidatingAdminPasswordChangeForm
 
 
+class ApiTokenAdmin(admin.ModelAdmin):
+
+  list_display = ("user", "name", "created_at", "revoked")
+  list_filter = ("revoked",)
+
+  def has_add_permission(self, request):
+    # Tokens are created by the create_api_token command which shows the
+    # token once.
+    return False
+
+
 admin.site.unregister(User)
 admin.site.register(User, ValidatingUserAdmin)
 admin.site.register(models.Alert)
+admin.site.register(models.ApiToken, ApiTokenAdmin)
+admin.site.register(models.AlertReference)
 admin.site.register(models.AreaTemplate)
 admin.site.register(models.GeocodePreviewPolygon)
+admin.site.register(models.IngestJob)
 admin.site.register(models.MessageTemplate)
@@ -0,0 +1,214 @@
+"""Asynchronous alert ingestion queue.
+
+With ALERT_INGEST_ASYNC set, posted alerts are stored as IngestJob rows and
+created (validated, signed and saved, see utils.CreateAlert) by worker
+threads. Each serving process starts its own threads, when the gunicorn
+worker is initialized (see example/gunicorn.example.conf.py) or on its first
+queued alert, since threads do not survive fork(). The job table is durable:
+jobs queued before a restart are picked up by the workers of any process.
+A job's alert is created with the job ID as its ID, so that a job claimed
+again after its worker died does not create a second alert.
+
+Alerts of one sender must be created in the order they were posted (an
+update must land after the alert it references). Each worker thread handles
+the senders of its partition (sender hash modulo ALERT_INGEST_WORKERS) and
+only the oldest unfinished job of a sender is claimed, which also holds across
+processes.
+"""
+
+from datetime import timedelta
+import logging
+import os
+import threading
+import uuid
+import zlib
+
+from core import models
+from core import utils
+from django.conf import settings
+from django.db import connection
+from django.db.models import Min
+from django.utils import timezone
+
+
+_ingester = None
+_ingester_lock = threading.Lock()
+
+
+def GetIngester():
+  """Returns process-wide ingester configured by settings."""
+  global _ingester
+  with _ingester_lock:
+    if _ingester is None:
+      _ingester = Ingester(settings.ALERT_INGEST_WORKERS,
+                           poll_interval=settings.ALERT_INGEST_POLL_INTERVAL,
+                           job_timeout=settings.ALERT_INGEST_JOB_TIMEOUT,
+                           retention=settings.ALERT_INGEST_JOB_RETENTION)
+    return _ingester
+
+
+def QueueAlert(xml_string, username):
+  """Queues alert creation.
+
+  Args:
+    xml_string: (string) XML content.
+    username: (string) Username of the alert author.
+
+  Returns:
+    models.IngestJob object.
+  """
+  job = models.IngestJob.objects.create(job_id=str(uuid.uuid4()),
+                                        username=username, content=xml_string)
+  ingester = GetIngester()
+  ingester.start()
+  ingester.notify()
+  return job
+
+
+def GetPartition(username, partitions):
+  """Returns worker partition of the alert author (sender).
+
+  Args:
+    username: (string) Username of the alert author.
+    partitions: (int) Number of partitions.
+
+  Returns:
+    Integer.
+  """
+  return (zlib.crc32(username.encode("utf-8")) & 0xffffffff) % partitions
+
+
+class Ingester(object):
+  """Creates queued alerts in worker threads."""
+
+  def __init__(self, workers=2, poll_interval=1.0, job_timeout=300,
+               retention=86400):
+    """Initializes ingester.
+
+    Args:
+      workers: (int) Number of worker threads (sender partitions).
+      poll_interval: (float) Time in seconds between checks for jobs queued
+          by other processes.
+      job_timeout: (float) Time in seconds after which a running job is
+          considered abandoned (e.g. its process died) and claimed again.
+      retention: (float) Time in seconds finished jobs are kept for status
+          requests.
+    """
+    self.workers = workers
+    self.poll_interval = poll_interval
+    self.job_timeout = job_timeout
+    self.retention = retention
+    self.events = [threading.Event() for _ in range(workers)]
+    self.threads = []
+    self.threads_lock = threading.Lock()
+    self.pid = None
+
+  def start(self):
+    """Starts worker threads unless already started in this process."""
+    with self.threads_lock:
+      if self.pid != os.getpid():
+        # Threads of the parent process don't run in a forked child.
+        self.pid = os.getpid()
+        self.threads = []
+      while len(self.threads) < self.workers:
+        thread = threading.Thread(target=self.work, name="ingest",
+                                  args=(len(self.threads),))
+        thread.daemon = True
+        thread.start()
+        self.threads.append(thread)
+
+  def notify(self):
+    """Wakes worker threads up to look for new jobs."""
+    for event in self.events:
+      event.set()
+
+  def work(self, partition):
+    """Worker thread loop.
+
+    Args:
+      partition: (int) Sender partition handled by the thread.
+    """
+    while True:
+      self.events[partition].clear()
+      try:
+        while self.process_next(partition):
+          pass
+        if partition == 0:
+          self.delete_finished()
+      except Exception as e:  # pylint: disable=broad-except
+        logging.exception(e)
+      finally:
+        # Idle workers must not hold a database connection.
+        connection.close()
+      self.events[partition].wait(self.poll_interval)
+
+  def delete_finished(self):
+    """Deletes jobs finished before the retention period."""
+    models.IngestJob.objects.filter(
+        status=models.IngestJob.DONE,
+        finished_at__lt=timezone.now() - timedelta(seconds=self.retention)
+    ).delete()
+
+  def claim(self, partition):
+    """Claims the next job of the partition.
+
+    Args:
+      partition: (int) Sender partition.
+
+    Returns:
+      models.IngestJob object or None if there are no claimable jobs.
+    """
+    stale_started_at = timezone.now() - timedelta(seconds=self.job_timeout)
+    while True:
+      # Later jobs of a sender wait for its oldest unfinished job.
+      oldest_ids = models.IngestJob.objects.exclude(
+          status=models.IngestJob.DONE).values("username").annotate(
+              oldest_id=Min("id")).values_list("oldest_id", flat=True)
+      oldest = models.IngestJob.objects.filter(
+          id__in=list(oldest_ids)).order_by("id").values_list(
+              "id", "username", "status", "started_at")
+
+      for job_id, username, status, started_at in oldest:
+        if GetPartition(username, self.workers) != partition:
+          continue
+        if (status == models.IngestJob.RUNNING and
+            started_at > stale_started_at):
+          continue
+        claimed = models.IngestJob.objects.filter(
+            id=job_id, status=status, started_at=started_at).update(
+                status=models.IngestJob.RUNNING, started_at=timezone.now())
+        if claimed:
+          return models.IngestJob.objects.get(id=job_id)
+        # Claimed by another process, look again.
+        break
+      else:
+        return None
+
+  def process_next(self, partition):
+    """Claims and processes the next job of the partition.
+
+    Args:
+      partition: (int) Sender partition.
+
+    Returns:
+      Boolean. Whether a job was processed.
+    """
+    job = self.claim(partition)
+    if job is None:
+      return False
+
+    try:
+      if models.Alert.objects.filter(uuid=job.job_id).exists():
+        # Created before the job was claimed again.
+        job.alert_uuid, job.valid, job.error = job.job_id, True, None
+      else:
+        job.alert_uuid, job.valid, job.error = utils.CreateAlert(
+            job.content, job.username, msg_id=job.job_id)
+    except Exception as e:  # pylint: disable=broad-except
+      logging.exception(e)
+      job.valid, job.error = False, "Alert creation failed"
+    job.status = models.IngestJob.DONE
+    job.finished_at = timezone.now()
+    job.save(update_fields=["alert_uuid", "valid", "error", "status",
+                            "finished_at"])
+    return True
@@ -0,0 +1,112 @@
+"""Process-local bounded LRU cache."""
+
+import collections
+import sys
+import threading
+
+
+def GetSize(value):
+  """Returns approximate memory size of value in bytes.
+
+  Args:
+    value: Value built of dictionaries, lists, tuples, objects with
+        __slots__ and scalars.
+
+  Returns:
+    Integer.
+  """
+  size = sys.getsizeof(value)
+  if isinstance(value, dict):
+    size += sum(GetSize(key) + GetSize(item) for key, item in value.iteritems())
+  elif isinstance(value, (list, tuple)):
+    size += sum(GetSize(item) for item in value)
+  elif hasattr(value, "__slots__"):
+    size += sum(GetSize(getattr(value, name)) for name in value.__slots__
+                if hasattr(value, name))
+  return size
+
+
+class LRUCache(object):
+  """Thread-safe least recently used cache bounded by entries and memory.
+
+  Counts hits, misses and evictions (see stats).
+  """
+
+  def __init__(self, max_entries, max_bytes=None):
+    """Initializes cache.
+
+    Args:
+      max_entries: (int) Maximum number of cached entries.
+      max_bytes: (int) Maximum approximate memory size of cached values, see
+          GetSize. No limit if not set.
+    """
+    self.max_entries = max_entries
+    self.max_bytes = max_bytes
+    self.lock = threading.Lock()
+    self.clear()
+
+  def clear(self):
+    """Removes all entries and resets counters."""
+    with self.lock:
+      self.entries = collections.OrderedDict()
+      self.bytes = 0
+      self.hits = 0
+      self.misses = 0
+      self.evictions = 0
+
+  def get(self, key, default=None):
+    """Returns cached value and marks it as recently used.
+
+    Args:
+      key: Hashable cache key.
+      default: Value to return if key is not cached.
+
+    Returns:
+      Cached value or default.
+    """
+    with self.lock:
+      try:
+        value, size = self.entries.pop(key)
+      except KeyError:
+        self.misses += 1
+        return default
+      self.entries[key] = (value, size)
+      self.hits += 1
+      return value
+
+  def set(self, key, value):
+    """Caches value evicting least recently used values to fit the limits.
+
+    Args:
+      key: Hashable cache key.
+      value: Value to cache.
+    """
+    size = GetSize(value)
+    if self.max_bytes is not None and size > self.max_bytes:
+      return
+
+    with self.lock:
+      if key in self.entries:
+        self.bytes -= self.entries.pop(key)[1]
+      self.entries[key] = (value, size)
+      self.bytes += size
+      while (len(self.entries) > self.max_entries or
+             (self.max_bytes is not None and self.bytes > self.max_bytes)):
+        _, (_, evicted_size) = self.entries.popitem(last=False)
+        self.bytes -= evicted_size
+        self.evictions += 1
+
+  def stats(self):
+    """Returns cache statistics.
+
+    Returns:
+      Dictionary with entries, bytes, hits, misses and evictions counters.
+    """
+    with self.lock:
+      return {
+          "entries": len(self.entries),
+          "bytes": self.bytes,
+          "hits": self.hits,
+          "misses": self.misses,
+          "evictions": self.evictions,
+      }
@@ -0,0 +1,59 @@
+"""Alert CAP fields backfill command for CAPCollector project.
+
+Extracts denormalized CAP fields (headline, event, urgency, etc.) from stored
+alert XML content into the corresponding Alert table columns, and feed filter
+values of all <info> blocks into the AlertFilterValue table. New alerts get
+these fields populated at creation time, so the command only needs to be run
+once after applying the migration that added the columns or the table (or
+after changing the set of extracted fields).
+
+Run
+$ python manage.py backfill_alert_fields
+
+For more information on this file, see
+https://docs.djangoproject.com/en/dev/howto/custom-management-commands/
+"""
+
+import lxml
+from lxml import etree
+
+from core import models
+from core import utils
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+
+BATCH_SIZE = 100
+
+
+class Command(BaseCommand):
+  """Alert CAP fields backfill command implementation."""
+
+  help = "Extracts CAP fields from existing alerts into Alert table columns."
+
+  def handle(self, *args, **options):
+    done = 0
+    failed = 0
+    alert_ids = list(models.Alert.objects.values_list("id", flat=True))
+    for start in range(0, len(alert_ids), BATCH_SIZE):
+      with transaction.atomic():
+        for alert in models.Alert.objects.filter(
+            id__in=alert_ids[start:start + BATCH_SIZE]):
+          try:
+            xml_tree = lxml.etree.fromstring(alert.content)
+          except lxml.etree.XMLSyntaxError:
+            print "Skipped malformed alert: %s" % alert.uuid
+            failed += 1
+            continue
+          fields = utils.GetAlertFields(xml_tree)
+          for field_name, value in fields.iteritems():
+            setattr(alert, field_name, value)
+          alert.save(update_fields=fields.keys())
+          models.AlertFilterValue.objects.filter(
+              alert_uuid=alert.uuid).delete()
+          models.AlertFilterValue.objects.bulk_create(
+              utils.GetAlertFilterValues(alert.uuid, xml_tree))
+          done += 1
+      print "Finished %d" % done
+
+    print "All done, updated %d, skipped %d" % (done, failed)
@@ -0,0 +1,58 @@
+"""Alert references backfill command for CAPCollector project.
+
+Builds the AlertReference table from <references> of stored alert XML
+content. New alerts get their references saved at creation time, so the
+command only needs to be run once after applying the migration that added
+the table. Running it again rebuilds the references of all alerts.
+
+Run
+$ python manage.py backfill_alert_references
+
+For more information on this file, see
+https://docs.djangoproject.com/en/dev/howto/custom-management-commands/
+"""
+
+import lxml
+from lxml import etree
+
+from core import models
+from core import utils
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+
+BATCH_SIZE = 100
+
+
+class Command(BaseCommand):
+  """Alert references backfill command implementation."""
+
+  help = "Builds alert references table from existing alerts."
+
+  def handle(self, *args, **options):
+    done = 0
+    failed = 0
+    references_count = 0
+    alert_ids = list(models.Alert.objects.values_list("id", flat=True))
+    for start in range(0, len(alert_ids), BATCH_SIZE):
+      with transaction.atomic():
+        alerts = models.Alert.objects.filter(
+            id__in=alert_ids[start:start + BATCH_SIZE]).only("uuid", "content")
+        references = []
+        for alert in alerts:
+          try:
+            xml_tree = lxml.etree.fromstring(alert.content)
+          except lxml.etree.XMLSyntaxError:
+            print "Skipped malformed alert: %s" % alert.uuid
+            failed += 1
+            continue
+          references.extend(utils.GetAlertReferences(alert.uuid, xml_tree))
+          done += 1
+        models.AlertReference.objects.filter(
+            alert_uuid__in=[alert.uuid for alert in alerts]).delete()
+        models.AlertReference.objects.bulk_create(references)
+        references_count += len(references)
+      print "Finished %d" % done
+
+    print "All done, processed %d, skipped %d, saved %d references" % (
+        done, failed, references_count)
@@ -0,0 +1,39 @@
+"""API token creation command for CAPCollector project.
+
+Creates an API token for scripted alert publishing. Requests with
+"Authorization: Token <token>" header are authenticated as the token owner
+without a session login or password. Only a digest of the token is stored, so
+the token is printed once. Tokens are revoked in the admin site.
+
+Run
+$ python manage.py create_api_token <username> --name <token name>
+
+For more information on this file, see
+https://docs.djangoproject.com/en/dev/howto/custom-management-commands/
+"""
+
+from CAPCollector import auth
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+
+class Command(BaseCommand):
+  """API token creation command implementation."""
+
+  help = "Creates an API token of a user."
+
+  def add_arguments(self, parser):
+    parser.add_argument("username")
+    parser.add_argument("--name", default="",
+                        help="Token name, e.g. the publishing script.")
+
+  def handle(self, *args, **options):
+    try:
+      user = User.objects.get(username=options["username"])
+    except User.DoesNotExist:
+      raise CommandError("User %s does not exist." % options["username"])
+
+    if not auth.is_alert_creator(user):
+      print "Warning: %s may not release alerts." % user.username
+    print auth.create_api_token(user, options["name"])
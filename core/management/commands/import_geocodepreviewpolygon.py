@@ -42,6 +42,15 @@ or a KML file with a "geocode_key" in ExtendedData:
 
 Multipolygon is supported, innerBoundaryIs (holes) are not.
 
+Polygons are also simplified at each of GEOCODE_PREVIEW_TOLERANCES (see
+polygons.GetSimplifiedLevels) and encoded as polylines (see
+polygons.GetEncodedLevels). The command reports vertex counts and sizes of
+all polygons per tolerance.
+
+Bounding boxes of polygons are stored and indexed, and the spatial index (see
+polygons.GridIndex) is written to GEOCODE_PREVIEW_INDEX_FILE for application
+processes to load.
+
 Run like
 $ python manage.py import_geocodepreviewpolygon /home/user/path/to/file.[json|kml]
 
@@ -51,9 +60,12 @@ https://docs.djangoproject.com/en/dev/howto/custom-management-commands/
 
 __author__ = "shakusa@google.com (Steve Hakusa)"
 
+import collections
 import json
 
 from core import models
+from core import polygons as preview_polygons
+from django.conf import settings
 from django.core.management.base import BaseCommand
 from django.core.management.base import CommandError
 import lxml
@@ -136,6 +148,8 @@ class Command(BaseCommand):
 
     done = 0
     preview_polygon_objs = []
+    # Tolerance to [vertex count, size, encoded size] totals.
+    report = collections.defaultdict(lambda: [0, 0, 0])
     for feature in data.get_features():
       geocode_key = data.get_geocode_key(feature).replace(" ", "_")
       polygons = []
@@ -149,6 +163,19 @@ class Command(BaseCommand):
       obj.id = models.GeocodePreviewPolygon.make_key(GEOCODE_VALUE_NAME,
                                                      geocode_key)
       obj.content = "\n".join(polygons)
+      obj.simplified = preview_polygons.GetSimplifiedLevels(
+          obj.content, settings.GEOCODE_PREVIEW_TOLERANCES)
+      obj.encoded = preview_polygons.GetEncodedLevels(obj.content,
+                                                      obj.simplified)
+      box = preview_polygons.GetBoundingBox(obj.content)
+      if box:
+        obj.min_lat, obj.min_lng, obj.max_lat, obj.max_lng = box
+      encoded = dict(json.loads(obj.encoded))
+      for tolerance, content in [(0, obj.content)] + json.loads(
+          obj.simplified):
+        report[tolerance][0] += preview_polygons.GetVertexCount(content)
+        report[tolerance][1] += len(content)
+        report[tolerance][2] += len(json.dumps(encoded[tolerance]))
       preview_polygon_objs.append(obj)
       print obj.id
       done += 1
@@ -158,4 +185,16 @@ class Command(BaseCommand):
         preview_polygon_objs = []
 
     models.GeocodePreviewPolygon.objects.bulk_create(preview_polygon_objs)
+    # Makes application processes reload their preview polygons.
+    import_obj = models.GeocodePreviewImport.objects.create()
     print "All done, saved %d" % done
+    index = preview_polygons.BuildIndex(
+        settings.GEOCODE_PREVIEW_INDEX_CELL_SIZE, version=import_obj.id)
+    if settings.GEOCODE_PREVIEW_INDEX_FILE:
+      index.save(settings.GEOCODE_PREVIEW_INDEX_FILE)
+      print "Indexed %d polygons in %s" % (
+          len(index), settings.GEOCODE_PREVIEW_INDEX_FILE)
+    print "Tolerance  Vertices       Bytes     Encoded"
+    for tolerance, (vertices, size, encoded_size) in sorted(
+        report.iteritems()):
+      print "%9g %9d %11d %11d" % (tolerance, vertices, size, encoded_size)
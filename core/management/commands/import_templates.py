@@ -20,7 +20,6 @@ __author__ = "arcadiy@google.com (Arkadii Yakovets)"
 
 
 import os
-import uuid
 
 from core import models
 from core import utils
@@ -54,7 +53,8 @@ class Command(BaseCommand):
       file_path = os.path.join(templates_path, file_name)
       with open(file_path, "r") as template_file:
         template_content = template_file.read()
-      template_dict = utils.ParseAlert(template_content, "xml", uuid.uuid4())
+      template_dict = utils.GetParsedAlert(template_content, "xml",
+                                           file_name[:-len(".xml")])
       if templates_type == "area":
         template_model = models.AreaTemplate
       elif templates_type == "message":
@@ -0,0 +1,61 @@
+"""Static feeds publisher command for CAPCollector project.
+
+Writes alert feeds and alert pages from the database to STATIC_FEED_DIR for a
+web server to serve. Alerts published afterwards are written by the
+application, but feeds also change when alerts expire: with --watch the
+command keeps running and republishes the feeds at each alert expiration.
+
+Run
+$ python manage.py publish_static_feeds
+to rebuild all static files once or
+$ python manage.py publish_static_feeds --watch
+to keep feeds up to date with alert expirations.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/dev/howto/custom-management-commands/
+"""
+
+import time
+
+from core import models
+from core import utils
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import connection
+
+
+# Maximum time in seconds between feed refreshes in watch mode.
+WATCH_INTERVAL = 60
+
+
+class Command(BaseCommand):
+  """Static feeds publisher command implementation."""
+
+  help = "Writes alert feeds and pages to STATIC_FEED_DIR."
+
+  def add_arguments(self, parser):
+    parser.add_argument("--watch", action="store_true", default=False,
+                        help="Republish feeds whenever an alert expires.")
+
+  def handle(self, *args, **options):
+    if not settings.STATIC_FEED_DIR:
+      raise CommandError("STATIC_FEED_DIR is not set.")
+
+    done = 0
+    for alert in models.Alert.objects.all().iterator():
+      utils.PublishStaticAlert(alert)
+      done += 1
+    utils.PublishStaticFeeds()
+    print "Published %d alerts to %s" % (done, settings.STATIC_FEED_DIR)
+
+    while options["watch"]:
+      next_expiration = utils.GetNextExpiration()
+      delay = WATCH_INTERVAL
+      if next_expiration:
+        delay = min(delay, max(0, (
+            next_expiration - utils.GetCurrentDate()).total_seconds()) + 1)
+      # Do not hold a database connection while sleeping.
+      connection.close()
+      time.sleep(delay)
+      utils.PublishStaticFeeds()
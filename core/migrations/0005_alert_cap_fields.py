@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_geocodepreviewpolygon'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alert',
+            name='area_desc',
+            field=models.TextField(verbose_name='Area description', blank=True),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='category',
+            field=models.CharField(db_index=True, max_length=16, verbose_name='Category', blank=True),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='certainty',
+            field=models.CharField(db_index=True, max_length=16, verbose_name='Certainty', blank=True),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='circles',
+            field=models.TextField(verbose_name='Circles', blank=True),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='description',
+            field=models.TextField(verbose_name='Description', blank=True),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='event',
+            field=models.CharField(db_index=True, max_length=255, verbose_name='Event', blank=True),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='headline',
+            field=models.TextField(verbose_name='Headline', blank=True),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='instruction',
+            field=models.TextField(verbose_name='Instruction', blank=True),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='language',
+            field=models.CharField(db_index=True, max_length=35, verbose_name='Language', blank=True),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='msg_type',
+            field=models.CharField(db_index=True, max_length=16, verbose_name='Message type', blank=True),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='polygons',
+            field=models.TextField(verbose_name='Polygons', blank=True),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='response_type',
+            field=models.CharField(max_length=16, verbose_name='Response type', blank=True),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='sender',
+            field=models.CharField(max_length=255, verbose_name='Sender', blank=True),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='sender_name',
+            field=models.CharField(max_length=255, verbose_name='Sender name', blank=True),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='severity',
+            field=models.CharField(db_index=True, max_length=16, verbose_name='Severity', blank=True),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='urgency',
+            field=models.CharField(db_index=True, max_length=16, verbose_name='Urgency', blank=True),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_alert_cap_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alert',
+            name='last_modified_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, auto_now=True, verbose_name='Alert last modification time', db_index=True),
+            preserve_default=False,
+        ),
+    ]
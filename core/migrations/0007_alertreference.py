@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_alert_last_modified_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertReference',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('alert_uuid', models.CharField(max_length=36, verbose_name='Referencing alert UUID', db_index=True)),
+                ('referenced_uuid', models.CharField(max_length=255, verbose_name='Referenced alert identifier', db_index=True)),
+                ('sender', models.CharField(max_length=255, verbose_name='Referenced alert sender')),
+                ('sent', models.DateTimeField(null=True, verbose_name='Referenced alert sent time')),
+            ],
+            options={
+                'verbose_name': 'Alert Reference',
+                'verbose_name_plural': 'Alert References',
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_alertreference'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestJob',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('job_id', models.CharField(unique=True, max_length=36, verbose_name='Job ID')),
+                ('username', models.CharField(max_length=255, verbose_name='Alert author username', db_index=True)),
+                ('content', models.TextField(verbose_name='Alert content')),
+                ('status', models.CharField(default=b'pending', max_length=16, verbose_name='Status', db_index=True, choices=[(b'pending', 'Pending'), (b'running', 'Running'), (b'done', 'Done')])),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Job creation time')),
+                ('started_at', models.DateTimeField(null=True, verbose_name='Job start time')),
+                ('finished_at', models.DateTimeField(null=True, verbose_name='Job finish time', db_index=True)),
+                ('alert_uuid', models.CharField(max_length=36, null=True, verbose_name='Alert UUID')),
+                ('valid', models.NullBooleanField(verbose_name='Alert is valid')),
+                ('error', models.TextField(null=True, verbose_name='Error')),
+            ],
+            options={
+                'verbose_name': 'Ingest Job',
+                'verbose_name_plural': 'Ingest Jobs',
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0008_ingestjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApiToken',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('name', models.CharField(max_length=50, verbose_name='Token name')),
+                ('digest', models.CharField(verbose_name='Token digest', unique=True, max_length=64, editable=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Token creation time')),
+                ('revoked', models.BooleanField(default=False, verbose_name='Token revoked')),
+                ('user', models.ForeignKey(related_name='api_tokens', verbose_name='User', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'API Token',
+                'verbose_name_plural': 'API Tokens',
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_apitoken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodePreviewImport',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Import time')),
+            ],
+            options={
+                'verbose_name': 'Geocode Preview Import',
+                'verbose_name_plural': 'Geocode Preview Imports',
+            },
+        ),
+    ]
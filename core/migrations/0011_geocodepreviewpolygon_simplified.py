@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_geocodepreviewimport'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='geocodepreviewpolygon',
+            name='simplified',
+            field=models.TextField(verbose_name='Simplified polygons', blank=True),
+        ),
+    ]
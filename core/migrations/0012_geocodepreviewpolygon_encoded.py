@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_geocodepreviewpolygon_simplified'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='geocodepreviewpolygon',
+            name='encoded',
+            field=models.TextField(verbose_name='Encoded polygons', blank=True),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_geocodepreviewpolygon_encoded'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='geocodepreviewpolygon',
+            name='max_lat',
+            field=models.FloatField(null=True, verbose_name='Maximum latitude', blank=True),
+        ),
+        migrations.AddField(
+            model_name='geocodepreviewpolygon',
+            name='max_lng',
+            field=models.FloatField(null=True, verbose_name='Maximum longitude', blank=True),
+        ),
+        migrations.AddField(
+            model_name='geocodepreviewpolygon',
+            name='min_lat',
+            field=models.FloatField(null=True, verbose_name='Minimum latitude', blank=True),
+        ),
+        migrations.AddField(
+            model_name='geocodepreviewpolygon',
+            name='min_lng',
+            field=models.FloatField(null=True, verbose_name='Minimum longitude', blank=True),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_geocodepreviewpolygon_bounding_box'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertFilterValue',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('alert_uuid', models.CharField(max_length=36, verbose_name='Alert UUID', db_index=True)),
+                ('name', models.CharField(max_length=16, verbose_name='Filter name')),
+                ('value', models.CharField(max_length=255, verbose_name='Filter value')),
+            ],
+            options={
+                'verbose_name': 'Alert Filter Value',
+                'verbose_name_plural': 'Alert Filter Values',
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='alertfiltervalue',
+            index_together=set([('name', 'value')]),
+        ),
+    ]
@@ -3,6 +3,7 @@
 __author__ = "arcadiy@google.com (Arkadii Yakovets)"
 
 
+from django.contrib.auth.models import User
 from django.db import models
 from django.utils.translation import ugettext as _
 
@@ -15,11 +16,104 @@ class Alert(models.Model):
   content = models.TextField(_("Alert content"))
   updated = models.BooleanField(_("Alert replaced by an update or cancel"),
                                 default=False, db_index=True)
+  last_modified_at = models.DateTimeField(_("Alert last modification time"),
+                                          auto_now=True, db_index=True)
+
+  # CAP fields denormalized from the content at alert creation time.
+  # See utils.GetAlertFields.
+  sender = models.CharField(_("Sender"), max_length=255, blank=True)
+  sender_name = models.CharField(_("Sender name"), max_length=255, blank=True)
+  msg_type = models.CharField(_("Message type"), max_length=16, blank=True,
+                              db_index=True)
+  language = models.CharField(_("Language"), max_length=35, blank=True,
+                              db_index=True)
+  category = models.CharField(_("Category"), max_length=16, blank=True,
+                              db_index=True)
+  event = models.CharField(_("Event"), max_length=255, blank=True,
+                           db_index=True)
+  response_type = models.CharField(_("Response type"), max_length=16,
+                                   blank=True)
+  urgency = models.CharField(_("Urgency"), max_length=16, blank=True,
+                             db_index=True)
+  severity = models.CharField(_("Severity"), max_length=16, blank=True,
+                              db_index=True)
+  certainty = models.CharField(_("Certainty"), max_length=16, blank=True,
+                               db_index=True)
+  headline = models.TextField(_("Headline"), blank=True)
+  description = models.TextField(_("Description"), blank=True)
+  instruction = models.TextField(_("Instruction"), blank=True)
+  area_desc = models.TextField(_("Area description"), blank=True)
+  # Newline separated lists of CAP <polygon> and <circle> values.
+  polygons = models.TextField(_("Polygons"), blank=True)
+  circles = models.TextField(_("Circles"), blank=True)
 
   def __unicode__(self):
     return self.uuid
 
 
+class AlertReference(models.Model):
+  """Alert reference entity definition.
+
+  Links an update or cancel alert to an earlier alert listed in its
+  <references> (sender,identifier,sent triplets).
+  """
+  alert_uuid = models.CharField(_("Referencing alert UUID"), max_length=36,
+                                db_index=True)
+  referenced_uuid = models.CharField(_("Referenced alert identifier"),
+                                     max_length=255, db_index=True)
+  sender = models.CharField(_("Referenced alert sender"), max_length=255)
+  sent = models.DateTimeField(_("Referenced alert sent time"), null=True)
+
+  def __unicode__(self):
+    return "%s -> %s" % (self.alert_uuid, self.referenced_uuid)
+
+  class Meta:
+    verbose_name = _("Alert Reference")
+    verbose_name_plural = _("Alert References")
+
+
+class AlertFilterValue(models.Model):
+  """Alert feed filter value entity definition.
+
+  Alert columns only hold values of the first <info> block. Values of the
+  other <info> blocks (and other categories of the first one) are stored
+  here so that feed filters match them too. See utils.GetAlertFilterValues.
+  """
+  alert_uuid = models.CharField(_("Alert UUID"), max_length=36, db_index=True)
+  name = models.CharField(_("Filter name"), max_length=16)
+  value = models.CharField(_("Filter value"), max_length=255)
+
+  def __unicode__(self):
+    return "%s: %s=%s" % (self.alert_uuid, self.name, self.value)
+
+  class Meta:
+    index_together = (("name", "value"),)
+    verbose_name = _("Alert Filter Value")
+    verbose_name_plural = _("Alert Filter Values")
+
+
+class ApiToken(models.Model):
+  """API token entity definition.
+
+  Only a keyed digest of the token is stored, see auth.create_api_token.
+  """
+  user = models.ForeignKey(User, related_name="api_tokens",
+                           verbose_name=_("User"))
+  name = models.CharField(_("Token name"), max_length=50)
+  digest = models.CharField(_("Token digest"), max_length=64, unique=True,
+                            editable=False)
+  created_at = models.DateTimeField(_("Token creation time"),
+                                    auto_now_add=True)
+  revoked = models.BooleanField(_("Token revoked"), default=False)
+
+  def __unicode__(self):
+    return "%s: %s" % (self.user, self.name)
+
+  class Meta:
+    verbose_name = _("API Token")
+    verbose_name_plural = _("API Tokens")
+
+
 class AreaTemplate(models.Model):
   """Area template entity definition."""
   title = models.CharField(_("Template Title"), max_length=50)
@@ -44,10 +138,27 @@ class GeocodePreviewPolygon(models.Model):
   last_modified_at = models.DateTimeField(_("Last modification time"),
                                           auto_now=True)
   content = models.TextField(_("Polygons"))
+  # JSON list of [tolerance, polygons] pairs simplified at import time.
+  # See polygons.GetSimplifiedLevels.
+  simplified = models.TextField(_("Simplified polygons"), blank=True)
+  # JSON list of [tolerance, encoded polylines] pairs of the original (at
+  # tolerance 0) and simplified polygons. See polygons.GetEncodedLevels.
+  encoded = models.TextField(_("Encoded polygons"), blank=True)
+  # Bounding box computed at import time. See polygons.GridIndex.
+  min_lat = models.FloatField(_("Minimum latitude"), null=True, blank=True)
+  min_lng = models.FloatField(_("Minimum longitude"), null=True, blank=True)
+  max_lat = models.FloatField(_("Maximum latitude"), null=True, blank=True)
+  max_lng = models.FloatField(_("Maximum longitude"), null=True, blank=True)
 
   def __unicode__(self):
     return self.id
 
+  @property
+  def bounding_box(self):
+    if self.min_lat is None:
+      return None
+    return (self.min_lat, self.min_lng, self.max_lat, self.max_lng)
+
   @classmethod
   def make_key(cls, value_name, value):
     return '%s|%s' % (value_name, value)
@@ -57,6 +168,55 @@ class GeocodePreviewPolygon(models.Model):
     verbose_name_plural = _("Geocode Preview Polygon")
 
 
+class GeocodePreviewImport(models.Model):
+  """Geocode preview polygons import entity definition.
+
+  The latest import ID is the version of preview polygons, see
+  polygons.PolygonStore.
+  """
+  created_at = models.DateTimeField(_("Import time"), auto_now_add=True)
+
+  def __unicode__(self):
+    return unicode(self.created_at)
+
+  class Meta:
+    verbose_name = _("Geocode Preview Import")
+    verbose_name_plural = _("Geocode Preview Imports")
+
+
+class IngestJob(models.Model):
+  """Queued alert creation job entity definition. See ingest module."""
+  PENDING = "pending"
+  RUNNING = "running"
+  DONE = "done"
+  STATUS_CHOICES = (
+      (PENDING, _("Pending")),
+      (RUNNING, _("Running")),
+      (DONE, _("Done")),
+  )
+
+  job_id = models.CharField(_("Job ID"), max_length=36, unique=True)
+  username = models.CharField(_("Alert author username"), max_length=255,
+                              db_index=True)
+  content = models.TextField(_("Alert content"))
+  status = models.CharField(_("Status"), max_length=16, choices=STATUS_CHOICES,
+                            default=PENDING, db_index=True)
+  created_at = models.DateTimeField(_("Job creation time"), auto_now_add=True)
+  started_at = models.DateTimeField(_("Job start time"), null=True)
+  finished_at = models.DateTimeField(_("Job finish time"), null=True,
+                                     db_index=True)
+  alert_uuid = models.CharField(_("Alert UUID"), max_length=36, null=True)
+  valid = models.NullBooleanField(_("Alert is valid"))
+  error = models.TextField(_("Error"), null=True)
+
+  def __unicode__(self):
+    return self.job_id
+
+  class Meta:
+    verbose_name = _("Ingest Job")
+    verbose_name_plural = _("Ingest Jobs")
+
+
 class MessageTemplate(models.Model):
   """Message template entity definition."""
   title = models.CharField(_("Template Title"), max_length=50)
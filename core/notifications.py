@@ -0,0 +1,289 @@
+"""Push notifications about newly published alerts.
+
+Notifications are delivered to subscribers (Server-Sent Events and long-poll
+clients, see views.AlertNotificationsView) by a notifier. Two notifiers are
+available:
+  - LocalNotifier delivers notifications within a single process. It is used
+    when ALERT_NOTIFICATIONS_JOURNAL is not set (e.g. in tests).
+  - JournalNotifier shares notifications between all processes on a host
+    (e.g. gunicorn workers) through an append-only journal file.
+Neither of them touches the database while waiting for notifications.
+"""
+
+import collections
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.urlresolvers import reverse
+
+
+_notifier = None
+_notifier_lock = threading.Lock()
+
+
+def GetNotifier():
+  """Returns process-wide notifier configured by settings."""
+  global _notifier
+  with _notifier_lock:
+    if _notifier is None:
+      if settings.ALERT_NOTIFICATIONS_JOURNAL:
+        _notifier = JournalNotifier(settings.ALERT_NOTIFICATIONS_JOURNAL)
+      else:
+        _notifier = LocalNotifier()
+    return _notifier
+
+
+def PublishAlert(alert):
+  """Notifies subscribers about a newly published alert.
+
+  Args:
+    alert: (models.Alert) Published alert.
+  """
+  event = {
+      "uuid": alert.uuid,
+      "headline": alert.headline,
+      "severity": alert.severity,
+      "link": "%s%s" % (settings.SITE_URL,
+                        reverse("alert", args=[alert.uuid, "xml"])),
+  }
+  try:
+    GetNotifier().publish(event)
+  except (IOError, OSError) as e:
+    # Notifications are best effort, the alert is already published.
+    logging.exception(e)
+
+
+class LocalNotifier(object):
+  """Delivers notifications to subscribers within the current process."""
+
+  def __init__(self, max_events=1000):
+    self.condition = threading.Condition()
+    self.events = collections.deque(maxlen=max_events)
+    self.last_event_id = 0
+
+  def publish(self, event):
+    """Publishes event and wakes up all waiting subscribers.
+
+    Args:
+      event: (dict) JSON serializable event.
+
+    Returns:
+      Integer. Event ID.
+    """
+    with self.condition:
+      self.last_event_id += 1
+      self.events.append((self.last_event_id, event))
+      self.condition.notify_all()
+      return self.last_event_id
+
+  def subscribe(self, last_event_id=None):
+    """Returns a subscription to events published after last_event_id.
+
+    Args:
+      last_event_id: (int) Last event ID seen by the subscriber. If not set,
+          only events published from now on are delivered.
+
+    Returns:
+      LocalSubscription.
+    """
+    with self.condition:
+      if last_event_id is None or last_event_id > self.last_event_id:
+        last_event_id = self.last_event_id
+    return LocalSubscription(self, last_event_id)
+
+
+class LocalSubscription(object):
+  """LocalNotifier subscription."""
+
+  def __init__(self, notifier, last_event_id):
+    self.notifier = notifier
+    self.last_event_id = last_event_id
+
+  def wait(self, timeout):
+    """Waits for new events.
+
+    Args:
+      timeout: (float) Maximum time to wait in seconds.
+
+    Returns:
+      List of (event_id, event) tuples. Empty if timed out.
+    """
+    deadline = time.time() + timeout
+    condition = self.notifier.condition
+    with condition:
+      while self.notifier.last_event_id <= self.last_event_id:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+          return []
+        condition.wait(remaining)
+      events = [(event_id, event) for event_id, event in self.notifier.events
+                if event_id > self.last_event_id]
+    self.last_event_id = self.notifier.last_event_id
+    return events
+
+
+class JournalNotifier(object):
+  """Delivers notifications to subscribers in all processes on the host.
+
+  Each event is appended as an "<event_id> <json>" line to the journal file.
+  Subscribers poll the journal file for new lines. When the journal grows
+  over max_size it is rotated to a single ".1" backup.
+  """
+
+  def __init__(self, path, max_size=1024 * 1024, poll_interval=0.5):
+    self.path = path
+    self.backup_path = path + ".1"
+    self.lock_path = path + ".lock"
+    self.max_size = max_size
+    self.poll_interval = poll_interval
+
+  def publish(self, event):
+    """Appends event to the journal.
+
+    Args:
+      event: (dict) JSON serializable event.
+
+    Returns:
+      Integer. Event ID.
+    """
+    journal_dir = os.path.dirname(self.path)
+    if journal_dir and not os.path.isdir(journal_dir):
+      os.makedirs(journal_dir)
+
+    # The lock file serializes publishers and stores the last event ID.
+    lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0644)
+    with os.fdopen(lock_fd, "r+") as lock_file:
+      fcntl.flock(lock_file, fcntl.LOCK_EX)
+      try:
+        event_id = int(lock_file.read() or 0) + 1
+      except ValueError:
+        event_id = 1
+
+      if (os.path.exists(self.path) and
+          os.path.getsize(self.path) > self.max_size):
+        os.rename(self.path, self.backup_path)
+      with open(self.path, "a") as journal:
+        journal.write("%d %s\n" % (event_id, json.dumps(event)))
+
+      lock_file.seek(0)
+      lock_file.truncate()
+      lock_file.write(str(event_id))
+    return event_id
+
+  def subscribe(self, last_event_id=None):
+    """Returns a subscription to events published after last_event_id.
+
+    Args:
+      last_event_id: (int) Last event ID seen by the subscriber. If not set,
+          only events published from now on are delivered.
+
+    Returns:
+      JournalSubscription.
+    """
+    subscription = JournalSubscription(self)
+    if last_event_id is None:
+      subscription.skip_to_end()
+    else:
+      # Missed events are delivered by the first wait.
+      subscription.last_event_id = last_event_id
+      subscription.pending, _ = subscription.read(self.backup_path)
+      subscription.pending.extend(subscription.read_new_events())
+    return subscription
+
+
+class JournalSubscription(object):
+  """JournalNotifier subscription."""
+
+  def __init__(self, notifier):
+    self.notifier = notifier
+    self.last_event_id = 0
+    self.inode = None
+    self.offset = 0
+    # Events read but not delivered yet.
+    self.pending = []
+
+  def skip_to_end(self):
+    """Skips all events published so far."""
+    try:
+      stat = os.stat(self.notifier.path)
+    except OSError:
+      return
+    self.inode = stat.st_ino
+    with open(self.notifier.path, "r") as journal:
+      journal.seek(max(0, stat.st_size - 4096))
+      tail = journal.read(stat.st_size - journal.tell())
+    lines = [line for line in tail.split("\n")[:-1] if line]
+    if lines:
+      self.last_event_id = int(lines[-1].split(" ", 1)[0])
+    self.offset = stat.st_size
+
+  def read(self, path, offset=0):
+    """Reads complete journal lines starting at offset.
+
+    Args:
+      path: (string) Journal file path.
+      offset: (int) Offset to start reading at.
+
+    Returns:
+      A tuple of (events, offset) where:
+        events: List of (event_id, event) tuples newer than last_event_id.
+        offset: (int) Offset right after the last complete line read.
+    """
+    try:
+      with open(path, "r") as journal:
+        journal.seek(offset)
+        data = journal.read()
+    except IOError:
+      return [], offset
+
+    events = []
+    complete_data = data[:data.rfind("\n") + 1]
+    for line in complete_data.splitlines():
+      event_id, event = line.split(" ", 1)
+      event_id = int(event_id)
+      if event_id > self.last_event_id:
+        events.append((event_id, json.loads(event)))
+        self.last_event_id = event_id
+    return events, offset + len(complete_data)
+
+  def read_new_events(self):
+    """Reads events appended to the journal since the last read."""
+    try:
+      stat = os.stat(self.notifier.path)
+    except OSError:
+      return []
+
+    events = []
+    if stat.st_ino != self.inode:
+      if self.inode is not None:
+        # The journal was rotated, finish reading the previous one first.
+        events, _ = self.read(self.notifier.backup_path, self.offset)
+      self.inode = stat.st_ino
+      self.offset = 0
+    if stat.st_size > self.offset:
+      new_events, self.offset = self.read(self.notifier.path, self.offset)
+      events.extend(new_events)
+    return events
+
+  def wait(self, timeout):
+    """Waits for new events.
+
+    Args:
+      timeout: (float) Maximum time to wait in seconds.
+
+    Returns:
+      List of (event_id, event) tuples. Empty if timed out.
+    """
+    deadline = time.time() + timeout
+    events, self.pending = self.pending, []
+    while True:
+      events.extend(self.read_new_events())
+      remaining = deadline - time.time()
+      if events or remaining <= 0:
+        return events
+      time.sleep(min(self.notifier.poll_interval, remaining))
@@ -0,0 +1,792 @@
+"""Process-local store of geocode preview polygons.
+
+Preview polygons only change when import_geocodepreviewpolygon runs, so they
+are served from memory: polygons are loaded from the database on first use
+(or all at once by warm_up, see GEOCODE_PREVIEW_WARM_UP) and kept in a
+bounded LRU cache. Each import records a GeocodePreviewImport row, the latest
+of which is the polygons version. The version is checked at most every
+GEOCODE_PREVIEW_VERSION_CHECK_INTERVAL seconds and the store is cleared when
+it changes.
+
+Polygons are also simplified at import time with a tolerance per map zoom
+range (see GEOCODE_PREVIEW_TOLERANCES), so that previews don't ship vertices
+the map can't draw. Each ring is simplified separately with the
+Douglas-Peucker algorithm and always keeps at least three distinct vertices.
+Douglas-Peucker does not preserve topology, so a simplified ring that
+intersects itself is simplified again with smaller tolerances (see
+SimplifyPolygons). Intersections between different rings are not checked.
+
+Previews are also served as Google encoded polylines
+(https://developers.google.com/maps/documentation/utilities/polylinealgorithm),
+which are several times smaller than <polygon> text. They are only a preview
+format: alert areas are always posted as CAP <polygon> text. DecodePolygons
+is the inverse of EncodePolygons for tests and tools.
+
+Polygons intersecting a map viewport or containing a point are found with a
+GridIndex of their bounding boxes. The importer writes the index to
+GEOCODE_PREVIEW_INDEX_FILE and each process loads it once per polygons
+version (the index is built from the database if the file is missing or
+stale).
+"""
+
+import collections
+import json
+import logging
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+
+from core import lru
+from core import models
+from django.conf import settings
+
+
+POLYGON_RE = re.compile(r"<polygon>(.*?)</polygon>", re.DOTALL)
+# Encoded polyline coordinates precision (5 decimal places, about 1 meter).
+POLYLINE_PRECISION = 5
+# Smallest tolerance (in degrees) tried for rings that intersect themselves
+# once simplified, see SimplifyPolygons.
+SIMPLIFY_MIN_TOLERANCE = 1e-6
+# Highest web map zoom level, see GetZoomTolerance.
+MAX_ZOOM = 22
+# Media type of preview polygons served as encoded polylines.
+POLYLINE_CONTENT_TYPE = "application/vnd.capcollector.polyline+json"
+
+_MISSING = object()
+_store = None
+_store_lock = threading.Lock()
+
+
+def GetPolygonStore():
+  """Returns process-wide polygon store configured by settings."""
+  global _store
+  with _store_lock:
+    if _store is None:
+      _store = PolygonStore(
+          settings.GEOCODE_PREVIEW_CACHE_SIZE,
+          max_bytes=settings.GEOCODE_PREVIEW_CACHE_MAX_BYTES,
+          version_check_interval=(
+              settings.GEOCODE_PREVIEW_VERSION_CHECK_INTERVAL),
+          index_path=settings.GEOCODE_PREVIEW_INDEX_FILE,
+          index_cell_size=settings.GEOCODE_PREVIEW_INDEX_CELL_SIZE)
+    return _store
+
+
+def GetVersion():
+  """Returns current preview polygons version (latest import ID) or None."""
+  versions = models.GeocodePreviewImport.objects.order_by("-id").values_list(
+      "id", flat=True)[:1]
+  return versions[0] if versions else None
+
+
+def ParsePolygons(content):
+  """Parses CAP <polygon> elements.
+
+  Args:
+    content: (string) Newline separated <polygon> elements.
+
+  Returns:
+    List of rings, each a list of (lat, lng) string tuples.
+  """
+  return [[tuple(point.split(",")) for point in polygon.split()]
+          for polygon in POLYGON_RE.findall(content)]
+
+
+def FormatPolygons(rings):
+  """Formats rings as CAP <polygon> elements, see ParsePolygons."""
+  return "\n".join("<polygon>%s</polygon>" % " ".join(
+      "%s,%s" % point for point in ring) for ring in rings)
+
+
+def GetSegmentDistance(point, start, end):
+  """Returns distance from point to the segment of start and end points.
+
+  Args:
+    point: (tuple) Point (x, y) coordinates.
+    start: (tuple) Segment start (x, y) coordinates.
+    end: (tuple) Segment end (x, y) coordinates.
+
+  Returns:
+    Float.
+  """
+  dx = end[0] - start[0]
+  dy = end[1] - start[1]
+  if dx or dy:
+    t = ((point[0] - start[0]) * dx + (point[1] - start[1]) * dy) / float(
+        dx * dx + dy * dy)
+    t = min(1, max(0, t))
+    start = (start[0] + t * dx, start[1] + t * dy)
+  return math.hypot(point[0] - start[0], point[1] - start[1])
+
+
+def GetOrientation(a, b, c):
+  """Returns 1 if points turn counterclockwise, -1 if clockwise, 0 if not."""
+  cross = (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+  return (cross > 0) - (cross < 0)
+
+
+def IsOnSegment(point, start, end):
+  """Returns whether collinear point lies within the segment bounding box."""
+  return (min(start[0], end[0]) <= point[0] <= max(start[0], end[0]) and
+          min(start[1], end[1]) <= point[1] <= max(start[1], end[1]))
+
+
+def SegmentsIntersect(a, b, c, d):
+  """Returns whether segments a-b and c-d intersect or touch."""
+  abc = GetOrientation(a, b, c)
+  abd = GetOrientation(a, b, d)
+  cda = GetOrientation(c, d, a)
+  cdb = GetOrientation(c, d, b)
+  if abc * abd < 0 and cda * cdb < 0:
+    return True
+  return ((abc == 0 and IsOnSegment(c, a, b)) or
+          (abd == 0 and IsOnSegment(d, a, b)) or
+          (cda == 0 and IsOnSegment(a, c, d)) or
+          (cdb == 0 and IsOnSegment(b, c, d)))
+
+
+def IsSimpleRing(points):
+  """Checks whether closed ring does not intersect itself.
+
+  Args:
+    points: (list) Ring (x, y) coordinates, the last point repeats the first.
+
+  Returns:
+    True if no two non-adjacent ring edges intersect or touch.
+  """
+  # Repeated points make zero length edges.
+  points = [point for index, point in enumerate(points)
+            if not index or point != points[index - 1]]
+  edges = zip(points, points[1:])
+  count = len(edges)
+  # Edges sorted by their smallest x are only compared with the following
+  # edges overlapping them along x.
+  order = sorted(range(count), key=lambda index: min(edges[index][0][0],
+                                                     edges[index][1][0]))
+  for position, first in enumerate(order):
+    a, b = edges[first]
+    max_x = max(a[0], b[0])
+    for second in order[position + 1:]:
+      c, d = edges[second]
+      if min(c[0], d[0]) > max_x:
+        break
+      if abs(first - second) in (1, count - 1):
+        # Adjacent edges share a point.
+        continue
+      if SegmentsIntersect(a, b, c, d):
+        return False
+  return True
+
+
+def SimplifyRing(points, tolerance):
+  """Simplifies closed ring with the Douglas-Peucker algorithm.
+
+  Args:
+    points: (list) Ring (x, y) coordinates, the last point repeats the first.
+    tolerance: (float) Maximum distance of removed points from the
+        simplified ring.
+
+  Returns:
+    Sorted list of indexes of kept points. At least three distinct points
+    and the closing point are kept.
+  """
+  count = len(points)
+  if count <= 4:
+    return range(count)
+
+  # A closed ring is split at its first point and the point farthest from it.
+  farthest = max(range(1, count - 1),
+                 key=lambda index: GetSegmentDistance(points[index],
+                                                      points[0], points[0]))
+  kept = set([0, farthest, count - 1])
+  stack = [(0, farthest), (farthest, count - 1)]
+  while stack:
+    start, end = stack.pop()
+    distance, index = max((GetSegmentDistance(points[index], points[start],
+                                              points[end]), index)
+                          for index in range(start, end + 1))
+    if distance > tolerance:
+      kept.add(index)
+      stack.extend([(start, index), (index, end)])
+
+  if len(kept) < 4:
+    # Keep the ring a polygon rather than a line.
+    kept.add(max((GetSegmentDistance(points[index], points[0],
+                                     points[farthest]), index)
+                 for index in range(1, count - 1) if index != farthest)[1])
+  return sorted(kept)
+
+
+def SimplifyPolygons(content, tolerance):
+  """Simplifies CAP <polygon> elements.
+
+  Args:
+    content: (string) Newline separated <polygon> elements.
+    tolerance: (float) Tolerance in degrees, see SimplifyRing.
+
+  Returns:
+    String. Simplified <polygon> elements, original coordinate values of the
+    kept points are preserved. A ring intersecting itself once simplified is
+    simplified with halved tolerances down to SIMPLIFY_MIN_TOLERANCE and kept
+    whole below it.
+  """
+  rings = []
+  for ring in ParsePolygons(content):
+    points = [(float(lat), float(lng)) for lat, lng in ring]
+    ring_tolerance = tolerance
+    kept = SimplifyRing(points, ring_tolerance)
+    while not IsSimpleRing([points[index] for index in kept]):
+      ring_tolerance /= 2.0
+      if ring_tolerance < SIMPLIFY_MIN_TOLERANCE:
+        kept = range(len(points))
+        break
+      kept = SimplifyRing(points, ring_tolerance)
+    rings.append([ring[index] for index in kept])
+  return FormatPolygons(rings)
+
+
+def GetSimplifiedLevels(content, tolerances):
+  """Returns GeocodePreviewPolygon.simplified value.
+
+  Args:
+    content: (string) Newline separated <polygon> elements.
+    tolerances: (list) Tolerances in degrees.
+
+  Returns:
+    JSON encoded list of [tolerance, polygons] pairs.
+  """
+  return json.dumps([[tolerance, SimplifyPolygons(content, tolerance)]
+                     for tolerance in sorted(tolerances)])
+
+
+def EncodePolyline(points):
+  """Encodes points as a polyline.
+
+  Args:
+    points: (list) Points (lat, lng) coordinates.
+
+  Returns:
+    String. Encoded polyline.
+  """
+  chunks = []
+  previous = (0, 0)
+  for point in points:
+    current = tuple(int(round(value * 10 ** POLYLINE_PRECISION))
+                    for value in point)
+    for value, previous_value in zip(current, previous):
+      delta = value - previous_value
+      delta = ~(delta << 1) if delta < 0 else delta << 1
+      while delta >= 0x20:
+        chunks.append(chr((0x20 | (delta & 0x1f)) + 63))
+        delta >>= 5
+      chunks.append(chr(delta + 63))
+    previous = current
+  return "".join(chunks)
+
+
+def DecodePolyline(polyline):
+  """Decodes a polyline, see EncodePolyline.
+
+  Args:
+    polyline: (string) Encoded polyline.
+
+  Returns:
+    List of (lat, lng) float tuples.
+
+  Raises:
+    ValueError: If polyline is malformed.
+  """
+  values = []
+  value = 0
+  shift = 0
+  for char in polyline:
+    byte = ord(char) - 63
+    if not 0 <= byte < 0x40:
+      raise ValueError("Invalid polyline character: %r" % char)
+    value |= (byte & 0x1f) << shift
+    shift += 5
+    if byte < 0x20:
+      values.append(~(value >> 1) if value & 1 else value >> 1)
+      value = 0
+      shift = 0
+  if shift or len(values) % 2:
+    raise ValueError("Truncated polyline")
+
+  points = []
+  lat, lng = 0, 0
+  for index in range(0, len(values), 2):
+    lat += values[index]
+    lng += values[index + 1]
+    points.append((float(lat) / 10 ** POLYLINE_PRECISION,
+                   float(lng) / 10 ** POLYLINE_PRECISION))
+  return points
+
+
+def EncodePolygons(content):
+  """Encodes CAP <polygon> elements as a list of polylines, one per ring."""
+  return [EncodePolyline([(float(lat), float(lng)) for lat, lng in ring])
+          for ring in ParsePolygons(content)]
+
+
+def DecodePolygons(polylines):
+  """Decodes polylines as CAP <polygon> elements.
+
+  Args:
+    polylines: (list) Encoded polylines, one per ring.
+
+  Returns:
+    String. Newline separated <polygon> elements.
+
+  Raises:
+    ValueError: If a polyline is malformed.
+  """
+
+  def FormatCoordinate(value):
+    return ("%.*f" % (POLYLINE_PRECISION, value)).rstrip("0").rstrip(".")
+
+  return FormatPolygons([[(FormatCoordinate(lat), FormatCoordinate(lng))
+                          for lat, lng in DecodePolyline(polyline)]
+                         for polyline in polylines])
+
+
+def GetEncodedLevels(content, simplified):
+  """Returns GeocodePreviewPolygon.encoded value.
+
+  Args:
+    content: (string) Newline separated <polygon> elements.
+    simplified: (string) Simplified polygons, see GetSimplifiedLevels.
+
+  Returns:
+    JSON encoded list of [tolerance, polylines] pairs, starting with the
+    original polygons at tolerance 0.
+  """
+  levels = [[0, content]] + json.loads(simplified or "[]")
+  return json.dumps([[tolerance, EncodePolygons(polygons)]
+                     for tolerance, polygons in levels])
+
+
+def GetZoomTolerance(zoom):
+  """Returns tolerance in degrees matching a pixel at web map zoom level."""
+  return 360.0 / (256 * 2 ** zoom)
+
+
+def GetVertexCount(content):
+  """Returns number of vertices of CAP <polygon> elements."""
+  return sum(len(ring) for ring in ParsePolygons(content))
+
+
+def GetBoundingBox(content):
+  """Returns bounding box of CAP <polygon> elements.
+
+  Args:
+    content: (string) Newline separated <polygon> elements.
+
+  Returns:
+    Tuple of (min_lat, min_lng, max_lat, max_lng) floats or None if content
+    has no vertices.
+  """
+  points = [(float(lat), float(lng)) for ring in ParsePolygons(content)
+            for lat, lng in ring]
+  if not points:
+    return None
+  lats, lngs = zip(*points)
+  return (min(lats), min(lngs), max(lats), max(lngs))
+
+
+def ParseCoordinates(value, count):
+  """Parses comma separated latitude and longitude pairs.
+
+  Args:
+    value: (string) E.g. "lat,lng" or "min_lat,min_lng,max_lat,max_lng".
+    count: (int) Expected number of values.
+
+  Returns:
+    Tuple of floats.
+
+  Raises:
+    ValueError: If value has a wrong number of values or they are out of
+        latitude and longitude ranges.
+  """
+  coordinates = tuple(float(coordinate) for coordinate in value.split(","))
+  if len(coordinates) != count:
+    raise ValueError("Expected %d coordinates: %s" % (count, value))
+  for index, coordinate in enumerate(coordinates):
+    limit = 180 if index % 2 else 90
+    if not -limit <= coordinate <= limit:
+      raise ValueError("Coordinate out of range: %s" % value)
+  return coordinates
+
+
+def BoxesIntersect(box, other):
+  """Returns whether two (min_lat, min_lng, max_lat, max_lng) boxes overlap.
+
+  Boxes touching at an edge or a corner overlap.
+  """
+  return (box[0] <= other[2] and other[0] <= box[2] and
+          box[1] <= other[3] and other[1] <= box[3])
+
+
+def ContainsPoint(content, lat, lng):
+  """Returns whether CAP <polygon> elements contain a point.
+
+  Args:
+    content: (string) Newline separated <polygon> elements.
+    lat: (float) Point latitude.
+    lng: (float) Point longitude.
+
+  Returns:
+    True if any of the polygons contains the point (even-odd rule).
+  """
+  for ring in ParsePolygons(content):
+    points = [(float(point_lat), float(point_lng))
+              for point_lat, point_lng in ring]
+    inside = False
+    for (start_lat, start_lng), (end_lat, end_lng) in zip(
+        points, points[1:] + points[:1]):
+      # Counts ring edges crossed by a ray from the point towards the north.
+      if (start_lng > lng) != (end_lng > lng):
+        crossing_lat = start_lat + (lng - start_lng) * (
+            end_lat - start_lat) / (end_lng - start_lng)
+        if lat < crossing_lat:
+          inside = not inside
+    if inside:
+      return True
+  return False
+
+
+def BuildIndex(cell_size, version=None):
+  """Builds spatial index of all preview polygons.
+
+  Args:
+    cell_size: (float) Index cell size in degrees, see GridIndex.
+    version: (int) Preview polygons version, see GetVersion.
+
+  Returns:
+    GridIndex instance.
+  """
+  index = GridIndex(cell_size, version=version)
+  objects = models.GeocodePreviewPolygon.objects
+  for row in objects.filter(min_lat__isnull=False).values_list(
+      "id", "min_lat", "min_lng", "max_lat", "max_lng").iterator():
+    index.insert(row[0], row[1:])
+  # Polygons imported before bounding boxes were added.
+  for polygon_id, content in objects.filter(min_lat__isnull=True).values_list(
+      "id", "content").iterator():
+    box = GetBoundingBox(content)
+    if box:
+      index.insert(polygon_id, box)
+  return index
+
+
+class GridIndex(object):
+  """Uniform grid index of bounding boxes.
+
+  The map is split into square cells of cell_size degrees and each box is
+  listed in every cell it overlaps, so a query only checks boxes listed in
+  the cells it overlaps. Cell size should be about the size of an indexed
+  polygon.
+  """
+
+  def __init__(self, cell_size, version=None):
+    """Initializes index.
+
+    Args:
+      cell_size: (float) Cell size in degrees.
+      version: (int) Version of indexed polygons.
+    """
+    self.cell_size = float(cell_size)
+    self.version = version
+    self.boxes = {}
+    self.cells = collections.defaultdict(list)
+
+  def __len__(self):
+    return len(self.boxes)
+
+  def get_cell_ranges(self, box):
+    """Returns latitude and longitude cell index ranges overlapped by box."""
+    return tuple(xrange(int(math.floor(box[start] / self.cell_size)),
+                        int(math.floor(box[start + 2] / self.cell_size)) + 1)
+                 for start in (0, 1))
+
+  def insert(self, key, box):
+    """Adds a (min_lat, min_lng, max_lat, max_lng) bounding box."""
+    box = tuple(float(value) for value in box)
+    self.boxes[key] = box
+    lat_cells, lng_cells = self.get_cell_ranges(box)
+    for lat_cell in lat_cells:
+      for lng_cell in lng_cells:
+        self.cells[(lat_cell, lng_cell)].append(key)
+
+  def search(self, box):
+    """Returns sorted keys of bounding boxes intersecting box."""
+    lat_cells, lng_cells = self.get_cell_ranges(box)
+    if len(lat_cells) * len(lng_cells) > len(self.cells):
+      # Large boxes check the non-empty cells instead.
+      cells = [cell for cell in self.cells
+               if lat_cells[0] <= cell[0] <= lat_cells[-1] and
+               lng_cells[0] <= cell[1] <= lng_cells[-1]]
+    else:
+      cells = [(lat_cell, lng_cell) for lat_cell in lat_cells
+               for lng_cell in lng_cells]
+
+    keys = set()
+    for cell in cells:
+      keys.update(self.cells.get(cell, ()))
+    return sorted(key for key in keys if BoxesIntersect(self.boxes[key], box))
+
+  def save(self, path):
+    """Atomically writes index to a JSON file.
+
+    Args:
+      path: (string) Index file path.
+    """
+    content = json.dumps({
+        "version": self.version,
+        "cell_size": self.cell_size,
+        "boxes": self.boxes,
+        "cells": {"%d,%d" % cell: keys for cell, keys in
+                  self.cells.iteritems()},
+    })
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(directory):
+      os.makedirs(directory)
+    temp_fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+      with os.fdopen(temp_fd, "wb") as temp_file:
+        temp_file.write(content)
+      os.chmod(temp_path, 0644)
+      os.rename(temp_path, path)
+    except (IOError, OSError):
+      os.remove(temp_path)
+      raise
+
+  @classmethod
+  def load(cls, path):
+    """Reads index written by save.
+
+    Args:
+      path: (string) Index file path.
+
+    Returns:
+      GridIndex instance.
+
+    Raises:
+      IOError: If the file can't be read.
+      ValueError: If the file is malformed.
+    """
+    with open(path, "rb") as index_file:
+      data = json.load(index_file)
+    try:
+      index = cls(data["cell_size"], version=data["version"])
+      index.boxes = {key: tuple(box) for key, box in
+                     data["boxes"].iteritems()}
+      for cell, keys in data["cells"].iteritems():
+        lat_cell, lng_cell = cell.split(",")
+        index.cells[(int(lat_cell), int(lng_cell))] = keys
+    except (AttributeError, KeyError, TypeError) as e:
+      raise ValueError("Malformed index file %s: %s" % (path, e))
+    return index
+
+
+class PolygonStore(object):
+  """Preview polygons cache invalidated by polygon imports."""
+
+  def __init__(self, max_entries, max_bytes=None, version_check_interval=60,
+               index_path=None, index_cell_size=1.0):
+    """Initializes store.
+
+    Args:
+      max_entries: (int) Maximum number of cached preview polygons.
+      max_bytes: (int) Maximum approximate memory size of cached polygons.
+      version_check_interval: (float) Time in seconds between polygons
+          version checks.
+      index_path: (string) Spatial index file path. The index is only kept
+          in memory if None.
+      index_cell_size: (float) Cell size in degrees of indexes built by the
+          store, see GridIndex.
+    """
+    self.cache = lru.LRUCache(max_entries, max_bytes)
+    self.version_check_interval = version_check_interval
+    self.index_path = index_path
+    self.index_cell_size = index_cell_size
+    self.lock = threading.Lock()
+    self.index = None
+    self.version = None
+    self.version_checked_at = None
+
+  def clear(self):
+    """Removes all polygons and resets counters and version check."""
+    with self.lock:
+      self.cache.clear()
+      self.index = None
+      self.version_checked_at = None
+
+  def check_version(self):
+    """Clears cached polygons if they were imported again."""
+    now = time.time()
+    with self.lock:
+      if (self.version_checked_at is not None and
+          now - self.version_checked_at < self.version_check_interval):
+        return
+      self.version_checked_at = now
+    version = GetVersion()
+    with self.lock:
+      if version != self.version:
+        self.cache.clear()
+        self.version = version
+
+  def warm_up(self):
+    """Loads spatial index and all preview polygons (as many as fit)."""
+    self.get_index()
+    for polygon_id, content, simplified, encoded in (
+        models.GeocodePreviewPolygon.objects.values_list(
+            "id", "content", "simplified", "encoded").iterator()):
+      self.cache.set(polygon_id,
+                     self.get_levels(content, simplified, encoded))
+
+  def get_levels(self, content, simplified, encoded):
+    """Returns cached value of a preview polygon.
+
+    Args:
+      content: (string) Original polygons.
+      simplified: (string) Simplified polygons, see GetSimplifiedLevels.
+      encoded: (string) Encoded polygons, see GetEncodedLevels. Computed if
+          empty (polygons imported before encoding was added).
+
+    Returns:
+      Tuple of (tolerance, polygons, polylines) tuples in decreasing
+      tolerance order, ending with the original polygons at tolerance 0.
+    """
+    levels = [(0, content)] + [(tolerance, polygons) for tolerance, polygons
+                               in json.loads(simplified or "[]")]
+    polylines = dict(json.loads(
+        encoded or GetEncodedLevels(content, simplified)))
+    return tuple(sorted(
+        ((tolerance, polygons, tuple(polylines[tolerance]))
+         for tolerance, polygons in levels), reverse=True))
+
+  def get_many(self, keys, tolerance=0, encoded=False):
+    """Returns preview polygons.
+
+    Args:
+      keys: (list) Preview polygon IDs, see GeocodePreviewPolygon.make_key.
+      tolerance: (float) Acceptable simplification tolerance in degrees. The
+          most simplified polygons within tolerance are returned.
+      encoded: (bool) Whether to return encoded polylines instead of
+          <polygon> elements.
+
+    Returns:
+      List of (id, content) tuples of existing polygons in keys order.
+      Content is a list of encoded polylines if encoded is set.
+    """
+    self.check_version()
+    tolerance = max(tolerance, 0)
+    keys = list(collections.OrderedDict.fromkeys(keys))
+    contents = {}
+    missing = []
+    for key in keys:
+      content = self.cache.get(key, default=_MISSING)
+      if content is _MISSING:
+        missing.append(key)
+      else:
+        contents[key] = content
+
+    if missing:
+      loaded = {
+          polygon_id: self.get_levels(content, simplified, encoded_levels)
+          for polygon_id, content, simplified, encoded_levels in
+          models.GeocodePreviewPolygon.objects.filter(pk__in=missing)
+          .values_list("id", "content", "simplified", "encoded")}
+      for key in missing:
+        # Unknown keys are cached as None to skip the query next time.
+        contents[key] = loaded.get(key)
+        self.cache.set(key, contents[key])
+
+    result = []
+    for key in keys:
+      if contents[key] is None:
+        continue
+      # Levels are sorted by decreasing tolerance, the last one is original.
+      _, polygons, polylines = next(
+          (level for level in contents[key] if level[0] <= tolerance),
+          contents[key][-1])
+      result.append((key, list(polylines) if encoded else polygons))
+    return result
+
+  def get_index(self):
+    """Returns spatial index of the current preview polygons version.
+
+    The index is loaded from index_path once per version. It is built from
+    the database (and saved to index_path) if the file is missing or of
+    another version.
+
+    Returns:
+      GridIndex instance.
+    """
+    self.check_version()
+    with self.lock:
+      index = self.index
+      version = self.version
+    if index is not None and index.version == version:
+      return index
+
+    index = None
+    if self.index_path and os.path.exists(self.index_path):
+      try:
+        index = GridIndex.load(self.index_path)
+      except (IOError, ValueError) as e:
+        logging.exception(e)
+      if index is not None and index.version != version:
+        index = None
+    if index is None:
+      index = BuildIndex(self.index_cell_size, version=version)
+      if self.index_path:
+        try:
+          index.save(self.index_path)
+        except (IOError, OSError) as e:
+          logging.exception(e)
+
+    with self.lock:
+      self.index = index
+    return index
+
+  def search(self, box):
+    """Returns sorted IDs of polygons with bounding box intersecting box.
+
+    Args:
+      box: (tuple) (min_lat, min_lng, max_lat, max_lng) floats.
+
+    Returns:
+      List of preview polygon IDs.
+    """
+    return self.get_index().search(box)
+
+  def search_point(self, lat, lng):
+    """Returns sorted IDs of polygons containing a point.
+
+    Args:
+      lat: (float) Point latitude.
+      lng: (float) Point longitude.
+
+    Returns:
+      List of preview polygon IDs.
+    """
+    keys = self.search((lat, lng, lat, lng))
+    return [key for key, content in self.get_many(keys)
+            if ContainsPoint(content, lat, lng)]
+
+  def stats(self):
+    """Returns store statistics.
+
+    Returns:
+      Dictionary with polygons version, number of indexed polygons and cache
+      statistics (see lru.LRUCache.stats).
+    """
+    stats = self.cache.stats()
+    with self.lock:
+      stats["version"] = self.version
+      stats["indexed"] = len(self.index) if self.index is not None else None
+    return stats
@@ -0,0 +1,143 @@
+"""Compiled XML schemas for alert validation.
+
+Schemas listed in CAP_SCHEMA_FILES are compiled once per process and selected
+by the namespace of the validated document root (several schemas, e.g. CAP
+and a CAP profile, may share a namespace; a document must be valid against
+all of them). A schema is recompiled when its file changes. Alerts are parsed
+in the CAP_NS namespace only, so schemas of other namespaces (e.g. CAP 1.1)
+are rejected at registration.
+
+lxml schema objects keep the errors of the last validation in a shared
+error_log, so a compiled schema object is only used by one thread at a time.
+Concurrent validations compile additional copies of the schema, which are
+kept for reuse.
+"""
+
+import os
+import threading
+
+import lxml
+from lxml import etree
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def GetRegistry():
+  """Returns process-wide registry of schemas configured by settings."""
+  global _registry
+  with _registry_lock:
+    if _registry is None:
+      registry = SchemaRegistry()
+      for file_name in settings.CAP_SCHEMA_FILES:
+        registry.register(os.path.join(settings.SCHEMA_DIR, file_name))
+      unsupported = set(registry.schemas) - set([settings.CAP_NS])
+      if unsupported:
+        raise ImproperlyConfigured(
+            "CAP_SCHEMA_FILES namespaces are not supported: %s" %
+            ", ".join(sorted(unsupported)))
+      _registry = registry
+    return _registry
+
+
+def Validate(xml_tree):
+  """Validates XML tree against the registered schemas of its namespace.
+
+  Args:
+    xml_tree: (lxml.etree.Element) XML tree.
+
+  Returns:
+    A tuple of (valid, error) where:
+      valid: (bool) Whether XML tree is valid or not.
+      error: (string) Error message in case XML tree is invalid.
+  """
+  return GetRegistry().validate(xml_tree)
+
+
+class Schema(object):
+  """Compiled XML schema reloaded when its file changes."""
+
+  def __init__(self, path):
+    self.path = path
+    self.lock = threading.Lock()
+    self.mtime = None
+    self.schema_tree = None
+    self.xml_schemas = []
+    self.target_namespace = None
+    self.load()
+
+  def load(self):
+    """Compiles schema from file."""
+    mtime = os.path.getmtime(self.path)
+    schema_tree = lxml.etree.parse(self.path)
+    self.xml_schemas = [lxml.etree.XMLSchema(schema_tree)]
+    self.schema_tree = schema_tree
+    self.target_namespace = schema_tree.getroot().get("targetNamespace")
+    self.mtime = mtime
+
+  def validate(self, xml_tree):
+    """Validates XML tree.
+
+    Args:
+      xml_tree: (lxml.etree.Element) XML tree.
+
+    Returns:
+      A tuple of (valid, error). See Validate.
+    """
+    with self.lock:
+      if os.path.getmtime(self.path) != self.mtime:
+        self.load()
+      schema_tree = self.schema_tree
+      xml_schema = self.xml_schemas.pop() if self.xml_schemas else None
+    if xml_schema is None:
+      # All compiled copies are in use by other threads.
+      xml_schema = lxml.etree.XMLSchema(schema_tree)
+
+    try:
+      if xml_schema.validate(xml_tree):
+        return True, None
+      return False, str(xml_schema.error_log.last_error)
+    finally:
+      with self.lock:
+        # Copies of a reloaded schema are dropped.
+        if schema_tree is self.schema_tree:
+          self.xml_schemas.append(xml_schema)
+
+
+class SchemaRegistry(object):
+  """Compiled XML schemas selected by target namespace."""
+
+  def __init__(self):
+    self.schemas = {}
+
+  def register(self, path):
+    """Compiles and registers schema for its target namespace.
+
+    Args:
+      path: (string) Schema file path.
+    """
+    schema = Schema(path)
+    self.schemas.setdefault(schema.target_namespace, []).append(schema)
+
+  def validate(self, xml_tree):
+    """Validates XML tree against all schemas registered for its namespace.
+
+    Args:
+      xml_tree: (lxml.etree.Element) XML tree.
+
+    Returns:
+      A tuple of (valid, error). See Validate.
+    """
+    namespace = lxml.etree.QName(xml_tree).namespace
+    schemas = self.schemas.get(namespace)
+    if not schemas:
+      return False, "No schema for namespace: %s" % namespace
+    for schema in schemas:
+      valid, error = schema.validate(xml_tree)
+      if not valid:
+        return valid, error
+    return True, None
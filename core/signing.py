@@ -0,0 +1,172 @@
+"""Alert signing with cached credentials and a signing process pool.
+
+Users' private keys and certificates are loaded from CREDENTIALS_DIR once and
+cached until the credential files change. xmlsec.sign parses the key files on
+every signature and takes no key objects, so the enveloped signature is
+computed here with the cached keys (see SignWithKeys).
+
+When SIGNING_PROCESSES is set, alerts are signed by a pool of that many
+processes so that RSA signing does not hold the interpreter lock of the web
+server worker. Alerts are signed in the calling thread if the pool does not
+answer within SIGNING_TIMEOUT.
+"""
+
+import base64
+import logging
+import multiprocessing
+import os
+import threading
+
+import lxml
+from lxml import etree
+
+from django.conf import settings
+
+try:
+  import xmlsec
+  XMLSEC_DEFINED = True
+except ImportError:
+  # This module is not available on AppEngine.
+  # https://code.google.com/p/googleappengine/issues/detail?id=1034
+  XMLSEC_DEFINED = False
+
+
+_keys = {}
+_keys_lock = threading.Lock()
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def GetCredentialPaths(username):
+  """Returns a tuple of (key_path, cert_path) of the user credentials."""
+  return (os.path.join(settings.CREDENTIALS_DIR, username + ".key"),
+          os.path.join(settings.CREDENTIALS_DIR, username + ".cert"))
+
+
+def LoadKey(path, private=False):
+  """Loads PEM private key or certificate file caching it until it changes.
+
+  Args:
+    path: (string) Key or certificate file path.
+    private: (bool) Whether path is a private key or a certificate.
+
+  Returns:
+    xmlsec.crypto.XMLSecCryptoFile object.
+
+  Raises:
+    IOError: if the file cannot be read.
+    xmlsec.exceptions.XMLSigException: if the key is not an RSA key.
+  """
+  mtime = os.path.getmtime(path)
+  cache_key = (path, private)
+  with _keys_lock:
+    cached = _keys.get(cache_key)
+  if cached and cached[0] == mtime:
+    return cached[1]
+
+  key = xmlsec.crypto.XMLSecCryptoFile(path, private)
+  with _keys_lock:
+    _keys[cache_key] = (mtime, key)
+  return key
+
+
+def SignWithKeys(xml_tree, key, cert):
+  """Adds enveloped signature to XML tree like xmlsec.sign with loaded keys.
+
+  Args:
+    xml_tree: (lxml.etree.Element) XML tree.
+    key: (xmlsec.crypto.XMLSecCryptoFile) Private key, see LoadKey.
+    cert: (xmlsec.crypto.XMLSecCryptoFile) Certificate, see LoadKey.
+  """
+  # Relies on internals of the pyXMLSecurity version pinned in
+  # requirements.txt. pylint: disable=protected-access
+  signature = xmlsec.add_enveloped_signature(xml_tree, pos=-1)
+  try:
+    signed_info = signature.find("{%s}SignedInfo" % xmlsec.NS["ds"])
+    xmlsec._process_references(xml_tree, signature, verify_mode=False)
+    signed_info_c14n = xmlsec._transform(xmlsec._cm_alg(signed_info),
+                                         signed_info)
+    signature_value = key.sign(signed_info_c14n,
+                               xmlsec._sig_alg(signed_info))
+    signed_info.addnext(xmlsec.DS.SignatureValue(
+        base64.b64encode(signature_value)))
+    signature.append(xmlsec.DS.KeyInfo(xmlsec.DS.X509Data(
+        xmlsec.DS.X509Certificate(xmlsec.utils.pem2b64(cert.cert_pem)))))
+  except Exception:
+    # Leaves the tree unchanged.
+    signature.getparent().remove(signature)
+    raise
+
+
+def Sign(xml_tree, username):
+  """Signs XML tree in place with user key/certificate.
+
+  Args:
+    xml_tree: (lxml.etree.Element) XML tree.
+    username: (string) Username of the alert author.
+
+  Returns:
+    Boolean. Whether XML tree was signed (user has key/certificate pair and
+    signing succeeded).
+  """
+  key_path, cert_path = GetCredentialPaths(username)
+  try:
+    key = LoadKey(key_path, private=True)
+    cert = LoadKey(cert_path)
+  except (IOError, OSError, xmlsec.exceptions.XMLSigException):
+    return False
+  try:
+    SignWithKeys(xml_tree, key, cert)
+  except (ValueError, xmlsec.exceptions.XMLSigException) as e:
+    logging.error("Signing alert by %s failed: %s", username, e)
+    return False
+  return True
+
+
+def SignString(xml_string, username):
+  """Signs serialized XML tree (in a signing pool process).
+
+  Args:
+    xml_string: (string) XML content.
+    username: (string) Username of the alert author.
+
+  Returns:
+    String. Signed XML content or None if user has no key/certificate pair.
+  """
+  xml_tree = lxml.etree.fromstring(xml_string)
+  if Sign(xml_tree, username):
+    return lxml.etree.tostring(xml_tree)
+  return None
+
+
+def GetPool():
+  """Returns process-wide signing process pool."""
+  global _pool
+  with _pool_lock:
+    if _pool is None:
+      _pool = multiprocessing.Pool(settings.SIGNING_PROCESSES)
+    return _pool
+
+
+def SignInPool(xml_tree, username):
+  """Signs XML tree in the signing process pool.
+
+  Args:
+    xml_tree: (lxml.etree.Element) XML tree.
+    username: (string) Username of the alert author.
+
+  Returns:
+    lxml.etree.Element. Signed XML tree or None if it was not signed.
+  """
+  result = GetPool().apply_async(
+      SignString, (lxml.etree.tostring(xml_tree), username))
+  try:
+    signed_xml_string = result.get(settings.SIGNING_TIMEOUT)
+  except multiprocessing.TimeoutError:
+    # Never publishes an unsigned alert because the pool is busy.
+    logging.error("Signing alert by %s timed out, signing in process",
+                  username)
+    return xml_tree if Sign(xml_tree, username) else None
+  if signed_xml_string is None:
+    return None
+  return lxml.etree.fromstring(signed_xml_string)
@@ -4,19 +4,38 @@ __author__ = "Arkadii Yakovets (arcadiy@google.com)"
 
 from core import views
 from django.conf.urls import url
+from session_csrf import anonymous_csrf_exempt
 
 
 urlpatterns = [
     url(r"^$", views.IndexView.as_view()),
     url(r"^feed.(?P<feed_type>(html|xml))$", views.FeedView.as_view(),
         name="feed"),
+    url(r"^feed/changes.(?P<feed_type>xml)$", views.FeedChangesView.as_view(),
+        name="feed_changes"),
+    url(r"^feed/(?P<alert_id>[^/]+)/history$", views.AlertHistoryView.as_view(),
+        name="alert_history"),
     url(r"^feed/(?P<alert_id>.*).(?P<feed_type>(html|xml))$",
         views.FeedView.as_view(), name="alert"),
-    url(r"^post/$", views.PostView.as_view(), name="post"),
+    url(r"^notifications$", views.AlertNotificationsView.as_view(),
+        name="notifications"),
+    # API token requests have no session (and CSRF token).
+    url(r"^post/$", anonymous_csrf_exempt(views.PostView.as_view()),
+        name="post"),
+    url(r"^post/batch/$", anonymous_csrf_exempt(views.BatchPostView.as_view()),
+        name="post_batch"),
+    url(r"^post/jobs/(?P<job_id>[^/]+)$", views.IngestJobView.as_view(),
+        name="ingest_job"),
     url(r"^template/(?P<template_type>(area|message))/$",
         views.AlertTemplateView.as_view(), name="template"),
     url(r"^preview/polygons$",
         views.GeocodePolygonPreviewView.as_view(),
         name="geocodepreviewpolygons"),
+    url(r"^preview/polygons/search$",
+        views.GeocodePolygonPreviewSearchView.as_view(),
+        name="geocodepreviewpolygons_search"),
+    url(r"^preview/polygons/stats$",
+        views.GeocodePolygonPreviewStatsView.as_view(),
+        name="geocodepreviewpolygons_stats"),
 ]
 
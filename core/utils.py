@@ -29,31 +29,125 @@
 """Helpers for core CAP Collector module."""
 
 
-import copy
+import base64
+import collections
+import fcntl
 from datetime import datetime
+from datetime import timedelta
+import gzip
+import hashlib
+import itertools
 import logging
 import lxml
+from multiprocessing.pool import ThreadPool
 import os
 import re
+import StringIO
+import tempfile
+import time
+import urllib
 import uuid
 
 from bs4 import BeautifulSoup
+from core import lru
 from core import models
+from core import notifications
+from core import schemas
+from core import signing
+from core import websub
 from dateutil import parser
+from dateutil import tz
 from django.conf import settings
+from django.core.cache import caches
 from django.core.urlresolvers import reverse
+from django.db import transaction
+from django.db.models import Max
+from django.db.models import Min
+from django.db.models import Q
+from django.template.loader import get_template
 from django.template.loader import render_to_string
 from django.utils import timezone
+from django.utils import translation
 from django.utils.translation import ugettext
 import pytz
 
 try:
-  import xmlsec
-  XMLSEC_DEFINED = True
+  import brotli
+  BROTLI_DEFINED = True
 except ImportError:
-  # This module is not available on AppEngine.
-  # https://code.google.com/p/googleappengine/issues/detail?id=1034
-  XMLSEC_DEFINED = False
+  # Brotli compression is optional.
+  BROTLI_DEFINED = False
+
+# Supported content encodings in order of preference.
+CONTENT_ENCODINGS = ("br", "gzip") if BROTLI_DEFINED else ("gzip",)
+
+ALERT_CACHE_KEY = "alert:%s"
+FEED_GENERATION_CACHE_KEY = "feed:generation"
+FEED_CACHE_KEY = "feed:%(generation)s:%(feed_type)s:%(language)s:%(params)s"
+FEED_PAGING_PARAMS = ("limit", "after", "before")
+# Feed filter query parameters (named after CAP elements) and corresponding
+# Alert model fields.
+FEED_FILTERS = {
+    "category": "category",
+    "certainty": "certainty",
+    "event": "event",
+    "language": "language",
+    "msgType": "msg_type",
+    "severity": "severity",
+    "urgency": "urgency",
+}
+# Feed filters matching any <info> block, see models.AlertFilterValue.
+FEED_INFO_FILTERS = ("category", "certainty", "event", "language",
+                     "severity", "urgency")
+FEED_ENTRIES_MARKER = "<!-- entries -->"
+# Number of alerts read at once by IterateAlerts.
+FEED_CHUNK_SIZE = 500
+
+# CAP elements consisting of a name and a value (e.g. <valueName>/<value>).
+CAP_NAME_VALUE_ELEMENTS = frozenset(["eventCode", "geocode", "parameter"])
+
+# ParseAlert keys of <info> block fields and their CAP element names.
+CAP_INFO_FIELDS = (
+    ("category", "category"),
+    ("certainty", "certainty"),
+    ("description", "description"),
+    ("event", "event"),
+    ("instruction", "instruction"),
+    ("language", "language"),
+    ("response_type", "responseType"),
+    ("severity", "severity"),
+    ("urgency", "urgency"),
+    ("web", "web"),
+)
+
+# ParseAlert dictionary keys, see ParsedAlert.
+PARSED_ALERT_FIELDS = (
+    "alert_id", "area_desc", "category", "certainty", "circles",
+    "description", "event", "event_codes", "expires", "expiresDurationMinutes",
+    "geocodes", "infos", "instruction", "language", "link", "msg_type", "name",
+    "parameters", "polys", "references", "response_type", "sender",
+    "sender_name", "sent", "severity", "title", "urgency", "web",
+)
+PARSED_ALERT_PAIR_FIELDS = frozenset(["event_codes", "geocodes", "parameters"])
+
+# CAP 1.2 dateTime format (with optional fractional seconds), see
+# ParseCapDateTime.
+CAP_DATETIME_RE = re.compile(
+    r"^(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})(?:\.(\d+))?"
+    r"([+-])(\d{2}):(\d{2})$")
+# Timezones by UTC offset in minutes, shared by parsed CAP dateTime values.
+CAP_TIMEZONES = {0: tz.tzutc()}
+
+# Parsed alerts cache, see GetParsedAlert.
+PARSED_ALERT_CACHE = lru.LRUCache(settings.PARSED_ALERT_CACHE_SIZE,
+                                  settings.PARSED_ALERT_CACHE_MAX_BYTES)
+
+# Static file name suffixes of precompressed variants (see nginx gzip_static).
+STATIC_FILE_SUFFIXES = {
+    "identity": "",
+    "gzip": ".gz",
+    "br": ".br",
+}
 
 
 def GetCurrentDate():
@@ -61,49 +155,906 @@ def GetCurrentDate():
   return datetime.now(pytz.utc)
 
 
-def GenerateFeed(feed_type="xml"):
-  """Generates XML for alert feed based on active alert files.
+def GetActiveAlerts(params=None):
+  """Returns unexpired and not updated alerts, most recent first.
+
+  Args:
+    params: (dict) Feed parameters, see GetFeedParams. Only feed filters are
+        applied.
+
+  Returns:
+    QuerySet.
+  """
+
+  alerts = models.Alert.objects.filter(
+      updated=False,
+      expires_at__gt=GetCurrentDate()).order_by("-created_at", "-id")
+  for name, field_name in FEED_FILTERS.iteritems():
+    if params and name in params:
+      values = params[name].split(",")
+      condition = Q(**{field_name + "__in": values})
+      if name in FEED_INFO_FILTERS:
+        condition |= Q(uuid__in=models.AlertFilterValue.objects.filter(
+            name=name, value__in=values).values("alert_uuid"))
+      alerts = alerts.filter(condition)
+  return alerts
+
+
+def ParseCapDateTime(value):
+  """Parses CAP dateTime string.
+
+  CAP 1.2 requires the "YYYY-MM-DDThh:mm:ssXzh:zm" format, which is parsed
+  directly (fractional seconds are accepted as well). Non-conforming values
+  fall back to the generic (and much slower) dateutil parser.
+
+  Args:
+    value: (string) Date and time string.
+
+  Returns:
+    Datetime. Timezone aware unless a non-conforming value has no timezone.
+
+  Raises:
+    ValueError: if the value cannot be parsed.
+  """
+
+  match = CAP_DATETIME_RE.match(value)
+  if not match:
+    try:
+      return parser.parse(value)
+    except (TypeError, OverflowError):
+      raise ValueError("Invalid date and time: %s" % value)
+
+  (year, month, day, hour, minute, second, fraction, sign, offset_hours,
+   offset_minutes) = match.groups()
+  offset = int(offset_hours) * 60 + int(offset_minutes)
+  if sign == "-":
+    offset = -offset
+  tzinfo = CAP_TIMEZONES.get(offset)
+  if tzinfo is None:
+    if not -24 * 60 < offset < 24 * 60:
+      raise ValueError("Invalid timezone offset: %s" % value)
+    tzinfo = CAP_TIMEZONES.setdefault(offset, tz.tzoffset(None, offset * 60))
+  microsecond = int(fraction.ljust(6, "0")[:6]) if fraction else 0
+  return datetime(int(year), int(month), int(day), int(hour), int(minute),
+                  int(second), microsecond, tzinfo)
+
+
+def FormatDateTime(value):
+  """Formats datetime as feed date and time without fractional seconds.
+
+  Args:
+    value: (datetime) Timezone aware date and time.
+
+  Returns:
+    String. "YYYY-MM-DDThh:mm:ssXzh:zm" formatted date and time.
+  """
+  return value.replace(microsecond=0).isoformat()
+
+
+def EncodeFeedCursor(alert):
+  """Returns opaque feed page cursor pointing to the alert."""
+  return base64.urlsafe_b64encode(
+      "%s|%d" % (alert.created_at.isoformat(), alert.id))
+
+
+def DecodeFeedCursor(cursor):
+  """Decodes feed page cursor.
+
+  Args:
+    cursor: (string) Cursor created by EncodeFeedCursor.
+
+  Returns:
+    A tuple of (created_at, id) of the alert the cursor points to.
+
+  Raises:
+    ValueError: if the cursor is malformed.
+  """
+  try:
+    created_at, alert_id = base64.urlsafe_b64decode(
+        str(cursor)).split("|")
+    return ParseCapDateTime(created_at), int(alert_id)
+  except (TypeError, ValueError, OverflowError):
+    raise ValueError("Malformed feed cursor: %s" % cursor)
+
+
+def GetFeedParams(query_dict):
+  """Extracts and validates alert feed query parameters.
+
+  Feed parameters are paging parameters (see GetFeedPage) and filters by
+  indexed CAP fields (see FEED_FILTERS).
+
+  Args:
+    query_dict: (QueryDict) Request GET parameters.
+
+  Returns:
+    Dictionary. Non-empty feed parameters, filter values are normalized to
+    sorted comma separated strings.
+
+  Raises:
+    ValueError: if any of the parameters is invalid.
+  """
+
+  params = {}
+  for name in FEED_PAGING_PARAMS:
+    value = query_dict.get(name)
+    if value:
+      params[name] = value
+
+  # Filters accept multiple values, either comma separated or repeated.
+  for name in FEED_FILTERS:
+    values = set()
+    for value in query_dict.getlist(name):
+      values.update(item.strip() for item in value.split(",") if item.strip())
+    if values:
+      params[name] = ",".join(sorted(values))
+
+  if "limit" in params:
+    limit = int(params["limit"])
+    if not 0 < limit <= settings.FEED_MAX_PAGE_SIZE:
+      raise ValueError("Feed limit must be between 1 and %d." %
+                       settings.FEED_MAX_PAGE_SIZE)
+    params["limit"] = limit
+  if "after" in params and "before" in params:
+    raise ValueError("Only one of after and before cursors is allowed.")
+  for name in ("after", "before"):
+    if name in params:
+      DecodeFeedCursor(params[name])
+  return params
+
+
+def IterateAlerts(alerts, chunk_size=FEED_CHUNK_SIZE):
+  """Iterates alerts in keyset paginated chunks.
+
+  QuerySet.iterator does not bound memory with database drivers buffering the
+  whole result set on the client (e.g. MySQLdb), so alerts are read
+  chunk_size at a time instead.
+
+  Args:
+    alerts: (QuerySet) models.Alert objects ordered by ("-created_at", "-id").
+    chunk_size: (int) Number of alerts read with a query.
+
+  Yields:
+    models.Alert objects.
+  """
+  chunk = list(alerts[:chunk_size])
+  while chunk:
+    for alert in chunk:
+      yield alert
+    if len(chunk) < chunk_size:
+      return
+    last = chunk[-1]
+    chunk = list(alerts.filter(
+        Q(created_at__lt=last.created_at) |
+        Q(created_at=last.created_at, id__lt=last.id))[:chunk_size])
+
+
+def GetFeedPage(params):
+  """Returns active alerts for the requested feed page.
+
+  Pages are fetched by keyset pagination on (created_at, id), so the cost of
+  a page does not depend on the number of pages before it.
+
+  Args:
+    params: (dict) Feed parameters, see GetFeedParams.
+
+  Returns:
+    A tuple of (alerts, cursors) where:
+      alerts: Iterable of models.Alert objects.
+      cursors: (dict) "after" and "before" cursors of the adjacent pages.
+  """
+
+  alerts = GetActiveAlerts(params)
+  limit = params.get("limit")
+  if not limit:
+    return IterateAlerts(alerts), {}
+
+  cursors = {}
+  if "before" in params:
+    created_at, alert_id = DecodeFeedCursor(params["before"])
+    alerts = list(alerts.filter(
+        Q(created_at__gt=created_at) |
+        Q(created_at=created_at, id__gt=alert_id)).reverse()[:limit + 1])
+    alerts.reverse()
+    if len(alerts) > limit:
+      alerts = alerts[1:]
+      cursors["before"] = EncodeFeedCursor(alerts[0])
+    if alerts:
+      cursors["after"] = EncodeFeedCursor(alerts[-1])
+    return alerts, cursors
+
+  if "after" in params:
+    created_at, alert_id = DecodeFeedCursor(params["after"])
+    alerts = alerts.filter(
+        Q(created_at__lt=created_at) |
+        Q(created_at=created_at, id__lt=alert_id))
+  alerts = list(alerts[:limit + 1])
+  if len(alerts) > limit:
+    alerts = alerts[:limit]
+    cursors["after"] = EncodeFeedCursor(alerts[-1])
+  if "after" in params and alerts:
+    cursors["before"] = EncodeFeedCursor(alerts[0])
+  return alerts, cursors
+
+
+def EncodeFeedParams(params):
+  """Returns URL query string of feed parameters sorted by name.
+
+  Args:
+    params: (dict) Feed parameters, see GetFeedParams. Values may be unicode.
+
+  Returns:
+    String.
+  """
+  return urllib.urlencode(sorted(
+      (name, unicode(value).encode("utf-8"))
+      for name, value in (params or {}).iteritems()))
+
+
+def GetFeedUrl(feed_type, params=None):
+  """Returns absolute alert feed URL with the given query parameters."""
+  feed_url = settings.SITE_URL + reverse("feed", args=[feed_type])
+  if params:
+    feed_url += "?" + EncodeFeedParams(params)
+  return feed_url
+
+
+def GetFeedContext(feed_type, params=None, cursors=None):
+  """Returns alert feed template context with no entries.
 
   Args:
     feed_type: (string) Either xml of html.
+    params: (dict) Feed parameters, see GetFeedParams.
+    cursors: (dict) Adjacent pages cursors, see GetFeedPage.
 
   Returns:
-    String. Ready to serve XML feed content.
+    Dictionary.
   """
 
+  params = params or {}
+  cursors = cursors or {}
+
   # Build feed header.
-  now = timezone.now().isoformat()
-  time_str, tz_str = now.split("+")
-  feed_updated = "%s+%s" % (time_str.split(".")[0], tz_str)
-  feed_url = settings.SITE_URL + reverse("feed", args=[feed_type])
-  entries = []
+  feed_updated = GetFeedLastModified() or timezone.now()
+  feed_updated = FormatDateTime(feed_updated)
+  filter_params = dict((name, value) for name, value in params.iteritems()
+                       if name in FEED_FILTERS)
+  feed_url = GetFeedUrl(feed_type, filter_params)
 
-  # For each unexpired message, get the necessary values and add it to the feed.
-  for alert in models.Alert.objects.filter(
-      updated=False,
-      expires_at__gt=GetCurrentDate()).order_by("-created_at"):
-    entries.append(ParseAlert(alert.content, feed_type, alert.uuid))
+  # RFC 5005 paging links.
+  links = {}
+  if "limit" in params:
+    base_params = dict(filter_params, limit=params["limit"])
+    links["first"] = GetFeedUrl(feed_type, base_params)
+    if "after" in cursors:
+      links["next"] = GetFeedUrl(
+          feed_type, dict(base_params, after=cursors["after"]))
+    if "before" in cursors:
+      links["previous"] = GetFeedUrl(
+          feed_type, dict(base_params, before=cursors["before"]))
 
-  feed_dict = {
-      "entries": entries,
+  return {
+      "entries": [],
       "feed_url": feed_url,
+      "hub_url": settings.WEBSUB_HUB_URL,
+      "self_url": GetFeedUrl(feed_type, params),
+      "links": links,
       "updated": feed_updated,
       "version": settings.VERSION,
   }
 
+
+def GenerateFeed(feed_type="xml", params=None):
+  """Generates XML for alert feed based on active alert files.
+
+  Args:
+    feed_type: (string) Either xml of html.
+    params: (dict) Feed parameters, see GetFeedParams.
+
+  Returns:
+    String. Ready to serve XML feed content.
+  """
+
+  params = params or {}
+  alerts, cursors = GetFeedPage(params)
+  feed_dict = GetFeedContext(feed_type, params, cursors)
+
+  # For each unexpired message, get the necessary values and add it to the feed.
+  entries = feed_dict["entries"]
+  for alert in alerts:
+    entries.append(GetAlertEntry(alert, feed_type))
+  if entries:
+    feed_dict["last_updated"] = entries[0]["sent"]
+
   feed_template = "core/feed." + feed_type + ".tmpl"
 
   return BeautifulSoup(
       render_to_string(feed_template, feed_dict), feed_type).prettify()
 
 
+def StreamFeed(feed_type="xml", language=None, params=None):
+  """Generates alert feed content entry by entry.
+
+  Unlike GenerateFeed this neither holds all feed entries in memory nor
+  prettifies the output. The feed header is yielded as soon as the first
+  active alert is read from the database.
+
+  Args:
+    feed_type: (string) Either xml of html.
+    language: (string) Feed language. The generator is usually consumed after
+        the request language is deactivated, so it needs to be passed
+        explicitly. Defaults to the current language.
+    params: (dict) Feed parameters, see GetFeedParams.
+
+  Yields:
+    Strings. Ready to serve feed content chunks.
+  """
+
+  with translation.override(language or translation.get_language()):
+    params = params or {}
+    alerts, cursors = GetFeedPage(params)
+    feed_dict = GetFeedContext(feed_type, params, cursors)
+    feed_template = "core/feed." + feed_type + ".tmpl"
+
+    alerts = iter(alerts)
+    first_alert = next(alerts, None)
+    if not first_alert:
+      yield render_to_string(feed_template, feed_dict).lstrip()
+      return
+
+    # Split the rendered feed into header and footer around the entries.
+    feed_dict["entries_marker"] = FEED_ENTRIES_MARKER
+    feed_dict["last_updated"] = first_alert.created_at
+    header, footer = render_to_string(
+        feed_template, feed_dict).lstrip().split(FEED_ENTRIES_MARKER)
+    yield header
+
+    entry_template = get_template("core/feed_entry." + feed_type + ".tmpl")
+    for alert in itertools.chain([first_alert], alerts):
+      yield entry_template.render({"entry": GetAlertEntry(alert, feed_type)})
+    yield footer
+
+
+def EncodeChangesToken(timestamp):
+  """Returns opaque alert changes token for the given time."""
+  return base64.urlsafe_b64encode(timestamp.isoformat())
+
+
+def DecodeChangesToken(token):
+  """Decodes alert changes token.
+
+  Args:
+    token: (string) Token created by EncodeChangesToken.
+
+  Returns:
+    Datetime.
+
+  Raises:
+    ValueError: if the token is malformed.
+  """
+  try:
+    timestamp = ParseCapDateTime(base64.urlsafe_b64decode(str(token)))
+  except (TypeError, ValueError, OverflowError):
+    raise ValueError("Malformed changes token: %s" % token)
+  if not timestamp.tzinfo:
+    raise ValueError("Malformed changes token: %s" % token)
+  return timestamp
+
+
+def GetAlertChanges(since=None):
+  """Returns alerts changed since the given time.
+
+  Every query uses an index on change time, so the cost depends on the number
+  of changes rather than on the number of active alerts. Changes are reported
+  up to FEED_CHANGES_SAFETY_LAG seconds ago, so that alerts saved by a
+  transaction still in progress are reported by the next request.
+
+  Args:
+    since: (datetime) Changes start time (exclusive). If not set, all active
+        alerts are returned as created.
+
+  Returns:
+    A tuple of (created, superseded, expired, until) where:
+      created: (list) Created active alerts, most recent first.
+      superseded: (list) Alerts replaced by an update or cancel.
+      expired: (list) Alerts expired in the meantime.
+      until: (datetime) Changes end time (inclusive).
+  """
+
+  until = GetCurrentDate() - timedelta(
+      seconds=settings.FEED_CHANGES_SAFETY_LAG)
+  alerts = models.Alert.objects.filter(last_modified_at__lte=until)
+  created = alerts.filter(updated=False, expires_at__gt=until)
+  superseded = alerts.filter(updated=True)
+  expired = alerts.filter(updated=False, expires_at__lte=until)
+  if since:
+    created = created.filter(last_modified_at__gt=since)
+    superseded = superseded.filter(last_modified_at__gt=since)
+    expired = expired.filter(expires_at__gt=since)
+  else:
+    superseded = expired = models.Alert.objects.none()
+
+  return (list(created.order_by("-created_at", "-id")),
+          list(superseded.order_by("last_modified_at")),
+          list(expired.order_by("expires_at")),
+          until)
+
+
+def GenerateChangesFeed(since=None):
+  """Generates Atom feed of alert changes since the given time.
+
+  Created alerts are regular feed entries, superseded and expired alerts are
+  RFC 6721 deleted entries. The feed "next" link carries the token for the
+  next changes request.
+
+  Args:
+    since: (datetime) Changes start time (exclusive), see GetAlertChanges.
+
+  Returns:
+    String. Ready to serve XML feed content.
+  """
+
+  created, superseded, expired, until = GetAlertChanges(since)
+  changes_url = settings.SITE_URL + reverse("feed_changes", args=["xml"])
+  deleted_entries = (
+      [{"alert_id": alert.uuid, "when": alert.last_modified_at,
+        "reason": "superseded"} for alert in superseded] +
+      [{"alert_id": alert.uuid, "when": alert.expires_at,
+        "reason": "expired"} for alert in expired])
+
+  feed_dict = {
+      "entries": [GetAlertEntry(alert, "xml") for alert in created],
+      "deleted_entries": deleted_entries,
+      "feed_url": changes_url,
+      "self_url": changes_url + (
+          "?" + urllib.urlencode({"since": EncodeChangesToken(since)})
+          if since else ""),
+      "next_url": changes_url + "?" + urllib.urlencode(
+          {"since": EncodeChangesToken(until)}),
+      "updated": FormatDateTime(until),
+      "version": settings.VERSION,
+  }
+  return render_to_string("core/feed_changes.xml.tmpl", feed_dict).lstrip()
+
+
+def GetFeedLastModified():
+  """Returns the last time alert feed content changed.
+
+  That is the latest of alert creation, alert update flag change and passed
+  alert expiration times. Both are cheap indexed queries.
+
+  Returns:
+    Datetime or None if there are no alerts.
+  """
+
+  last_modified = models.Alert.objects.aggregate(
+      Max("last_modified_at"))["last_modified_at__max"]
+  last_expired = models.Alert.objects.filter(
+      expires_at__lte=GetCurrentDate()).aggregate(
+          Max("expires_at"))["expires_at__max"]
+  if last_modified and last_expired:
+    return max(last_modified, last_expired)
+  return last_modified or last_expired
+
+
+def GetFeedETag(feed_type, last_modified, params=None,
+                content_encoding="identity"):
+  """Returns alert feed entity tag.
+
+  Args:
+    feed_type: (string) Either xml of html.
+    last_modified: (datetime) Feed last modification time.
+    params: (dict) Feed parameters, see GetFeedParams.
+    content_encoding: (string) Feed content encoding.
+
+  Returns:
+    String.
+  """
+  etag = hashlib.sha1("|".join([
+      feed_type,
+      translation.get_language() or "",
+      last_modified.isoformat() if last_modified else "",
+      EncodeFeedParams(params),
+      settings.VERSION])).hexdigest()
+  if content_encoding != "identity":
+    etag = "%s-%s" % (etag, content_encoding)
+  return etag
+
+
+def GetAlertETag(alert, feed_type, content_encoding="identity"):
+  """Returns alert entity tag.
+
+  Args:
+    alert: (models.Alert) Alert object.
+    feed_type: (string) Alert representation (XML or HTML).
+    content_encoding: (string) Alert content encoding.
+
+  Returns:
+    String.
+  """
+  content_hash = hashlib.sha1(alert.content.encode("utf-8")).hexdigest()
+  etag = "%s-%s" % (alert.uuid, content_hash)
+  if feed_type == "html":
+    etag = "%s-%s" % (etag, translation.get_language())
+  if content_encoding != "identity":
+    etag = "%s-%s" % (etag, content_encoding)
+  return etag
+
+
+def CompressContent(content):
+  """Precompresses content with all supported content encodings.
+
+  Args:
+    content: (string) Content to compress.
+
+  Returns:
+    Dictionary.
+    Content encoding to encoded content, "identity" maps to the content itself.
+  """
+
+  data = content.encode("utf-8") if isinstance(content, unicode) else content
+  variants = {"identity": content}
+
+  gzip_buffer = StringIO.StringIO()
+  # Zero mtime keeps the compressed variant the same for the same content.
+  with gzip.GzipFile(fileobj=gzip_buffer, mode="wb", mtime=0) as gzip_file:
+    gzip_file.write(data)
+  variants["gzip"] = gzip_buffer.getvalue()
+
+  if BROTLI_DEFINED:
+    variants["br"] = brotli.compress(data)
+  return variants
+
+
+def ChooseContentEncoding(accept_encoding):
+  """Chooses the preferred supported content encoding acceptable by client.
+
+  Args:
+    accept_encoding: (string) Accept-Encoding HTTP request header value.
+
+  Returns:
+    String. One of CONTENT_ENCODINGS or "identity".
+  """
+
+  accepted = {}
+  for item in accept_encoding.split(","):
+    parts = item.split(";")
+    quality = 1.0
+    for part in parts[1:]:
+      name, _, value = part.strip().partition("=")
+      if name == "q":
+        try:
+          quality = float(value)
+        except ValueError:
+          quality = 0.0
+    accepted[parts[0].strip().lower()] = quality
+
+  for encoding in CONTENT_ENCODINGS:
+    if accepted.get(encoding, accepted.get("*", 0.0)) > 0.0:
+      return encoding
+  return "identity"
+
+
+def GetAlertVariants(alert):
+  """Returns precompressed variants of alert XML content.
+
+  Variants are computed once and stored in the feed cache until the alert
+  expires (but at least for FEED_CACHE_TIMEOUT).
+
+  Args:
+    alert: (models.Alert) Alert object.
+
+  Returns:
+    Dictionary. See CompressContent.
+  """
+
+  cache = caches[settings.FEED_CACHE_ALIAS]
+  cache_key = ALERT_CACHE_KEY % alert.uuid
+  variants = cache.get(cache_key)
+  if variants is None:
+    variants = CompressContent(alert.content)
+    timeout = max(settings.FEED_CACHE_TIMEOUT,
+                  int((alert.expires_at - GetCurrentDate()).total_seconds()))
+    cache.set(cache_key, variants, timeout)
+  return variants
+
+
+def GetFeedGeneration():
+  """Returns current materialized feeds generation.
+
+  The generation is a part of every materialized feed cache key. Bumping it
+  makes all previously cached feeds unreachable.
+
+  Returns:
+    Integer.
+  """
+  cache = caches[settings.FEED_CACHE_ALIAS]
+  generation = cache.get(FEED_GENERATION_CACHE_KEY)
+  if generation is None:
+    # Use current time to never reuse generations after a cache eviction.
+    cache.add(FEED_GENERATION_CACHE_KEY, int(time.time() * 1000), None)
+    generation = cache.get(FEED_GENERATION_CACHE_KEY)
+  return generation
+
+
+def InvalidateFeeds():
+  """Invalidates all materialized feeds (for all feed types and languages)."""
+  cache = caches[settings.FEED_CACHE_ALIAS]
+  try:
+    cache.incr(FEED_GENERATION_CACHE_KEY)
+  except ValueError:
+    # The generation key is missing, start a new one.
+    cache.set(FEED_GENERATION_CACHE_KEY, int(time.time() * 1000), None)
+
+
+def GetFeed(feed_type="xml", params=None):
+  """Returns materialized alert feed content.
+
+  Args:
+    feed_type: (string) Either xml of html.
+    params: (dict) Feed parameters, see GetFeedParams.
+
+  Returns:
+    String. Ready to serve feed content.
+  """
+  return GetFeedVariants(feed_type, params)["identity"]
+
+
+def GetFeedVariants(feed_type="xml", params=None):
+  """Returns materialized alert feed content with its precompressed variants.
+
+  The feed is rendered and compressed once per feed type, language and
+  parameters and stored in the feed cache. It stays there until a new alert is
+  published (see InvalidateFeeds), until the earliest expiration time among
+  the feed alerts or until FEED_CACHE_TIMEOUT, whichever comes first.
+
+  Args:
+    feed_type: (string) Either xml of html.
+    params: (dict) Feed parameters, see GetFeedParams.
+
+  Returns:
+    Dictionary. See CompressContent.
+  """
+
+  cache = caches[settings.FEED_CACHE_ALIAS]
+  cache_key = FEED_CACHE_KEY % {
+      "generation": GetFeedGeneration(),
+      "feed_type": feed_type,
+      "language": translation.get_language(),
+      "params": hashlib.md5(EncodeFeedParams(params)).hexdigest(),
+  }
+  variants = cache.get(cache_key)
+  if variants is not None:
+    return variants
+
+  now = GetCurrentDate()
+  next_expiration = GetActiveAlerts(params).aggregate(
+      Min("expires_at"))["expires_at__min"]
+  variants = CompressContent(GenerateFeed(feed_type, params))
+
+  timeout = settings.FEED_CACHE_TIMEOUT
+  if next_expiration:
+    timeout = min(timeout, int((next_expiration - now).total_seconds()))
+  if timeout > 0:
+    cache.set(cache_key, variants, timeout)
+  return variants
+
+
+def GenerateAlertHtml(alert):
+  """Generates alert HTML page.
+
+  Args:
+    alert: (models.Alert) Alert to render.
+
+  Returns:
+    String. Ready to serve HTML content.
+  """
+
+  context = {
+      "alert": GetAlertEntry(alert, "html")
+  }
+  response = render_to_string("core/alert.html.tmpl", context)
+  return BeautifulSoup(response, "html").prettify()
+
+
+def WriteStaticFile(relative_path, content):
+  """Atomically writes content to a file under STATIC_FEED_DIR.
+
+  The content is written to a temporary file which then replaces the target
+  file, so readers (e.g. nginx) never see a partially written file.
+
+  Args:
+    relative_path: (string) File path relative to STATIC_FEED_DIR.
+    content: (string) File content.
+  """
+
+  path = os.path.join(settings.STATIC_FEED_DIR, relative_path)
+  directory = os.path.dirname(path)
+  if not os.path.isdir(directory):
+    os.makedirs(directory)
+
+  if isinstance(content, unicode):
+    content = content.encode("utf-8")
+  temp_fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+  try:
+    with os.fdopen(temp_fd, "wb") as temp_file:
+      temp_file.write(content)
+    os.chmod(temp_path, 0644)
+    os.rename(temp_path, path)
+  except (IOError, OSError):
+    os.remove(temp_path)
+    raise
+
+
+def WriteStaticVariants(relative_path, variants):
+  """Writes content and its precompressed variants under STATIC_FEED_DIR.
+
+  Args:
+    relative_path: (string) File path relative to STATIC_FEED_DIR.
+    variants: (dict) Content variants, see CompressContent.
+  """
+
+  for content_encoding, content in variants.iteritems():
+    WriteStaticFile(relative_path + STATIC_FILE_SUFFIXES[content_encoding],
+                    content)
+
+
+def PublishStaticAlert(alert):
+  """Writes alert XML and HTML pages under STATIC_FEED_DIR.
+
+  Args:
+    alert: (models.Alert) Alert to publish.
+  """
+
+  WriteStaticVariants("feed/%s.xml" % alert.uuid, GetAlertVariants(alert))
+  WriteStaticFile("feed/%s.html" % alert.uuid, GenerateAlertHtml(alert))
+
+
+def PublishStaticFeeds():
+  """Writes XML and HTML alert feeds under STATIC_FEED_DIR.
+
+  Feeds are rendered in the default language. Concurrent publishers are
+  serialized so that the feed written last is always rendered last. Feeds are
+  rendered bypassing the feed cache since publishers may run in other processes
+  (see publish_static_feeds) than the ones invalidating it.
+  """
+
+  if not os.path.isdir(settings.STATIC_FEED_DIR):
+    os.makedirs(settings.STATIC_FEED_DIR)
+  lock_path = os.path.join(settings.STATIC_FEED_DIR, ".lock")
+  with open(lock_path, "a") as lock_file:
+    fcntl.flock(lock_file, fcntl.LOCK_EX)
+    with translation.override(settings.LANGUAGE_CODE):
+      for feed_type in ("xml", "html"):
+        WriteStaticVariants("feed.%s" % feed_type,
+                            CompressContent(GenerateFeed(feed_type)))
+
+
+def GetNextExpiration():
+  """Returns the earliest expiration date among active alerts or None."""
+  return GetActiveAlerts().aggregate(Min("expires_at"))["expires_at__min"]
+
+
+NameValuePair = collections.namedtuple("NameValuePair", ["name", "value"])
+
+
+class ParsedAlert(object):
+  """Compact parsed alert record.
+
+  Holds ParseAlert dictionary fields in slots, with lists stored as tuples and
+  name/value dictionaries (parameters, event codes, geocodes) as
+  NameValuePair tuples. Fields are accessible both as attributes and as items,
+  so templates can use a record in place of a ParseAlert dictionary.
+  """
+
+  __slots__ = PARSED_ALERT_FIELDS
+
+  def __init__(self, **fields):
+    for name, value in fields.iteritems():
+      setattr(self, name, value)
+
+  @classmethod
+  def FromDict(cls, alert_dict):
+    """Creates record from ParseAlert dictionary."""
+    fields = {}
+    for name, value in alert_dict.iteritems():
+      if name in PARSED_ALERT_PAIR_FIELDS:
+        value = tuple(NameValuePair(pair["name"], pair["value"])
+                      for pair in value)
+      elif isinstance(value, list):
+        value = tuple(value)
+      fields[name] = value
+    return cls(**fields)
+
+  def AsDict(self):
+    """Returns record as ParseAlert dictionary."""
+    alert_dict = {}
+    for name in self:
+      value = getattr(self, name)
+      if name in PARSED_ALERT_PAIR_FIELDS:
+        value = [{"name": pair.name, "value": pair.value} for pair in value]
+      elif isinstance(value, tuple):
+        value = list(value)
+      alert_dict[name] = value
+    return alert_dict
+
+  def get(self, name, default=None):
+    return getattr(self, name, default) if name in self.__slots__ else default
+
+  def __getitem__(self, name):
+    if name in self.__slots__ and hasattr(self, name):
+      return getattr(self, name)
+    raise KeyError(name)
+
+  def __contains__(self, name):
+    return name in self.__slots__ and hasattr(self, name)
+
+  def __iter__(self):
+    return (name for name in self.__slots__ if hasattr(self, name))
+
+
+def ParseCapElements(xml_tree):
+  """Collects CAP element values in a single pass over the XML tree.
+
+  Args:
+    xml_tree: (lxml.etree.Element) CAP alert, info or area element.
+
+  Returns:
+    A tuple of (values, infos) where:
+      values: (dict) CAP element name to the list of values of all such
+          elements in document order. Values are element texts or, for
+          eventCode, parameter and geocode elements, name/value dictionaries.
+      infos: List of dictionaries of the same form, one per <info> block, each
+          with an additional "areas" list of such dictionaries, one per <area>
+          block of the <info>.
+  """
+
+  ns_prefix = "{%s}" % settings.CAP_NS
+  ns_prefix_length = len(ns_prefix)
+  values = collections.defaultdict(list)
+  infos = []
+
+  def Walk(elements, scopes):
+    """Adds values of CAP elements and their descendants to scopes."""
+    for element in elements:
+      tag = element.tag
+      # Skips comments, processing instructions and non-CAP elements (e.g.
+      # the alert signature).
+      if not isinstance(tag, basestring) or not tag.startswith(ns_prefix):
+        continue
+
+      name = tag[ns_prefix_length:]
+      if name in CAP_NAME_VALUE_ELEMENTS:
+        name_element, value_element = element.getchildren()
+        value = {"name": name_element.text, "value": value_element.text}
+      else:
+        value = element.text
+      for scope in scopes:
+        scope[name].append(value)
+
+      if name == "info":
+        info = collections.defaultdict(list, areas=[])
+        infos.append(info)
+        Walk(element, scopes + [info])
+      elif name == "area" and len(scopes) > 1:
+        area = collections.defaultdict(list)
+        scopes[1]["areas"].append(area)
+        Walk(element, scopes + [area])
+      elif name not in CAP_NAME_VALUE_ELEMENTS and len(element):
+        Walk(element, scopes)
+
+  Walk([xml_tree], [values])
+  return values, infos
+
+
 def ParseAlert(xml_string, feed_type, alert_uuid):
   """Parses select fields from the CAP XML file at file_name.
 
   Primary use is intended for populating a feed <entry>.
 
   Note:
-  - This code assumes the input alert XML has only one <info>.
+  - Top level fields of alerts with several <info> blocks are taken from the
+    first block containing them (circles, polys and geocodes are collected
+    from all blocks). Per block fields are available in "infos".
   - The parsed XML does not contain all fields in the CAP specification.
   - The code accepts both complete and partial CAP messages.
 
@@ -117,87 +1068,75 @@ def ParseAlert(xml_string, feed_type, alert_uuid):
     Keys/values corresponding to alert XML attributes or empty dictionary.
   """
 
-  def GetFirstText(xml_element):
-    """Returns the first text item from an XML element."""
-    if xml_element and len(xml_element):
-      return xml_element[0].text
+  def GetFirstText(values, element_name):
+    """Returns the first value of an element."""
+    element_values = values.get(element_name)
+    if element_values:
+      return element_values[0]
     return ""
 
-  def GetAllText(xml_element):
-    """Returns an array of text items from multiple elements."""
-    if xml_element and len(xml_element):
-      return [item.text for item in xml_element]
-    return []
-
-  def GetNameValuePairs(xml_elements):
-    """Returns a list of dictionaries for paired elements."""
-    pair_list = []
-    for xml_element in xml_elements:
-      name_element, value_element = xml_element.getchildren()
-      pair_list.append({
-          "name": name_element.text,
-          "value": value_element.text})
-    return pair_list
-
-  def GetCapElement(element_name, xml_tree):
-    """Extracts elements from CAP XML tree."""
-    element = "//p:" + element_name
-    finder = lxml.etree.XPath(element, namespaces={"p": settings.CAP_NS})
-    return finder(xml_tree)
+  def GetInfoDict(info):
+    """Returns dictionary of <info> block fields."""
+    info_dict = dict((key, GetFirstText(info, element_name))
+                     for key, element_name in CAP_INFO_FIELDS)
+    info_dict["headline"] = GetFirstText(info, "headline")
+    info_dict["sender_name"] = GetFirstText(info, "senderName")
+    info_dict["parameters"] = info.get("parameter", [])
+    info_dict["event_codes"] = info.get("eventCode", [])
+    info_dict["areas"] = [{
+        "area_desc": GetFirstText(area, "areaDesc"),
+        "geocodes": area.get("geocode", []),
+        "circles": area.get("circle", []),
+        "polys": area.get("polygon", []),
+    } for area in info["areas"]]
+    return info_dict
 
   alert_dict = {}
   try:
     xml_tree = lxml.etree.fromstring(xml_string)
-    expires_str = GetFirstText(GetCapElement("expires", xml_tree))
+    values, infos = ParseCapElements(xml_tree)
+    expires_str = GetFirstText(values, "expires")
 
     # Extract the other needed values from the CAP XML.
-    sender = GetFirstText(GetCapElement("sender", xml_tree))
-    sender_name = GetFirstText(GetCapElement("senderName", xml_tree))
+    sender = GetFirstText(values, "sender")
+    sender_name = GetFirstText(values, "senderName")
     name = sender
     if sender_name:
       name = name + ": " + sender_name
 
-    title = GetFirstText(GetCapElement("headline", xml_tree))
+    title = GetFirstText(values, "headline")
     if not title:
       title = ugettext("Alert Message")  # Force a default.
 
     link = "%s%s" % (settings.SITE_URL,
                      reverse("alert", args=[alert_uuid, feed_type]))
-    expires = parser.parse(expires_str) if expires_str else None
-    sent_str = GetFirstText(GetCapElement("sent", xml_tree))
-    sent = parser.parse(sent_str) if sent_str else None
+    expires = ParseCapDateTime(expires_str) if expires_str else None
+    sent_str = GetFirstText(values, "sent")
+    sent = ParseCapDateTime(sent_str) if sent_str else None
 
     alert_dict = {
         "title": title,
-        "event": GetFirstText(GetCapElement("event", xml_tree)),
         "link": link,
-        "web": GetFirstText(GetCapElement("web", xml_tree)),
         "name": name,
         "sender": sender,
         "sender_name": sender_name,
         "expires": expires,
-        "msg_type": GetFirstText(GetCapElement("msgType", xml_tree)),
-        "references": GetFirstText(GetCapElement("references", xml_tree)),
-        "alert_id": GetFirstText(GetCapElement("identifier", xml_tree)),
-        "category": GetFirstText(GetCapElement("category", xml_tree)),
-        "response_type": GetFirstText(GetCapElement("responseType", xml_tree)),
+        "msg_type": GetFirstText(values, "msgType"),
+        "references": GetFirstText(values, "references"),
+        "alert_id": GetFirstText(values, "identifier"),
         "sent": sent,
-        "description": GetFirstText(GetCapElement("description", xml_tree)),
-        "instruction": GetFirstText(GetCapElement("instruction", xml_tree)),
-        "urgency": GetFirstText(GetCapElement("urgency", xml_tree)),
-        "severity": GetFirstText(GetCapElement("severity", xml_tree)),
-        "certainty": GetFirstText(GetCapElement("certainty", xml_tree)),
-        "language": GetFirstText(GetCapElement("language", xml_tree)),
-        "parameters": GetNameValuePairs(GetCapElement("parameter", xml_tree)),
-        "event_codes": GetNameValuePairs(GetCapElement("eventCode", xml_tree)),
-        "area_desc": GetFirstText(GetCapElement("areaDesc", xml_tree)),
-        "geocodes": GetNameValuePairs(GetCapElement("geocode", xml_tree)),
-        "circles": GetAllText(GetCapElement("circle", xml_tree)),
-        "polys": GetAllText(GetCapElement("polygon", xml_tree)),
+        "parameters": values.get("parameter", []),
+        "event_codes": values.get("eventCode", []),
+        "area_desc": GetFirstText(values, "areaDesc"),
+        "geocodes": values.get("geocode", []),
+        "circles": values.get("circle", []),
+        "polys": values.get("polygon", []),
+        "infos": [GetInfoDict(info) for info in infos],
     }
+    for key, element_name in CAP_INFO_FIELDS:
+      alert_dict[key] = GetFirstText(values, element_name)
     # Non-CAP-compliant fields used for message templates.
-    expiresDurationMinutes = GetFirstText(
-        GetCapElement("expiresDurationMinutes", xml_tree))
+    expiresDurationMinutes = GetFirstText(values, "expiresDurationMinutes")
     if expiresDurationMinutes:
       alert_dict["expiresDurationMinutes"] = expiresDurationMinutes
   # We don't expect any invalid XML alerts.
@@ -206,6 +1145,232 @@ def ParseAlert(xml_string, feed_type, alert_uuid):
   return alert_dict
 
 
+def GetParsedAlert(xml_string, feed_type, alert_uuid):
+  """Returns memoized ParseAlert result.
+
+  Parsed alerts are kept in a process-local LRU cache (see
+  PARSED_ALERT_CACHE_SIZE and PARSED_ALERT_CACHE_MAX_BYTES settings) keyed by
+  alert UUID and content digest, so changed content is always parsed again.
+  Cache hits and misses are reported by the preview/polygons/stats view.
+
+  Args:
+    xml_string: (string) Alert XML string.
+    feed_type: (string) Alert feed representation (XML or HTML).
+    alert_uuid: (string) Alert UUID.
+
+  Returns:
+    ParsedAlert. Shared with the cache, must not be modified.
+  """
+
+  if isinstance(xml_string, unicode):
+    xml_string = xml_string.encode("utf-8")
+  cache_key = (alert_uuid, hashlib.sha1(xml_string).hexdigest(), feed_type,
+               translation.get_language())
+  parsed_alert = PARSED_ALERT_CACHE.get(cache_key)
+  if parsed_alert is None:
+    parsed_alert = ParsedAlert.FromDict(
+        ParseAlert(xml_string, feed_type, alert_uuid))
+    PARSED_ALERT_CACHE.set(cache_key, parsed_alert)
+  return parsed_alert
+
+
+def GetAlertFields(xml_tree):
+  """Extracts denormalized Alert model fields from CAP XML tree.
+
+  Note:
+  - This code only extracts fields of the first <info> block. Feed filter
+    values of the other blocks are extracted by GetAlertFilterValues.
+
+  Args:
+    xml_tree: (lxml.etree.Element) Alert XML tree.
+
+  Returns:
+    Dictionary.
+    Keys/values corresponding to models.Alert CAP fields.
+  """
+
+  namespaces = {"p": settings.CAP_NS}
+
+  def FindText(path):
+    """Returns the text of the first element matching path."""
+    return xml_tree.findtext(path, default="", namespaces=namespaces) or ""
+
+  def FindAllText(path):
+    """Returns newline separated text of all elements matching path."""
+    return "\n".join(element.text or "" for element in
+                     xml_tree.iterfind(path, namespaces=namespaces))
+
+  return {
+      "sender": FindText("p:sender")[:255],
+      "sender_name": FindText("p:info/p:senderName")[:255],
+      "msg_type": FindText("p:msgType"),
+      "language": FindText("p:info/p:language"),
+      "category": FindText("p:info/p:category"),
+      "event": FindText("p:info/p:event")[:255],
+      "response_type": FindText("p:info/p:responseType"),
+      "urgency": FindText("p:info/p:urgency"),
+      "severity": FindText("p:info/p:severity"),
+      "certainty": FindText("p:info/p:certainty"),
+      "headline": FindText("p:info/p:headline"),
+      "description": FindText("p:info/p:description"),
+      "instruction": FindText("p:info/p:instruction"),
+      "area_desc": FindText("p:info/p:area/p:areaDesc"),
+      "polygons": FindAllText("p:info/p:area/p:polygon"),
+      "circles": FindAllText("p:info/p:area/p:circle"),
+  }
+
+
+def GetAlertFilterValues(alert_uuid, xml_tree):
+  """Returns feed filter values not held by alert columns.
+
+  Args:
+    alert_uuid: (string) Alert UUID.
+    xml_tree: (lxml.etree.Element) Alert XML tree.
+
+  Returns:
+    List of unsaved models.AlertFilterValue objects of FEED_INFO_FILTERS
+    values other than the first one (see GetAlertFields).
+  """
+
+  namespaces = {"p": settings.CAP_NS}
+  filter_values = []
+  for name in FEED_INFO_FILTERS:
+    path = "p:info/p:%s" % name
+    first = xml_tree.findtext(path, default="", namespaces=namespaces) or ""
+    values = set((element.text or "")[:255] for element in
+                 xml_tree.iterfind(path, namespaces=namespaces))
+    values.discard(first[:255])
+    values.discard("")
+    filter_values.extend(
+        models.AlertFilterValue(alert_uuid=alert_uuid, name=name, value=value)
+        for value in sorted(values))
+  return filter_values
+
+
+def GetAlertEntry(alert, feed_type):
+  """Builds feed entry from denormalized alert fields.
+
+  Unlike ParseAlert this does not parse the alert XML content, except for
+  alerts stored before the fields were added (see backfill_alert_fields).
+
+  Args:
+    alert: (models.Alert) Alert object.
+    feed_type: (string) Alert feed representation (XML or HTML).
+
+  Returns:
+    ParsedAlert with feed entry fields.
+  """
+
+  if not alert.sender:
+    return GetParsedAlert(alert.content, feed_type, alert.uuid)
+
+  name = alert.sender
+  if alert.sender_name:
+    name = name + ": " + alert.sender_name
+
+  return ParsedAlert(
+      title=alert.headline or ugettext("Alert Message"),  # Force a default.
+      event=alert.event,
+      link="%s%s" % (settings.SITE_URL,
+                     reverse("alert", args=[alert.uuid, feed_type])),
+      name=name,
+      sender=alert.sender,
+      sender_name=alert.sender_name,
+      expires=alert.expires_at,
+      msg_type=alert.msg_type,
+      alert_id=alert.uuid,
+      category=alert.category,
+      response_type=alert.response_type,
+      sent=alert.created_at,
+      description=alert.description,
+      instruction=alert.instruction,
+      urgency=alert.urgency,
+      severity=alert.severity,
+      certainty=alert.certainty,
+      language=alert.language,
+      area_desc=alert.area_desc,
+      circles=tuple(alert.circles.splitlines()),
+      polys=tuple(alert.polygons.splitlines()))
+
+
+def ParseReferences(value):
+  """Parses CAP <references> value.
+
+  Args:
+    value: (string) Space separated sender,identifier,sent triplets.
+
+  Returns:
+    List of (sender, identifier, sent) tuples. Sent is a datetime or None if
+    it can't be parsed. Malformed triplets are skipped.
+  """
+
+  references = []
+  for triplet in (value or "").split():
+    parts = triplet.split(",")
+    if len(parts) != 3 or not parts[1]:
+      continue
+    sender, identifier, sent = parts
+    try:
+      sent = ParseCapDateTime(sent)
+    except ValueError:
+      sent = None
+    references.append((sender, identifier, sent))
+  return references
+
+
+def GetAlertReferences(alert_uuid, xml_tree):
+  """Returns alert references from CAP XML tree.
+
+  Args:
+    alert_uuid: (string) Referencing alert UUID.
+    xml_tree: (lxml.etree.Element) Alert XML tree.
+
+  Returns:
+    List of unsaved models.AlertReference objects.
+  """
+
+  value = xml_tree.findtext("p:references", namespaces={"p": settings.CAP_NS})
+  return [models.AlertReference(alert_uuid=alert_uuid,
+                                referenced_uuid=identifier[:255],
+                                sender=sender[:255], sent=sent)
+          for sender, identifier, sent in ParseReferences(value)]
+
+
+def GetAlertHistory(alert_uuid):
+  """Returns update/cancel chain of the alert.
+
+  The chain is walked in both directions: to the alerts referenced by the
+  alert and to the alerts referencing it, one indexed query per step.
+
+  Args:
+    alert_uuid: (string) Alert UUID.
+
+  Returns:
+    List of models.Alert objects ordered by creation time or None if alert
+    does not exist.
+  """
+
+  if not models.Alert.objects.filter(uuid=alert_uuid).exists():
+    return None
+
+  history = set([alert_uuid])
+  frontier = history
+  while frontier:
+    references = models.AlertReference.objects.filter(
+        Q(alert_uuid__in=frontier) | Q(referenced_uuid__in=frontier))
+    linked = set()
+    for referencing, referenced in references.values_list(
+        "alert_uuid", "referenced_uuid"):
+      linked.add(referencing)
+      linked.add(referenced)
+    frontier = linked - history
+    history |= frontier
+
+  # Referenced alerts from other systems are not stored.
+  return list(models.Alert.objects.filter(uuid__in=history).order_by(
+      "created_at", "id"))
+
+
 def SignAlert(xml_tree, username):
   """Sign XML with user key/certificate.
 
@@ -215,40 +1380,41 @@ def SignAlert(xml_tree, username):
 
   Returns:
     String.
-    Signed alert XML tree if your has key/certificate pair
+    Signed alert XML tree if user has key/certificate pair
     Unchanged XML tree otherwise.
   """
 
-  if not XMLSEC_DEFINED:
+  if not signing.XMLSEC_DEFINED:
     return xml_tree
 
-  key_path = os.path.join(settings.CREDENTIALS_DIR, username + ".key")
-  cert_path = os.path.join(settings.CREDENTIALS_DIR, username + ".cert")
+  if settings.SIGNING_PROCESSES:
+    signed_xml_tree = signing.SignInPool(xml_tree, username)
+    return xml_tree if signed_xml_tree is None else signed_xml_tree
 
-  try:
-    signed_xml_tree = copy.deepcopy(xml_tree)
-    xmlsec.add_enveloped_signature(signed_xml_tree, pos=-1)
-    xmlsec.sign(signed_xml_tree, key_path, cert_path)
-    return signed_xml_tree
-  except (IOError, xmlsec.exceptions.XMLSigException):
-    return xml_tree
+  # Signs in the request thread with cached keys (see signing.LoadKey). The
+  # tree is signed in place and left unchanged if it can't be signed.
+  signing.Sign(xml_tree, username)
+  return xml_tree
 
 
-def CreateAlert(xml_string, username):
-  """Creates alert signed by userame from provided XML string.
+def PrepareAlert(xml_string, username, msg_id=None):
+  """Validates and signs alert from provided XML string without saving it.
 
   Args:
     xml_string: (string) XML content.
     username: (string) Username of the alert author.
+    msg_id: (string) Alert ID (UUID) to assign, a new one if None.
 
   Returns:
-    A tuple of (msg_id, valid, error) where:
-      msg_id: (string) Unique alert ID (UUID)
-      valid: (bool) Whether alert has valid XML or not.
+    A tuple of (alert, references, filter_values, error) where:
+      alert: (models.Alert) Unsaved alert or None if XML is invalid.
+      references: (list) Unsaved models.AlertReference objects of the alerts
+          updated by the alert.
+      filter_values: (list) Unsaved models.AlertFilterValue objects, see
+          GetAlertFilterValues.
       error: (string) Error message in case XML is invalid.
   """
 
-  msg_id = None
   valid = False
 
   try:
@@ -256,65 +1422,163 @@ def CreateAlert(xml_string, username):
     xml_string = re.sub("> +<", "><", xml_string)
     # Now parse into etree and validate.
     xml_tree = lxml.etree.fromstring(xml_string)
-
-    with open(os.path.join(settings.SCHEMA_DIR,
-                           settings.CAP_SCHEMA_FILE), "r") as schema_file:
-      schema_string = schema_file.read()
-    xml_schema = lxml.etree.XMLSchema(lxml.etree.fromstring(schema_string))
-    valid = xml_schema.validate(xml_tree)
-    error = xml_schema.error_log.last_error
+    valid, error = schemas.Validate(xml_tree)
   except lxml.etree.XMLSyntaxError as e:
     error = "Malformed XML: %s" % e
 
-  if valid:
-    msg_id = str(uuid.uuid4())
-    # Assign <identifier> and <sender> values.
-    find_identifier = lxml.etree.XPath("//p:identifier",
-                                       namespaces={"p": settings.CAP_NS})
-    identifier = find_identifier(xml_tree)[0]
-    identifier.text = msg_id
-
-    # Set default <web> field if one was not filled by user.
-    find_web = lxml.etree.XPath("//p:info/p:web",
-                                namespaces={"p": settings.CAP_NS})
-    web = find_web(xml_tree)[0]
-    if web.text == "pending":
-      web.text = "%s%s" % (settings.SITE_URL,
-                           reverse("alert", args=[msg_id, "html"]))
-
-    find_sender = lxml.etree.XPath("//p:sender",
-                                   namespaces={"p": settings.CAP_NS})
-    sender = find_sender(xml_tree)[0]
-    sender.text = username + "@" + settings.SITE_DOMAIN
-
-    find_sent = lxml.etree.XPath("//p:sent",
+  if not valid:
+    return (None, [], [], error)
+
+  msg_id = msg_id or str(uuid.uuid4())
+  # Assign <identifier> and <sender> values.
+  find_identifier = lxml.etree.XPath("//p:identifier",
+                                     namespaces={"p": settings.CAP_NS})
+  identifier = find_identifier(xml_tree)[0]
+  identifier.text = msg_id
+
+  # Set default <web> field if one was not filled by user.
+  find_web = lxml.etree.XPath("//p:info/p:web",
+                              namespaces={"p": settings.CAP_NS})
+  web = find_web(xml_tree)[0]
+  if web.text == "pending":
+    web.text = "%s%s" % (settings.SITE_URL,
+                         reverse("alert", args=[msg_id, "html"]))
+
+  find_sender = lxml.etree.XPath("//p:sender",
                                  namespaces={"p": settings.CAP_NS})
-    sent = find_sent(xml_tree)[0]
-
-    find_expires = lxml.etree.XPath("//p:expires",
-                                    namespaces={"p": settings.CAP_NS})
-    expires = find_expires(xml_tree)[0]
-
-    find_references = lxml.etree.XPath("//p:references",
-                                       namespaces={"p": settings.CAP_NS})
-    has_references = len(find_references(xml_tree)) != 0
-
-    # Sign the XML tree.
-    xml_tree = SignAlert(xml_tree, username)
-
-    # Re-serialize as string.
-    signed_xml_string = lxml.etree.tostring(xml_tree, pretty_print=False)
-    alert_obj = models.Alert()
-    alert_obj.uuid = msg_id
-    alert_obj.created_at = sent.text
-    alert_obj.expires_at = expires.text
-    alert_obj.content = signed_xml_string
-    alert_obj.save()
-
-    if has_references:
-      for element in find_references(xml_tree):
-        updated_alert_uuid = element.text.split(",")[1]
-        models.Alert.objects.filter(
-            uuid=updated_alert_uuid).update(updated=True)
-
-  return (msg_id, valid, error)
+  sender = find_sender(xml_tree)[0]
+  sender.text = username + "@" + settings.SITE_DOMAIN
+
+  find_sent = lxml.etree.XPath("//p:sent",
+                               namespaces={"p": settings.CAP_NS})
+  sent = find_sent(xml_tree)[0]
+
+  find_expires = lxml.etree.XPath("//p:expires",
+                                  namespaces={"p": settings.CAP_NS})
+  expires = find_expires(xml_tree)[0]
+
+  references = GetAlertReferences(msg_id, xml_tree)
+  filter_values = GetAlertFilterValues(msg_id, xml_tree)
+
+  # Sign the XML tree.
+  xml_tree = SignAlert(xml_tree, username)
+
+  # Re-serialize as string.
+  signed_xml_string = lxml.etree.tostring(xml_tree, pretty_print=False)
+  alert_obj = models.Alert()
+  alert_obj.uuid = msg_id
+  alert_obj.created_at = ParseCapDateTime(sent.text)
+  alert_obj.expires_at = ParseCapDateTime(expires.text)
+  alert_obj.content = signed_xml_string
+  for field_name, value in GetAlertFields(xml_tree).iteritems():
+    setattr(alert_obj, field_name, value)
+  return (alert_obj, references, filter_values, None)
+
+
+def SaveAlerts(alerts, references, filter_values=None):
+  """Saves prepared alerts, their references and marks updated alerts.
+
+  Alerts, references and filter values are inserted with a query each and
+  updated alerts are marked with another one, all in a single transaction.
+
+  Args:
+    alerts: (list) Unsaved models.Alert objects, see PrepareAlert.
+    references: (list) Unsaved models.AlertReference objects of the saved
+        alerts.
+    filter_values: (list) Unsaved models.AlertFilterValue objects of the
+        saved alerts.
+  """
+
+  with transaction.atomic():
+    # Alerts are stamped within the transaction, see GetAlertChanges.
+    now = timezone.now()
+    for alert in alerts:
+      alert.last_modified_at = now
+    models.Alert.objects.bulk_create(alerts)
+    if filter_values:
+      models.AlertFilterValue.objects.bulk_create(filter_values)
+    if references:
+      models.AlertReference.objects.bulk_create(references)
+      models.Alert.objects.filter(
+          uuid__in=set(reference.referenced_uuid for reference in references)
+      ).update(updated=True, last_modified_at=now)
+
+
+def PublishAlerts(alerts):
+  """Invalidates feeds and notifies subscribers about saved alerts.
+
+  Args:
+    alerts: (list) Saved models.Alert objects.
+  """
+
+  InvalidateFeeds()
+  for alert in alerts:
+    GetAlertVariants(alert)
+  if settings.STATIC_FEED_DIR:
+    try:
+      for alert in alerts:
+        PublishStaticAlert(alert)
+      PublishStaticFeeds()
+    except (IOError, OSError) as e:
+      logging.exception(e)
+  for alert in alerts:
+    notifications.PublishAlert(alert)
+  websub.PublishTopic(GetFeedUrl("xml"), lambda: GetFeed("xml"))
+
+
+def CreateAlert(xml_string, username, msg_id=None):
+  """Creates alert signed by userame from provided XML string.
+
+  Args:
+    xml_string: (string) XML content.
+    username: (string) Username of the alert author.
+    msg_id: (string) Alert ID (UUID) to assign, a new one if None.
+
+  Returns:
+    A tuple of (msg_id, valid, error) where:
+      msg_id: (string) Unique alert ID (UUID)
+      valid: (bool) Whether alert has valid XML or not.
+      error: (string) Error message in case XML is invalid.
+  """
+  return CreateAlerts([xml_string], username, msg_ids=[msg_id])[0]
+
+
+def CreateAlerts(xml_strings, username, msg_ids=None):
+  """Creates alerts signed by userame from provided XML strings.
+
+  Alerts are validated and signed in parallel (see ALERT_BATCH_THREADS), then
+  all valid alerts are saved in a single transaction (see SaveAlerts).
+
+  Args:
+    xml_strings: (list) XML contents.
+    username: (string) Username of the alerts author.
+    msg_ids: (list) Alert IDs to assign, one per XML string. See CreateAlert.
+
+  Returns:
+    List of (msg_id, valid, error) tuples, one per XML string. See CreateAlert.
+  """
+
+  if msg_ids is None:
+    msg_ids = [None] * len(xml_strings)
+  if len(xml_strings) > 1 and settings.ALERT_BATCH_THREADS > 1:
+    pool = ThreadPool(min(settings.ALERT_BATCH_THREADS, len(xml_strings)))
+    try:
+      prepared = pool.map(lambda args: PrepareAlert(args[0], username, args[1]),
+                          zip(xml_strings, msg_ids))
+    finally:
+      pool.close()
+  else:
+    prepared = [PrepareAlert(xml_string, username, msg_id)
+                for xml_string, msg_id in zip(xml_strings, msg_ids)]
+
+  alerts = [alert for alert, _, _, _ in prepared if alert]
+  if alerts:
+    SaveAlerts(alerts,
+               [reference for _, references, _, _ in prepared
+                for reference in references],
+               [filter_value for _, _, filter_values, _ in prepared
+                for filter_value in filter_values])
+    PublishAlerts(alerts)
+
+  return [(alert.uuid if alert else None, bool(alert), error)
+          for alert, _, _, error in prepared]
@@ -3,28 +3,50 @@
 __author__ = "Arkadii Yakovets (arcadiy@google.com)"
 
 import json
+import math
+import time
 
-from bs4 import BeautifulSoup
+from CAPCollector import auth
+from core import ingest
 from core import models
+from core import notifications
+from core import polygons
 from core import utils
 from django.conf import settings
 from django.contrib.auth import authenticate
 from django.contrib.auth.decorators import login_required
 from django.core.exceptions import PermissionDenied
+from django.core.urlresolvers import reverse
+from django.db import connection
 from django.http import Http404
 from django.http import HttpResponse
 from django.http import HttpResponseBadRequest
-from django.template.loader import render_to_string
+from django.http import StreamingHttpResponse
+from django.utils import translation
+from django.utils.cache import patch_cache_control
+from django.utils.cache import patch_vary_headers
 from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from django.views.generic import TemplateView
 from django.views.generic import View
 
 
 class FeedView(View):
-  """Feed representation (either XML or HTML)."""
+  """Feed representation (either XML or HTML).
+
+  Both feeds and individual alerts support conditional GET requests
+  (If-None-Match/If-Modified-Since) which are answered with 304 responses
+  without rendering. Materialized feeds and alert XML are served
+  precompressed according to Accept-Encoding.
+  """
+
+  # Stored alerts never change, so their XML can be cached for a year.
+  ALERT_XML_MAX_AGE = 365 * 24 * 60 * 60
 
   def get(self, request, *args, **kwargs):
     feed_type = kwargs["feed_type"]
+    content_encoding = utils.ChooseContentEncoding(
+        request.META.get("HTTP_ACCEPT_ENCODING", ""))
 
     if "alert_id" in kwargs:
       try:
@@ -33,16 +55,154 @@ class FeedView(View):
         raise Http404
 
       if feed_type == "html":
-        context = {
-            "alert": utils.ParseAlert(alert.content, feed_type, alert.uuid)
-        }
-        response = render_to_string("core/alert.html.tmpl", context)
-        return HttpResponse(BeautifulSoup(response, feed_type).prettify())
+        content_encoding = "identity"
+      response = condition(
+          etag_func=lambda *unused: utils.GetAlertETag(alert, feed_type,
+                                                       content_encoding),
+          last_modified_func=lambda *unused: alert.created_at)(
+              self.get_alert)(request, alert, feed_type, content_encoding)
+      if feed_type == "xml":
+        patch_cache_control(response, public=True,
+                            max_age=self.ALERT_XML_MAX_AGE)
+        patch_vary_headers(response, ("Accept-Encoding",))
+      return response
+
+    try:
+      params = utils.GetFeedParams(request.GET)
+    except ValueError:
+      return HttpResponseBadRequest()
+
+    if settings.FEED_STREAMING:
+      content_encoding = "identity"
+    last_modified = utils.GetFeedLastModified()
+    response = condition(
+        etag_func=lambda *unused: utils.GetFeedETag(
+            feed_type, last_modified, params, content_encoding),
+        last_modified_func=lambda *unused: last_modified)(
+            self.get_feed)(request, feed_type, params, content_encoding)
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response
+
+  def get_alert(self, request, alert, feed_type, content_encoding):
+    if feed_type == "html":
+      return HttpResponse(utils.GenerateAlertHtml(alert))
+
+    return self.get_encoded_response(utils.GetAlertVariants(alert),
+                                     content_encoding, "text/xml")
+
+  def get_feed(self, request, feed_type, params, content_encoding):
+    if settings.FEED_STREAMING:
+      return StreamingHttpResponse(
+          utils.StreamFeed(feed_type, translation.get_language(), params),
+          content_type="text/%s" % feed_type)
+
+    return self.get_encoded_response(
+        utils.GetFeedVariants(feed_type, params), content_encoding,
+        "text/%s" % feed_type)
+
+  def get_encoded_response(self, variants, content_encoding, content_type):
+    response = HttpResponse(variants[content_encoding],
+                            content_type=content_type)
+    if content_encoding != "identity":
+      response["Content-Encoding"] = content_encoding
+    return response
+
+
+class FeedChangesView(View):
+  """Alerts created, superseded or expired since a changes token."""
+
+  def get(self, request, *args, **kwargs):
+    since = request.GET.get("since")
+    if since:
+      try:
+        since = utils.DecodeChangesToken(since)
+      except ValueError:
+        return HttpResponseBadRequest()
+
+    return HttpResponse(utils.GenerateChangesFeed(since),
+                        content_type="text/xml")
+
+
+class AlertHistoryView(View):
+  """Update/cancel chain of an alert."""
+
+  def get(self, request, *args, **kwargs):
+    history = utils.GetAlertHistory(kwargs["alert_id"])
+    if history is None:
+      raise Http404
+
+    response = [{
+        "uuid": alert.uuid,
+        "msg_type": alert.msg_type,
+        "sent": utils.FormatDateTime(alert.created_at),
+        "sender": alert.sender,
+        "updated": alert.updated,
+        "link": "%s%s" % (settings.SITE_URL,
+                          reverse("alert", args=[alert.uuid, "xml"])),
+    } for alert in history]
+    return HttpResponse(json.dumps(response), content_type="application/json")
+
+
+class AlertNotificationsView(View):
+  """New alert notifications pushed to subscribers.
+
+  Serves Server-Sent Events to clients accepting text/event-stream (e.g.
+  EventSource) and long-poll JSON responses to all other clients.
+  """
+
+  SSE_KEEPALIVE_INTERVAL = 15
+  SSE_RETRY_MS = 3000
+
+  def get(self, request, *args, **kwargs):
+    if not settings.ALERT_NOTIFICATIONS_ENABLED:
+      raise Http404
+
+    last_event_id = (request.META.get("HTTP_LAST_EVENT_ID") or
+                     request.GET.get("last_event_id"))
+    try:
+      if last_event_id is not None:
+        last_event_id = int(last_event_id)
+      timeout = float(request.GET.get(
+          "timeout", settings.ALERT_NOTIFICATIONS_LONG_POLL_TIMEOUT))
+    except ValueError:
+      return HttpResponseBadRequest()
+    if math.isnan(timeout) or math.isinf(timeout):
+      return HttpResponseBadRequest()
 
-      return HttpResponse(alert.content, content_type="text/xml")
+    subscription = notifications.GetNotifier().subscribe(last_event_id)
+
+    # Waiting subscribers must not hold a database connection.
+    if not connection.in_atomic_block:
+      connection.close()
+
+    if "text/event-stream" in request.META.get("HTTP_ACCEPT", ""):
+      response = StreamingHttpResponse(self.stream_events(subscription),
+                                       content_type="text/event-stream")
+      response["Cache-Control"] = "no-cache"
+      # Disable nginx proxy buffering.
+      response["X-Accel-Buffering"] = "no"
+      return response
+
+    timeout = min(max(timeout, 0),
+                  settings.ALERT_NOTIFICATIONS_LONG_POLL_TIMEOUT)
+    events = subscription.wait(timeout)
+    response = {
+        "events": [dict(event, id=event_id) for event_id, event in events],
+        "last_event_id": subscription.last_event_id,
+    }
+    return HttpResponse(json.dumps(response), content_type="application/json")
 
-    return HttpResponse(utils.GenerateFeed(feed_type),
-                        content_type="text/%s" % feed_type)
+  def stream_events(self, subscription):
+    yield "retry: %d\n\n" % self.SSE_RETRY_MS
+    deadline = time.time() + settings.ALERT_NOTIFICATIONS_SSE_DURATION
+    while time.time() < deadline:
+      events = subscription.wait(
+          min(self.SSE_KEEPALIVE_INTERVAL, deadline - time.time()))
+      for event_id, event in events:
+        yield "id: %d\nevent: alert\ndata: %s\n\n" % (event_id,
+                                                        json.dumps(event))
+      if not events:
+        yield ": keepalive\n\n"
 
 
 class AlertTemplateView(View):
@@ -71,7 +231,11 @@ class AlertTemplateView(View):
 
 
 class GeocodePolygonPreviewView(View):
-  """Get geocode preview polygons."""
+  """Get geocode preview polygons.
+
+  Polygons are served as CAP <polygon> elements or, to clients accepting
+  polygons.POLYLINE_CONTENT_TYPE, as encoded polylines.
+  """
 
   def post(self, request, *args, **kwargs):
     geocodes = request.POST.get("geocodes")
@@ -80,21 +244,81 @@ class GeocodePolygonPreviewView(View):
 
     try:
       geocodes = json.loads(geocodes)
+      tolerance = float(request.POST.get("tolerance", 0))
+      if request.POST.get("zoom"):
+        zoom = int(request.POST["zoom"])
+        if not 0 <= zoom <= polygons.MAX_ZOOM:
+          return HttpResponseBadRequest()
+        tolerance = polygons.GetZoomTolerance(zoom)
     except ValueError:
       return HttpResponseBadRequest()
+    if not 0 <= tolerance < float("inf"):
+      # Comparisons with nan are false, so nan is rejected too.
+      return HttpResponseBadRequest()
 
     model = models.GeocodePreviewPolygon
     keys = [model.make_key(geocode['valueName'], geocode['value'])
             for geocode in geocodes]
 
+    # Clients accepting encoded polylines get them instead of CAP polygons.
+    if polygons.POLYLINE_CONTENT_TYPE in request.META.get("HTTP_ACCEPT", ""):
+      result = [{'id': polygon_id, 'polylines': polylines}
+                for polygon_id, polylines in polygons.GetPolygonStore()
+                .get_many(keys, tolerance, encoded=True)]
+      content_type = polygons.POLYLINE_CONTENT_TYPE
+    else:
+      result = [{'id': polygon_id, 'content': content} for polygon_id, content
+                in polygons.GetPolygonStore().get_many(keys, tolerance)]
+      content_type = "application/json"
+    response = HttpResponse(json.dumps(result), content_type=content_type)
+    patch_vary_headers(response, ["Accept"])
+    return response
+
+
+class GeocodePolygonPreviewSearchView(View):
+  """Find geocode preview polygons in a map area.
+
+  Returns IDs of preview polygons with bounding box intersecting the "bbox"
+  parameter (min_lat,min_lng,max_lat,max_lng) or containing the "point"
+  parameter (lat,lng).
+  """
+
+  def get(self, request, *args, **kwargs):
     try:
-      result = [{'id': p.id, 'content': p.content}
-                for p in model.objects.filter(pk__in=keys)]
-    except model.DoesNotExist:
-      raise Http404
+      if "bbox" in request.GET:
+        box = polygons.ParseCoordinates(request.GET["bbox"], 4)
+        if box[0] > box[2] or box[1] > box[3]:
+          return HttpResponseBadRequest()
+        keys = polygons.GetPolygonStore().search(box)
+      elif "point" in request.GET:
+        lat, lng = polygons.ParseCoordinates(request.GET["point"], 2)
+        keys = polygons.GetPolygonStore().search_point(lat, lng)
+      else:
+        return HttpResponseBadRequest()
+    except ValueError:
+      return HttpResponseBadRequest()
+
+    result = []
+    for key in keys:
+      value_name, _, value = key.partition("|")
+      result.append({"id": key, "valueName": value_name, "value": value})
     return HttpResponse(json.dumps(result), content_type="application/json")
 
 
+class GeocodePolygonPreviewStatsView(View):
+  """Geocode preview polygon store statistics.
+
+  Also reports the parsed alert cache statistics of the serving process as
+  "parsed_alerts" (see utils.GetParsedAlert).
+  """
+
+  @method_decorator(login_required)
+  def get(self, request, *args, **kwargs):
+    stats = polygons.GetPolygonStore().stats()
+    stats["parsed_alerts"] = utils.PARSED_ALERT_CACHE.stats()
+    return HttpResponse(json.dumps(stats), content_type="application/json")
+
+
 class IndexView(TemplateView):
   template_name = "index.html.tmpl"
 
@@ -116,26 +340,67 @@ class IndexView(TemplateView):
     return context
 
 
-class PostView(View):
-  """Handles new alert creation."""
+class AlertCreatorView(View):
+  """Base class of views used by alert creators.
+
+  Requests are authenticated with an API token ("Authorization: Token <token>"
+  header, see auth.create_api_token) or with a session login (and uid and
+  password POST parameters for alert posts).
+  """
+
+  token_user = None
+
+  def dispatch(self, request, *args, **kwargs):
+    token = auth.get_request_token(request)
+    if token is None:
+      return login_required(super(AlertCreatorView, self).dispatch)(
+          request, *args, **kwargs)
+
+    self.token_user = auth.authenticate_token(token)
+    if not self.token_user or not auth.is_alert_creator(self.token_user):
+      raise PermissionDenied
+    return super(AlertCreatorView, self).dispatch(request, *args, **kwargs)
+
+  def get_alert_creator(self, request):
+    """Returns username of the alert creator posting the request.
+
+    Returns None if the request has no credentials and raises PermissionDenied
+    unless the user may release alerts.
+    """
+    if self.token_user:
+      return self.token_user.username
 
-  @method_decorator(login_required)
-  def post(self, request, *args, **kwargs):
     username = request.POST.get("uid")
     password = request.POST.get("password")
-    xml_string = request.POST.get("xml")
+    if not username or not password:
+      return None
+    user = authenticate(username=username, password=password)
+    if not user or not auth.is_alert_creator(user):
+      raise PermissionDenied
+    return username
+
+
+class PostView(AlertCreatorView):
+  """Handles new alert creation."""
 
-    if not username or not password or not xml_string:
+  def post(self, request, *args, **kwargs):
+    xml_string = request.POST.get("xml")
+    if not xml_string:
       return HttpResponseBadRequest()
 
-    user = authenticate(username=username, password=password)
-    alert_id = None
-    error_message = ""
-    is_valid = False
+    username = self.get_alert_creator(request)
+    if not username:
+      return HttpResponseBadRequest()
 
-    if (not user or
-        not user.groups.filter(name=settings.ALERT_CREATORS_GROUP_NAME)):
-      raise PermissionDenied
+    if settings.ALERT_INGEST_ASYNC:
+      job = ingest.QueueAlert(xml_string, username)
+      status_url = reverse("ingest_job", args=[job.job_id])
+      response = HttpResponse(json.dumps({
+          "job_id": job.job_id,
+          "status_url": status_url,
+      }), content_type="application/json", status=202)
+      response["Location"] = status_url
+      return response
 
     alert_id, is_valid, error_message = utils.CreateAlert(xml_string, username)
     response = {
@@ -145,3 +410,50 @@ class PostView(View):
     }
 
     return HttpResponse(json.dumps(response), content_type="application/json")
+
+
+class IngestJobView(AlertCreatorView):
+  """Status of an alert queued by PostView (see ALERT_INGEST_ASYNC)."""
+
+  def get(self, request, *args, **kwargs):
+    user = self.token_user or request.user
+    try:
+      job = models.IngestJob.objects.get(job_id=kwargs["job_id"],
+                                         username=user.username)
+    except models.IngestJob.DoesNotExist:
+      raise Http404
+
+    response = {
+        "job_id": job.job_id,
+        "status": job.status,
+        "error": job.error,
+        "uuid": job.alert_uuid,
+        "valid": job.valid,
+    }
+    return HttpResponse(json.dumps(response), content_type="application/json")
+
+
+class BatchPostView(PostView):
+  """Handles creation of several alerts at once.
+
+  Accepts up to ALERT_BATCH_MAX_SIZE "xml" values and responds with a list of
+  per alert results in the same order.
+  """
+
+  def post(self, request, *args, **kwargs):
+    xml_strings = request.POST.getlist("xml")
+    if not xml_strings or len(xml_strings) > settings.ALERT_BATCH_MAX_SIZE:
+      return HttpResponseBadRequest()
+
+    username = self.get_alert_creator(request)
+    if not username:
+      return HttpResponseBadRequest()
+
+    response = [{
+        "error": error_message,
+        "uuid": alert_id,
+        "valid": is_valid,
+    } for alert_id, is_valid, error_message in utils.CreateAlerts(
+        xml_strings, username)]
+
+    return HttpResponse(json.dumps(response), content_type="application/json")
@@ -0,0 +1,217 @@
+"""WebSub (PubSubHubbub) publisher for alert feeds.
+
+When an alert is published the feed topic is queued for delivery. Worker
+threads pick topics from the bounded queue in batches and
+  - ping the hub configured by WEBSUB_HUB_URL so that it fetches the feed and
+    distributes it to its subscribers, and
+  - distribute the feed content directly to callback URLs configured by
+    WEBSUB_SUBSCRIBERS, signed with the subscriber secret (X-Hub-Signature).
+Failed requests are retried with exponential backoff. Publishing never blocks
+the request thread: topics are dropped (and logged) when the queue is full.
+"""
+
+import hashlib
+import hmac
+import logging
+import Queue
+import threading
+import time
+import urllib
+import urllib2
+
+from django.conf import settings
+from django.db import connection
+
+
+_publisher = None
+_publisher_lock = threading.Lock()
+
+
+def GetPublisher():
+  """Returns process-wide publisher configured by settings.
+
+  Returns:
+    Publisher or None if neither hub nor subscribers are configured.
+  """
+  global _publisher
+  with _publisher_lock:
+    if _publisher is None and (settings.WEBSUB_HUB_URL or
+                               settings.WEBSUB_SUBSCRIBERS):
+      _publisher = Publisher(settings.WEBSUB_HUB_URL,
+                             settings.WEBSUB_SUBSCRIBERS,
+                             workers=settings.WEBSUB_WORKERS,
+                             queue_size=settings.WEBSUB_QUEUE_SIZE,
+                             max_retries=settings.WEBSUB_MAX_RETRIES)
+    return _publisher
+
+
+def PublishTopic(topic_url, get_content):
+  """Queues topic update notification if WebSub publishing is configured.
+
+  Args:
+    topic_url: (string) Updated topic (feed) URL.
+    get_content: (callable) Returns current topic content.
+  """
+  publisher = GetPublisher()
+  if publisher:
+    publisher.publish(topic_url, get_content)
+
+
+def GetSignature(secret, content):
+  """Returns X-Hub-Signature header value for content.
+
+  Args:
+    secret: (string) Subscriber secret.
+    content: (string) Distributed content bytes.
+
+  Returns:
+    String.
+  """
+  if isinstance(secret, unicode):
+    secret = secret.encode("utf-8")
+  return "sha1=" + hmac.new(secret, content, hashlib.sha1).hexdigest()
+
+
+class Publisher(object):
+  """Delivers topic update notifications from worker threads."""
+
+  def __init__(self, hub_url=None, subscribers=(), workers=2, queue_size=100,
+               batch_size=10, batch_interval=0.5, max_retries=3,
+               retry_delay=1.0, timeout=10):
+    """Initializes publisher.
+
+    Args:
+      hub_url: (string) Hub URL to ping on topic updates.
+      subscribers: (list) List of (callback_url, secret) tuples. Secret may be
+          None for unsigned content distribution.
+      workers: (int) Number of worker threads.
+      queue_size: (int) Maximum number of queued topic updates.
+      batch_size: (int) Maximum number of topic updates delivered at once.
+      batch_interval: (float) Time in seconds to wait for more updates to
+          batch with the first one.
+      max_retries: (int) Maximum number of retries of a failed request.
+      retry_delay: (float) Delay in seconds before the first retry.
+      timeout: (float) Request timeout in seconds.
+    """
+    self.hub_url = hub_url
+    self.subscribers = subscribers
+    self.workers = workers
+    self.queue = Queue.Queue(maxsize=queue_size)
+    self.batch_size = batch_size
+    self.batch_interval = batch_interval
+    self.max_retries = max_retries
+    self.retry_delay = retry_delay
+    self.timeout = timeout
+    self.threads = []
+    self.threads_lock = threading.Lock()
+
+  def publish(self, topic_url, get_content):
+    """Queues topic update notification.
+
+    Args:
+      topic_url: (string) Updated topic URL.
+      get_content: (callable) Returns current topic content.
+
+    Returns:
+      Boolean. Whether the update was queued.
+    """
+    self.start()
+    try:
+      self.queue.put_nowait((topic_url, get_content))
+    except Queue.Full:
+      logging.warning("WebSub queue is full, dropped update of %s", topic_url)
+      return False
+    return True
+
+  def start(self):
+    """Starts worker threads unless already started."""
+    with self.threads_lock:
+      while len(self.threads) < self.workers:
+        thread = threading.Thread(target=self.work, name="websub")
+        thread.daemon = True
+        thread.start()
+        self.threads.append(thread)
+
+  def join(self):
+    """Blocks until all queued topic updates are delivered."""
+    self.queue.join()
+
+  def work(self):
+    """Worker thread loop."""
+    while True:
+      batch = [self.queue.get()]
+      deadline = time.time() + self.batch_interval
+      while len(batch) < self.batch_size:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+          break
+        try:
+          batch.append(self.queue.get(timeout=remaining))
+        except Queue.Empty:
+          break
+
+      try:
+        # Several updates of the same topic are delivered once.
+        self.deliver(dict(batch))
+      except Exception as e:  # pylint: disable=broad-except
+        logging.exception(e)
+      finally:
+        # Content callables may have used this thread's database connection.
+        connection.close()
+        for _ in batch:
+          self.queue.task_done()
+
+  def deliver(self, topics):
+    """Delivers topic updates to the hub and subscribers.
+
+    Args:
+      topics: (dict) Mapping of topic URL to content callable.
+    """
+    if self.hub_url:
+      data = urllib.urlencode([("hub.mode", "publish")] +
+                              [("hub.url", topic) for topic in sorted(topics)])
+      self.post(self.hub_url, data,
+                {"Content-Type": "application/x-www-form-urlencoded"})
+
+    if not self.subscribers:
+      return
+    for topic_url, get_content in sorted(topics.iteritems()):
+      content = get_content()
+      # Rendered feeds are unicode, the same bytes are signed and sent.
+      if isinstance(content, unicode):
+        content = content.encode("utf-8")
+      links = ["<%s>; rel=\"self\"" % topic_url]
+      if self.hub_url:
+        links.append("<%s>; rel=\"hub\"" % self.hub_url)
+      for callback_url, secret in self.subscribers:
+        headers = {
+            "Content-Type": "application/atom+xml",
+            "Link": ", ".join(links),
+        }
+        if secret:
+          headers["X-Hub-Signature"] = GetSignature(secret, content)
+        self.post(callback_url, content, headers)
+
+  def post(self, url, data, headers):
+    """Posts data to URL retrying on failures.
+
+    Args:
+      url: (string) Request URL.
+      data: (string) Request body.
+      headers: (dict) Request headers.
+
+    Returns:
+      Boolean. Whether the request succeeded.
+    """
+    for attempt in range(self.max_retries + 1):
+      if attempt:
+        time.sleep(self.retry_delay * 2 ** (attempt - 1))
+      try:
+        urllib2.urlopen(urllib2.Request(url, data, headers),
+                        timeout=self.timeout).close()
+        return True
+      except (urllib2.URLError, IOError) as e:
+        logging.warning("WebSub request to %s failed: %s", url, e)
+    logging.error("WebSub request to %s failed after %d retries", url,
+                  self.max_retries)
+    return False
@@ -0,0 +1,20 @@
+# Gunicorn config example for running CAPTools application.
+# Used by example/supervisor.example.conf, see
+# http://docs.gunicorn.org/en/stable/settings.html for other settings.
+
+# Alert notification subscribers (see ALERT_NOTIFICATIONS_ENABLED setting)
+# keep a worker busy while connected. Use asynchronous workers when they are
+# enabled (requires the gevent package):
+# worker_class = "gevent"
+
+
+def post_worker_init(worker):
+  """Starts alert ingestion threads in each worker process.
+
+  With --preload the application is loaded in the master process, whose
+  threads would not survive forking the workers.
+  """
+  from django.conf import settings
+  if settings.ALERT_INGEST_ASYNC:
+    from core import ingest
+    ingest.GetIngester().start()
@@ -141,6 +141,9 @@ echo "PROD_FROM_DEV_DATABASE_PASSWORD=''" >> ./sensitive.py
 # Sync Django models to databse. This involves superuser creation.
 $PYTHON manage.py syncdb
 
+# Create the database table of the shared cache (see CACHES setting).
+$PYTHON manage.py createcachetable
+
 # Compile translation messages to .mo files.
 $PYTHON manage.py compilemessages
 
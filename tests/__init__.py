@@ -8,6 +8,7 @@ import re
 from django.conf import settings
 from django.contrib.auth.models import Group
 from django.contrib.auth.models import User
+from django.core.cache import caches
 from django.test import Client
 from django.test import LiveServerTestCase
 from django.test import TestCase
@@ -29,6 +30,7 @@ class TestBase(TestCase):
   TEST_USER_PASSWORD = "test_password"
 
   def setUp(self):
+    caches[settings.FEED_CACHE_ALIAS].clear()
     self.test_user = User.objects.get(username=self.TEST_USER_LOGIN)
 
 
@@ -3,6 +3,9 @@
 __author__ = "shakusa@google.com (Steve Hakusa)"
 
 from django import test
+from django.contrib.auth.models import Group
+from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.forms import ValidationError
 
 from CAPCollector import auth
@@ -28,3 +31,49 @@ class AuthTests(test.TestCase):
     assert_error("1234ABCD")
 
     auth.validate_strong_password("1234ABcd")
+
+
+class ApiTokenTests(test.TestCase):
+  """API token and alert creators unit tests."""
+
+  fixtures = ["test_auth.json"]
+
+  def setUp(self):
+    cache.clear()
+    self.user = User.objects.get(username="web_driver")
+
+  def test_authenticate_token(self):
+    """Tests API token authentication and revocation."""
+    token = auth.create_api_token(self.user, "script")
+    api_token = self.user.api_tokens.get()
+    self.assertEqual(api_token.digest, auth.get_token_digest(token))
+    self.assertNotIn(token, api_token.digest)
+
+    self.assertEqual(auth.authenticate_token(token), self.user)
+    self.assertEqual(auth.authenticate_token(token + "x"), None)
+
+    self.user.is_active = False
+    self.user.save()
+    self.assertEqual(auth.authenticate_token(token), None)
+    self.user.is_active = True
+    self.user.save()
+
+    api_token.revoked = True
+    api_token.save()
+    self.assertEqual(auth.authenticate_token(token), None)
+
+  def test_is_alert_creator_cached(self):
+    """Tests alert creators group membership caching and invalidation."""
+    self.assertTrue(auth.is_alert_creator(self.user))
+    with self.assertNumQueries(0):
+      self.assertTrue(auth.is_alert_creator(self.user))
+
+    group = Group.objects.get(name="can release alerts")
+    self.user.groups.remove(group)
+    self.assertFalse(auth.is_alert_creator(self.user))
+    group.user_set.add(self.user)
+    self.assertTrue(auth.is_alert_creator(self.user))
+
+    group.name = "former alert creators"
+    group.save()
+    self.assertFalse(auth.is_alert_creator(self.user))
@@ -0,0 +1,156 @@
+"""CAP Collector asynchronous ingestion tests."""
+
+from datetime import timedelta
+import uuid
+
+from core import ingest
+from core import models
+from django import test
+from django.utils import timezone
+import mock
+from tests import UUID_RE
+
+
+class IngestTests(test.TestCase):
+  """Ingestion queue unit tests."""
+
+  fixtures = ["test_alerts.json"]
+
+  TEST_USER_NAME = "test_user"
+  VALID_ALERT_UUID = "3ff7a28e-44b7-4ca5-aa5f-06dc42e474c1"
+
+  def CreateJob(self, username, content="<alert/>", **kwargs):
+    return models.IngestJob.objects.create(
+        job_id=str(uuid.uuid4()), username=username, content=content,
+        **kwargs)
+
+  def GetUsernames(self, partitions):
+    """Returns a username of each partition."""
+    usernames = {}
+    index = 0
+    while len(usernames) < partitions:
+      username = "user%d" % index
+      usernames.setdefault(ingest.GetPartition(username, partitions), username)
+      index += 1
+    return [usernames[partition] for partition in range(partitions)]
+
+  @mock.patch("core.ingest.threading.Thread")
+  def test_start_after_fork(self, thread_class):
+    """Tests worker threads are started again in a forked process."""
+    ingester = ingest.Ingester(workers=2)
+    with mock.patch("core.ingest.os.getpid", return_value=1):
+      ingester.start()
+      ingester.start()
+      self.assertEqual(thread_class.call_count, 2)
+    with mock.patch("core.ingest.os.getpid", return_value=2):
+      ingester.start()
+      self.assertEqual(thread_class.call_count, 4)
+      self.assertEqual(len(ingester.threads), 2)
+
+  def test_claim_sender_order(self):
+    """Tests jobs of a sender are claimed one at a time in order."""
+    ingester = ingest.Ingester(workers=1)
+    first = self.CreateJob("a")
+    other = self.CreateJob("b")
+    second = self.CreateJob("a")
+
+    self.assertEqual(ingester.claim(0).id, first.id)
+    # The second job of "a" waits for the first one to finish.
+    self.assertEqual(ingester.claim(0).id, other.id)
+    self.assertEqual(ingester.claim(0), None)
+
+    models.IngestJob.objects.filter(id=first.id).update(
+        status=models.IngestJob.DONE)
+    job = ingester.claim(0)
+    self.assertEqual(job.id, second.id)
+    self.assertEqual(job.status, models.IngestJob.RUNNING)
+
+  def test_claim_many_jobs(self):
+    """Tests many queued jobs of a sender do not block other senders."""
+    ingester = ingest.Ingester(workers=1)
+    first = self.CreateJob("a")
+    for _ in range(200):
+      self.CreateJob("a")
+    other = self.CreateJob("b")
+
+    self.assertEqual(ingester.claim(0).id, first.id)
+    self.assertEqual(ingester.claim(0).id, other.id)
+    self.assertEqual(ingester.claim(0), None)
+
+  def test_claim_partitions(self):
+    """Tests workers only claim jobs of their sender partition."""
+    ingester = ingest.Ingester(workers=2)
+    usernames = self.GetUsernames(2)
+    jobs = [self.CreateJob(username) for username in usernames]
+    for partition in (1, 0):
+      self.assertEqual(ingester.claim(partition).id, jobs[partition].id)
+      self.assertEqual(ingester.claim(partition), None)
+
+  def test_claim_abandoned(self):
+    """Tests abandoned running jobs are claimed again."""
+    ingester = ingest.Ingester(workers=1, job_timeout=60)
+    job = self.CreateJob("a", status=models.IngestJob.RUNNING,
+                         started_at=timezone.now())
+    self.assertEqual(ingester.claim(0), None)
+    models.IngestJob.objects.filter(id=job.id).update(
+        started_at=timezone.now() - timedelta(seconds=61))
+    self.assertEqual(ingester.claim(0).id, job.id)
+
+  def test_process_next(self):
+    """Tests queued alerts are created."""
+    ingester = ingest.Ingester(workers=1)
+    content = models.Alert.objects.get(uuid=self.VALID_ALERT_UUID).content
+    valid_job = self.CreateJob(self.TEST_USER_NAME, content)
+    invalid_job = self.CreateJob(self.TEST_USER_NAME, "<some_xml>")
+
+    self.assertTrue(ingester.process_next(0))
+    self.assertTrue(ingester.process_next(0))
+    self.assertFalse(ingester.process_next(0))
+
+    valid_job = models.IngestJob.objects.get(id=valid_job.id)
+    self.assertEqual(valid_job.status, models.IngestJob.DONE)
+    self.assertTrue(valid_job.valid)
+    self.assertEqual(valid_job.alert_uuid, valid_job.job_id)
+    self.assertTrue(UUID_RE.match(valid_job.alert_uuid))
+    self.assertEqual(valid_job.error, None)
+    self.assertTrue(models.Alert.objects.filter(
+        uuid=valid_job.alert_uuid).exists())
+
+    invalid_job = models.IngestJob.objects.get(id=invalid_job.id)
+    self.assertEqual(invalid_job.status, models.IngestJob.DONE)
+    self.assertFalse(invalid_job.valid)
+    self.assertEqual(invalid_job.alert_uuid, None)
+    self.assertTrue(invalid_job.error.startswith("Malformed XML"))
+
+  def test_process_next_reclaimed(self):
+    """Tests a job claimed again does not create its alert twice."""
+    ingester = ingest.Ingester(workers=1, job_timeout=60)
+    content = models.Alert.objects.get(uuid=self.VALID_ALERT_UUID).content
+    job = self.CreateJob(self.TEST_USER_NAME, content)
+    self.assertTrue(ingester.process_next(0))
+    # The worker died after creating the alert.
+    models.IngestJob.objects.filter(id=job.id).update(
+        status=models.IngestJob.RUNNING,
+        started_at=timezone.now() - timedelta(seconds=61))
+    alert_count = models.Alert.objects.count()
+
+    self.assertTrue(ingester.process_next(0))
+    self.assertEqual(models.Alert.objects.count(), alert_count)
+    job = models.IngestJob.objects.get(id=job.id)
+    self.assertEqual(job.status, models.IngestJob.DONE)
+    self.assertTrue(job.valid)
+    self.assertEqual(job.alert_uuid, job.job_id)
+
+  def test_delete_finished(self):
+    """Tests finished jobs are deleted after the retention period."""
+    ingester = ingest.Ingester(workers=1, retention=60)
+    now = timezone.now()
+    old = self.CreateJob("a", status=models.IngestJob.DONE,
+                         finished_at=now - timedelta(seconds=61))
+    recent = self.CreateJob("a", status=models.IngestJob.DONE, finished_at=now)
+    pending = self.CreateJob("a")
+    ingester.delete_finished()
+    self.assertEqual(
+        sorted(models.IngestJob.objects.values_list("id", flat=True)),
+        [recent.id, pending.id])
+    self.assertFalse(models.IngestJob.objects.filter(id=old.id).exists())
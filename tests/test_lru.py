@@ -0,0 +1,37 @@
+"""CAP Collector LRU cache tests."""
+
+from core import lru
+from django import test
+
+
+class LRUCacheTests(test.SimpleTestCase):
+  """LRU cache unit tests."""
+
+  def test_max_entries(self):
+    """Tests least recently used entries are evicted first."""
+    cache = lru.LRUCache(2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    self.assertEqual(cache.get("a"), 1)
+    cache.set("c", 3)
+    self.assertEqual(cache.get("b"), None)
+    self.assertEqual(cache.get("a"), 1)
+    self.assertEqual(cache.get("c"), 3)
+    self.assertEqual(cache.stats(), {"entries": 2,
+                                     "bytes": lru.GetSize(1) + lru.GetSize(3),
+                                     "hits": 3, "misses": 1, "evictions": 1})
+
+  def test_max_bytes(self):
+    """Tests entries are evicted to fit the memory limit."""
+    value = "x" * 100
+    cache = lru.LRUCache(10, max_bytes=lru.GetSize(value) * 2)
+    for key in range(3):
+      cache.set(key, value)
+    self.assertEqual(cache.get(0), None)
+    self.assertEqual(cache.stats()["entries"], 2)
+    self.assertEqual(cache.stats()["evictions"], 1)
+
+    # Values over the limit are not cached.
+    cache.set("big", value * 3)
+    self.assertEqual(cache.get("big"), None)
+    self.assertEqual(cache.stats()["entries"], 2)
@@ -0,0 +1,66 @@
+"""CAP Collector alert notifications tests."""
+
+import os
+import shutil
+import tempfile
+import threading
+
+from core import notifications
+from django import test
+
+
+class NotificationsTests(test.SimpleTestCase):
+  """Notifications unit tests."""
+
+  def setUp(self):
+    self.journal_dir = tempfile.mkdtemp()
+    self.journal_path = os.path.join(self.journal_dir, "notifications.journal")
+
+  def tearDown(self):
+    shutil.rmtree(self.journal_dir)
+
+  def test_local_notifier(self):
+    """Tests in-process notifications delivery."""
+    notifier = notifications.LocalNotifier()
+    first_id = notifier.publish({"uuid": "1"})
+    subscription = notifier.subscribe()
+    self.assertEqual(subscription.wait(0), [])
+
+    threading.Timer(0.1, notifier.publish, [{"uuid": "2"}]).start()
+    self.assertEqual(subscription.wait(5), [(first_id + 1, {"uuid": "2"})])
+
+    # Resuming from a known event ID delivers missed events.
+    resumed = notifier.subscribe(first_id - 1)
+    self.assertEqual([event["uuid"] for _, event in resumed.wait(0)],
+                     ["1", "2"])
+
+  def test_journal_notifier(self):
+    """Tests notifications delivery between journal notifier instances."""
+    publisher = notifications.JournalNotifier(self.journal_path, max_size=100,
+                                              poll_interval=0.01)
+    subscriber = notifications.JournalNotifier(self.journal_path,
+                                               poll_interval=0.01)
+    self.assertEqual(publisher.publish({"uuid": "1"}), 1)
+
+    subscription = subscriber.subscribe()
+    self.assertEqual(subscription.last_event_id, 1)
+    self.assertEqual(subscription.wait(0), [])
+
+    threading.Timer(0.1, publisher.publish, [{"uuid": "2"}]).start()
+    self.assertEqual(subscription.wait(5), [(2, {"uuid": "2"})])
+
+    # Rotated journal events are still delivered.
+    for i in range(3, 10):
+      publisher.publish({"uuid": str(i)})
+    self.assertTrue(os.path.exists(self.journal_path + ".1"))
+    self.assertEqual([event_id for event_id, _ in subscription.wait(0)],
+                     range(3, 10))
+
+    # Resuming from a known event ID delivers missed events, including the
+    # rotated ones.
+    resumed = subscriber.subscribe(2)
+    self.assertEqual([event["uuid"] for _, event in resumed.wait(0)],
+                     [str(i) for i in range(3, 10)])
+    self.assertEqual(resumed.wait(0), [])
+    self.assertEqual(resumed.last_event_id, 9)
+    self.assertEqual(subscriber.subscribe().last_event_id, 9)
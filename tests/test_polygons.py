@@ -0,0 +1,346 @@
+"""CAP Collector preview polygons tests."""
+
+import json
+import math
+import os
+import shutil
+import StringIO
+import sys
+import tempfile
+
+from core import models
+from core import polygons
+from django import test
+from django.conf import settings
+from django.core.management import call_command
+
+
+def GetCircleRing(count, radius=1.0):
+  """Returns closed ring of (lat, lng) strings approximating a circle."""
+  ring = [("%.5f" % (radius * math.sin(2 * math.pi * index / count)),
+           "%.5f" % (radius * math.cos(2 * math.pi * index / count)))
+          for index in range(count)]
+  return ring + ring[:1]
+
+
+class PolygonStoreTests(test.TestCase):
+  """Preview polygon store unit tests."""
+
+  fixtures = ["test_geocodepreviewpolygons.json"]
+
+  KEYS = ["geocode1|one", "unknown|key", "IN_IMD_DISTRICTS|36"]
+
+  def test_get_many(self):
+    """Tests polygons are served from memory after the first lookup."""
+    store = polygons.PolygonStore(10, version_check_interval=3600)
+    with self.assertNumQueries(2):
+      result = store.get_many(self.KEYS)
+    self.assertEqual([key for key, _ in result],
+                     ["geocode1|one", "IN_IMD_DISTRICTS|36"])
+    self.assertEqual(result[0][1], models.GeocodePreviewPolygon.objects.get(
+        id="geocode1|one").content)
+
+    with self.assertNumQueries(0):
+      self.assertEqual(store.get_many(self.KEYS + ["geocode1|one"]), result)
+    stats = store.stats()
+    # Duplicate keys are looked up once.
+    self.assertEqual((stats["hits"], stats["misses"]), (3, 3))
+
+  def test_warm_up(self):
+    """Tests all polygons are loaded by warm up."""
+    store = polygons.PolygonStore(10, version_check_interval=3600)
+    store.warm_up()
+    self.assertEqual(store.stats()["entries"],
+                     models.GeocodePreviewPolygon.objects.count())
+    with self.assertNumQueries(0):
+      self.assertEqual(len(store.get_many(self.KEYS[:1])), 1)
+
+  def test_version_change(self):
+    """Tests polygons are reloaded after an import."""
+    store = polygons.PolygonStore(10, version_check_interval=0)
+    store.get_many(self.KEYS)
+    # Only the version is checked.
+    with self.assertNumQueries(1):
+      store.get_many(self.KEYS)
+
+    models.GeocodePreviewPolygon.objects.filter(id="geocode1|one").update(
+        content="<polygon>1,1 1,2 2,2 1,1</polygon>")
+    import_obj = models.GeocodePreviewImport.objects.create()
+    self.assertEqual(store.get_many(self.KEYS[:1]),
+                     [("geocode1|one", "<polygon>1,1 1,2 2,2 1,1</polygon>")])
+    self.assertEqual(store.stats()["version"], import_obj.id)
+
+  def test_evicted(self):
+    """Tests store is bounded."""
+    store = polygons.PolygonStore(1, version_check_interval=3600)
+    store.get_many(self.KEYS)
+    stats = store.stats()
+    self.assertEqual((stats["entries"], stats["evictions"]), (1, 2))
+
+
+class SpatialIndexTests(test.TestCase):
+  """Preview polygon spatial index unit tests."""
+
+  fixtures = ["test_geocodepreviewpolygons.json"]
+
+  KEYS = ["IN_IMD_DISTRICTS|36", "geocode1|one"]
+  # Bounding box of the fixture polygons.
+  BOX = (27.7759, 76.7944, 30.5197, 79.552)
+
+  def setUp(self):
+    self.index_dir = tempfile.mkdtemp()
+    self.index_path = os.path.join(self.index_dir, "run", "index.json")
+
+  def tearDown(self):
+    shutil.rmtree(self.index_dir)
+
+  def test_bounding_box(self):
+    """Tests bounding box and point containment of polygons."""
+    content = models.GeocodePreviewPolygon.objects.get(
+        id="geocode1|one").content
+    self.assertEqual(polygons.GetBoundingBox(content), self.BOX)
+    self.assertEqual(polygons.GetBoundingBox(""), None)
+    # Inside the second ring.
+    self.assertTrue(polygons.ContainsPoint(content, 29.3, 78.6))
+    # Inside the bounding box only.
+    self.assertFalse(polygons.ContainsPoint(content, 28, 77))
+    self.assertFalse(polygons.ContainsPoint(content, 40, 78))
+
+    self.assertEqual(polygons.ParseCoordinates("1.5,-2", 2), (1.5, -2))
+    for value in ("1", "1,2,3", "a,b", "91,0", "0,-181", "nan,0", "inf,0"):
+      self.assertRaises(ValueError, polygons.ParseCoordinates, value, 2)
+
+  def test_grid_index(self):
+    """Tests boxes intersecting a query box are found."""
+    index = polygons.GridIndex(1)
+    for lat in range(-5, 5):
+      for lng in range(-5, 5):
+        index.insert("%d|%d" % (lat, lng),
+                     (lat + 0.1, lng + 0.1, lat + 0.9, lng + 0.9))
+    index.insert("large", (-4.5, -4.5, 4.5, 4.5))
+    self.assertEqual(len(index), 101)
+
+    self.assertEqual(index.search((0.5, 0.5, 1.5, 1.5)),
+                     ["0|0", "0|1", "1|0", "1|1", "large"])
+    self.assertEqual(index.search((0.95, 0.95, 1.05, 1.05)), ["large"])
+    # Touching boxes intersect.
+    self.assertEqual(index.search((0.1, 0.1, 0.1, 0.1)), ["0|0", "large"])
+    self.assertEqual(index.search((10, 10, 20, 20)), [])
+    # Large query boxes only visit non-empty cells.
+    self.assertEqual(len(index.search((-90, -180, 90, 180))), 101)
+    self.assertEqual(index.search((-90, -180, -4.5, 180)),
+                     sorted(["-5|%d" % lng for lng in range(-5, 5)] +
+                            ["large"]))
+
+    index.version = 3
+    index.save(self.index_path)
+    loaded = polygons.GridIndex.load(self.index_path)
+    self.assertEqual((loaded.version, loaded.cell_size, len(loaded)),
+                     (3, 1, 101))
+    self.assertEqual(loaded.search((0.5, 0.5, 1.5, 1.5)),
+                     index.search((0.5, 0.5, 1.5, 1.5)))
+    with open(self.index_path, "w") as index_file:
+      index_file.write("{}")
+    self.assertRaises(ValueError, polygons.GridIndex.load, self.index_path)
+
+  def test_store_search(self):
+    """Tests store index is built, saved and loaded per version."""
+    store = polygons.PolygonStore(10, version_check_interval=0,
+                                  index_path=self.index_path)
+    # Fixture polygons have no stored bounding boxes.
+    self.assertEqual(store.search(self.BOX), self.KEYS)
+    self.assertEqual(store.search((28, 80, 29, 81)), [])
+    self.assertEqual(store.search_point(29.3, 78.6), self.KEYS)
+    self.assertEqual(store.search_point(28, 77), [])
+    self.assertEqual(store.stats()["indexed"], 2)
+    self.assertEqual(polygons.GridIndex.load(self.index_path).version, None)
+
+    # Other processes load the saved index.
+    store = polygons.PolygonStore(10, version_check_interval=0,
+                                  index_path=self.index_path)
+    with self.assertNumQueries(1):
+      self.assertEqual(store.search(self.BOX), self.KEYS)
+
+    # Stale index is rebuilt after an import.
+    models.GeocodePreviewPolygon.objects.filter(id="geocode1|one").update(
+        min_lat=0, min_lng=0, max_lat=1, max_lng=1)
+    import_obj = models.GeocodePreviewImport.objects.create()
+    self.assertEqual(store.search(self.BOX), self.KEYS[:1])
+    self.assertEqual(store.search((0, 0, 0, 0)), self.KEYS[1:])
+    self.assertEqual(polygons.GridIndex.load(self.index_path).version,
+                     import_obj.id)
+
+
+class SimplificationTests(test.TestCase):
+  """Preview polygon simplification unit tests."""
+
+  def test_parse_format_polygons(self):
+    """Tests CAP <polygon> elements parsing and formatting round trip."""
+    content = ("<polygon>30.5197,77.569 29.9835,76.7944 29.1042,76.9153 "
+               "30.5197,77.569</polygon>\n<polygon>1,2 3,4 5,6 1,2</polygon>")
+    rings = polygons.ParsePolygons(content)
+    self.assertEqual(len(rings), 2)
+    self.assertEqual(rings[0][1], ("29.9835", "76.7944"))
+    self.assertEqual(polygons.FormatPolygons(rings), content)
+    self.assertEqual(polygons.GetVertexCount(content), 8)
+
+  def test_simplify_ring(self):
+    """Tests Douglas-Peucker ring simplification."""
+    # A square with extra points along its sides.
+    square = [(0, 0), (0, 1), (0, 2), (1, 2), (2, 2), (2.01, 1), (2, 0),
+              (1, 0), (0, 0)]
+    self.assertEqual(polygons.SimplifyRing(square, 0.1), [0, 2, 4, 6, 8])
+    self.assertEqual(polygons.SimplifyRing(square, 0), [0, 2, 4, 5, 6, 8])
+    # The ring stays a polygon at any tolerance.
+    self.assertEqual(len(polygons.SimplifyRing(square, 100)), 4)
+    self.assertEqual(polygons.SimplifyRing(square[:3] + [(0, 0)], 100),
+                     range(4))
+
+  def test_is_simple_ring(self):
+    """Tests self-intersecting rings are detected."""
+    square = [(0, 0), (0, 2), (2, 2), (2, 0), (0, 0)]
+    self.assertTrue(polygons.IsSimpleRing(square))
+    self.assertTrue(polygons.IsSimpleRing(square[:2] + square[1:]))
+    # A figure eight and a ring touching itself.
+    self.assertFalse(polygons.IsSimpleRing(
+        [(0, 0), (0, 2), (2, 0), (2, 2), (0, 0)]))
+    self.assertFalse(polygons.IsSimpleRing(
+        [(0, 0), (0, 2), (1, 0), (2, 2), (2, 0), (0, 0)]))
+
+  def test_simplify_polygons_self_intersection(self):
+    """Tests simplification does not make rings intersect themselves."""
+    ring = [(6.3, 6.2), (-1.3, -0.6), (-1.8, -6.2), (-0.5, -1.9),
+            (-0.4, -3.0), (6.2, -3.7), (6.3, 6.2)]
+    self.assertTrue(polygons.IsSimpleRing(ring))
+    self.assertFalse(polygons.IsSimpleRing(
+        [ring[index] for index in polygons.SimplifyRing(ring, 3)]))
+
+    content = polygons.FormatPolygons([ring])
+    simplified = polygons.ParsePolygons(polygons.SimplifyPolygons(content, 3))
+    points = [(float(lat), float(lng)) for lat, lng in simplified[0]]
+    self.assertTrue(polygons.IsSimpleRing(points))
+    self.assertLess(len(points), len(ring))
+
+  def test_simplify_polygons(self):
+    """Tests simplified polygons are within tolerance."""
+    content = polygons.FormatPolygons([GetCircleRing(360)])
+    previous_count = polygons.GetVertexCount(content)
+    for tolerance in (0.0001, 0.001, 0.01, 0.1):
+      simplified = polygons.SimplifyPolygons(content, tolerance)
+      ring = polygons.ParsePolygons(simplified)[0]
+      self.assertEqual(ring[0], ring[-1])
+      self.assertTrue(4 <= len(ring) <= previous_count)
+      previous_count = len(ring)
+      # Original values of kept points.
+      self.assertTrue(set(ring) <= set(GetCircleRing(360)))
+      # Removed points are within tolerance from the simplified ring.
+      segments = [((float(start[0]), float(start[1])),
+                   (float(end[0]), float(end[1])))
+                  for start, end in zip(ring, ring[1:])]
+      for lat, lng in GetCircleRing(360):
+        self.assertTrue(min(
+            polygons.GetSegmentDistance((float(lat), float(lng)), start, end)
+            for start, end in segments) <= tolerance)
+
+  def test_encode_polyline(self):
+    """Tests polyline encoding of the reference example."""
+    points = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+    polyline = "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+    self.assertEqual(polygons.EncodePolyline(points), polyline)
+    self.assertEqual(polygons.DecodePolyline(polyline), points)
+    self.assertEqual(polygons.DecodePolyline(""), [])
+    for malformed in ("_p~iF~ps|", "_p~iF~ps|U_ulL", "_p~iF\x00"):
+      self.assertRaises(ValueError, polygons.DecodePolyline, malformed)
+
+  def test_encode_polygons_round_trip(self):
+    """Tests polygons survive encoding within polyline precision."""
+    content = "\n".join([
+        "<polygon>30.5197,77.569 29.9835,76.7944 29.1042,76.9153 "
+        "30.5197,77.569</polygon>",
+        "<polygon>-33.868820,151.209296 -33.9,151.2 -33.85,151.25 "
+        "-33.868820,151.209296</polygon>",
+        polygons.FormatPolygons([GetCircleRing(360, radius=89.9)]),
+    ])
+    polylines = polygons.EncodePolygons(content)
+    self.assertEqual(len(polylines), 3)
+    self.assertLess(len("".join(polylines)), len(content))
+
+    decoded = polygons.DecodePolygons(polylines)
+    self.assertTrue(decoded.startswith(
+        "<polygon>30.5197,77.569 29.9835,76.7944 "))
+    original_rings = polygons.ParsePolygons(content)
+    decoded_rings = polygons.ParsePolygons(decoded)
+    self.assertEqual([len(ring) for ring in decoded_rings],
+                     [len(ring) for ring in original_rings])
+    for original_ring, decoded_ring in zip(original_rings, decoded_rings):
+      for original, decoded_point in zip(original_ring, decoded_ring):
+        for original_value, decoded_value in zip(original, decoded_point):
+          self.assertAlmostEqual(float(original_value), float(decoded_value),
+                                 delta=0.5e-5)
+    # Decoded polygons encode to the same polylines.
+    self.assertEqual(polygons.EncodePolygons(decoded), polylines)
+
+  def test_get_many_tolerance(self):
+    """Tests the most simplified polygons within tolerance are served."""
+    content = polygons.FormatPolygons([GetCircleRing(360)])
+    models.GeocodePreviewPolygon.objects.create(
+        id="circle|one", content=content,
+        simplified=polygons.GetSimplifiedLevels(content, [0.01, 0.001]))
+    store = polygons.PolygonStore(10)
+    for tolerance, level in ((0, 0), (0.0009, 0), (0.001, 0.001),
+                             (0.005, 0.001), (1, 0.01), (-1, 0),
+                             (float("nan"), 0)):
+      expected = (polygons.SimplifyPolygons(content, level) if level
+                  else content)
+      self.assertEqual(store.get_many(["circle|one"], tolerance),
+                       [("circle|one", expected)], tolerance)
+    self.assertEqual(polygons.GetZoomTolerance(0), 360.0 / 256)
+
+    self.assertEqual(store.get_many(["circle|one"], 1, encoded=True), [(
+        "circle|one",
+        polygons.EncodePolygons(polygons.SimplifyPolygons(content, 0.01)))])
+
+  def test_import(self):
+    """Tests polygons are simplified and reported at import."""
+    data_dir = tempfile.mkdtemp()
+    try:
+      data_path = os.path.join(data_dir, "districts.json")
+      ring = [[float(lng), float(lat)] for lat, lng in GetCircleRing(360)]
+      with open(data_path, "w") as data_file:
+        json.dump({"type": "FeatureCollection", "features": [{
+            "type": "Feature",
+            "properties": {"namestate": "Circle"},
+            "geometry": {"type": "Polygon", "coordinates": [ring]},
+        }]}, data_file)
+
+      index_path = os.path.join(data_dir, "index.json")
+      stdout = sys.stdout
+      sys.stdout = StringIO.StringIO()
+      try:
+        with self.settings(GEOCODE_PREVIEW_INDEX_FILE=index_path):
+          call_command("import_geocodepreviewpolygon", data_path)
+        output = sys.stdout.getvalue()
+      finally:
+        sys.stdout = stdout
+      index = polygons.GridIndex.load(index_path)
+    finally:
+      shutil.rmtree(data_dir)
+
+    obj = models.GeocodePreviewPolygon.objects.get(
+        id="IN_IMD_DISTRICTS|Circle")
+    levels = json.loads(obj.simplified)
+    self.assertEqual([tolerance for tolerance, _ in levels],
+                     sorted(settings.GEOCODE_PREVIEW_TOLERANCES))
+    encoded = json.loads(obj.encoded)
+    self.assertEqual(encoded[0],
+                     [0, polygons.EncodePolygons(obj.content)])
+    self.assertEqual(len(encoded), len(levels) + 1)
+    report = output.split("Tolerance  Vertices       Bytes     Encoded\n")[1]
+    report = report.split("\n")
+    self.assertEqual(report[0].split()[:2], ["0", "361"])
+    self.assertEqual(len([line for line in report if line]),
+                     len(settings.GEOCODE_PREVIEW_TOLERANCES) + 1)
+    self.assertEqual(index.version,
+                     models.GeocodePreviewImport.objects.get().id)
+    self.assertEqual(obj.bounding_box, (-1, -1, 1, 1))
+    self.assertEqual(index.search((0.5, 0.5, 2, 2)), [obj.id])
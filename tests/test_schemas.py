@@ -0,0 +1,91 @@
+"""CAP Collector schema validation tests."""
+
+import os
+import shutil
+import tempfile
+import threading
+
+from core import models
+from core import schemas
+from django import test
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from lxml import etree
+
+
+class SchemasTests(test.TestCase):
+  """Schema registry unit tests."""
+
+  fixtures = ["test_alerts.json"]
+
+  VALID_ALERT_UUID = "3ff7a28e-44b7-4ca5-aa5f-06dc42e474c1"
+  MINIMAL_SCHEMA = """<schema xmlns="http://www.w3.org/2001/XMLSchema"
+      targetNamespace="%s" elementFormDefault="qualified">
+    <element name="alert"/>
+  </schema>""" % settings.CAP_NS
+
+  def setUp(self):
+    self.schema_dir = tempfile.mkdtemp()
+    self.schema_path = os.path.join(self.schema_dir, settings.CAP_SCHEMA_FILE)
+    shutil.copy(os.path.join(settings.SCHEMA_DIR, settings.CAP_SCHEMA_FILE),
+                self.schema_path)
+    self.registry = schemas.SchemaRegistry()
+    self.registry.register(self.schema_path)
+
+    self.valid_alert = etree.fromstring(models.Alert.objects.get(
+        uuid=self.VALID_ALERT_UUID).content)
+    self.invalid_alert = etree.fromstring(
+        "<alert xmlns=\"%s\"><sender/></alert>" % settings.CAP_NS)
+
+  def tearDown(self):
+    shutil.rmtree(self.schema_dir)
+
+  def test_validate(self):
+    """Tests validation against schema selected by namespace."""
+    self.assertEqual(self.registry.validate(self.valid_alert), (True, None))
+    valid, error = self.registry.validate(self.invalid_alert)
+    self.assertFalse(valid)
+    self.assertTrue("sender" in error)
+
+    valid, error = self.registry.validate(etree.fromstring(
+        "<alert xmlns=\"urn:oasis:names:tc:emergency:cap:1.1\"/>"))
+    self.assertFalse(valid)
+    self.assertTrue("urn:oasis:names:tc:emergency:cap:1.1" in error)
+
+  def test_get_registry_unsupported_namespace(self):
+    """Tests schemas of namespaces other than CAP_NS are rejected."""
+    cap11_path = os.path.join(self.schema_dir, "cap1.1.xsd")
+    with open(cap11_path, "w") as schema_file:
+      schema_file.write(self.MINIMAL_SCHEMA.replace(
+          settings.CAP_NS, "urn:oasis:names:tc:emergency:cap:1.1"))
+    self.addCleanup(setattr, schemas, "_registry", None)
+    with self.settings(SCHEMA_DIR=self.schema_dir,
+                       CAP_SCHEMA_FILES=[settings.CAP_SCHEMA_FILE,
+                                         "cap1.1.xsd"]):
+      schemas._registry = None  # pylint: disable=protected-access
+      self.assertRaises(ImproperlyConfigured, schemas.GetRegistry)
+
+  def test_validate_concurrently(self):
+    """Tests validation results are not mixed up between threads."""
+    results = []
+
+    def ValidateAlerts():
+      for _ in range(20):
+        results.append((self.registry.validate(self.valid_alert)[0],
+                        self.registry.validate(self.invalid_alert)[0]))
+
+    threads = [threading.Thread(target=ValidateAlerts) for _ in range(4)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    self.assertEqual(results, [(True, False)] * 80)
+
+  def test_reload(self):
+    """Tests schema is recompiled when its file changes."""
+    self.assertFalse(self.registry.validate(self.invalid_alert)[0])
+    with open(self.schema_path, "w") as schema_file:
+      schema_file.write(self.MINIMAL_SCHEMA)
+    mtime = os.path.getmtime(self.schema_path) + 1
+    os.utime(self.schema_path, (mtime, mtime))
+    self.assertTrue(self.registry.validate(self.invalid_alert)[0])
@@ -0,0 +1,85 @@
+"""CAP Collector alert signing tests."""
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+from core import models
+from core import signing
+from django import test
+from django.conf import settings
+from lxml import etree
+import mock
+import xmlsec
+
+
+class SigningTests(test.TestCase):
+  """Alert signing unit tests."""
+
+  fixtures = ["test_alerts.json"]
+
+  TEST_USER_NAME = "test_user"
+  VALID_ALERT_UUID = "3ff7a28e-44b7-4ca5-aa5f-06dc42e474c1"
+
+  def setUp(self):
+    self.alert = etree.fromstring(models.Alert.objects.get(
+        uuid=self.VALID_ALERT_UUID).content)
+    self.cert_path = os.path.join(settings.CREDENTIALS_DIR,
+                                  self.TEST_USER_NAME + ".cert")
+
+  def test_load_key_cached(self):
+    """Tests keys are cached until the key file changes."""
+    credentials_dir = tempfile.mkdtemp()
+    try:
+      key_path = os.path.join(credentials_dir, self.TEST_USER_NAME + ".key")
+      shutil.copy(os.path.join(settings.CREDENTIALS_DIR,
+                               self.TEST_USER_NAME + ".key"), key_path)
+      key = signing.LoadKey(key_path, private=True)
+      self.assertIs(signing.LoadKey(key_path, private=True), key)
+
+      mtime = os.path.getmtime(key_path)
+      os.utime(key_path, (mtime + 1, mtime + 1))
+      self.assertIsNot(signing.LoadKey(key_path, private=True), key)
+    finally:
+      shutil.rmtree(credentials_dir)
+
+  def test_sign(self):
+    """Tests alert is signed in place."""
+    self.assertTrue(signing.Sign(self.alert, self.TEST_USER_NAME))
+    self.assertTrue(xmlsec.verified(self.alert, self.cert_path))
+
+  def test_sign_not_signed(self):
+    """Tests signature is removed when user has no credentials."""
+    content = etree.tostring(self.alert)
+    self.assertFalse(signing.Sign(self.alert, "does not exist"))
+    self.assertEqual(etree.tostring(self.alert), content)
+
+  @mock.patch.object(xmlsec.crypto.XMLSecCryptoFile, "sign",
+                     side_effect=xmlsec.exceptions.XMLSigException("failed"))
+  def test_sign_failed(self, _):
+    """Tests signing errors leave the alert unsigned."""
+    content = etree.tostring(self.alert)
+    self.assertFalse(signing.Sign(self.alert, self.TEST_USER_NAME))
+    self.assertEqual(etree.tostring(self.alert), content)
+
+  def test_sign_in_pool(self):
+    """Tests alert signing in the signing process pool."""
+    with self.settings(SIGNING_PROCESSES=1):
+      try:
+        signed_alert = signing.SignInPool(self.alert, self.TEST_USER_NAME)
+        self.assertTrue(xmlsec.verified(signed_alert, self.cert_path))
+        self.assertIsNone(signing.SignInPool(self.alert, "does not exist"))
+      finally:
+        signing.GetPool().terminate()
+        signing._pool = None  # pylint: disable=protected-access
+
+  def test_sign_in_pool_timeout(self):
+    """Tests alert is signed in process when the signing pool times out."""
+    pool = mock.Mock()
+    pool.apply_async.return_value.get.side_effect = (
+        multiprocessing.TimeoutError)
+    with mock.patch.object(signing, "GetPool", return_value=pool):
+      signed_alert = signing.SignInPool(self.alert, self.TEST_USER_NAME)
+      self.assertTrue(xmlsec.verified(signed_alert, self.cert_path))
+      self.assertIsNone(signing.SignInPool(self.alert, "does not exist"))
@@ -3,16 +3,27 @@
 __author__ = "arcadiy@google.com (Arkadii Yakovets)"
 
 import datetime
+import gzip
 import os
 import re
+import shutil
+import StringIO
+import tempfile
+import urllib
 from xml.etree import cElementTree as xml_etree
 
 from core import models
+from core import notifications
 from core import utils
 from dateutil import parser
+from dateutil import tz as dateutil_tz
 from django import test
 from django.conf import settings
+from django.core.cache import caches
 from django.core.urlresolvers import reverse
+from django.db import connection
+from django.http import QueryDict
+from django.test.utils import CaptureQueriesContext
 from lxml import etree
 import mock
 import pytz
@@ -31,6 +42,9 @@ class UtilsTests(test.TestCase):
   FEED_DATE_FORMAT_RE = re.compile(
       r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}[+-]\d{2}:\d{2}")
 
+  def setUp(self):
+    caches[settings.FEED_CACHE_ALIAS].clear()
+
   @property
   def valid_alert_content(self):
     return models.Alert.objects.get(uuid=self.VALID_ALERT_UUID).content
@@ -47,6 +61,10 @@ class UtilsTests(test.TestCase):
   def invalid_alert_content(self):
     return "<my invalid xml>LMX</xml>"
 
+  def GetQueryDict(self, **kwargs):
+    """Returns query dictionary with provided parameters."""
+    return QueryDict(urllib.urlencode(kwargs))
+
   def test_parse_valid_alert(self):
     """Tests if valid XML alert parsed correctly."""
     golden_alert_dict = {
@@ -106,6 +124,127 @@ class UtilsTests(test.TestCase):
         continue  # We need values present in both template and alert files.
       self.assertEqual(alert_dict[key], golden_alert_dict[key])
 
+  def test_parse_multiple_info_alert(self):
+    """Tests if XML alert with several info and area blocks parsed correctly."""
+    alert_content = """<alert xmlns="%s">
+      <identifier>alert_id</identifier>
+      <info>
+        <language>en-US</language>
+        <event>Flood</event>
+        <area><areaDesc>First area</areaDesc><circle>1,1 1</circle></area>
+        <area>
+          <areaDesc>Second area</areaDesc>
+          <geocode><valueName>code</valueName><value>1</value></geocode>
+        </area>
+      </info>
+      <info>
+        <language>es-US</language>
+        <event>Inundacion</event>
+        <headline>Inundacion</headline>
+        <area><areaDesc>Tercera area</areaDesc><circle>2,2 2</circle></area>
+      </info>
+    </alert>""" % settings.CAP_NS
+    alert_dict = utils.ParseAlert(alert_content, "xml", "alert_id")
+    self.assertEqual(alert_dict["event"], "Flood")
+    self.assertEqual(alert_dict["title"], "Inundacion")
+    self.assertEqual(alert_dict["area_desc"], "First area")
+    self.assertEqual(alert_dict["circles"], ["1,1 1", "2,2 2"])
+
+    english, spanish = alert_dict["infos"]
+    self.assertEqual(english["language"], "en-US")
+    self.assertEqual(english["headline"], "")
+    self.assertEqual([area["area_desc"] for area in english["areas"]],
+                     ["First area", "Second area"])
+    self.assertEqual(english["areas"][1]["geocodes"],
+                     [{"name": "code", "value": "1"}])
+    self.assertEqual(spanish["event"], "Inundacion")
+    self.assertEqual(spanish["areas"], [{"area_desc": "Tercera area",
+                                         "circles": ["2,2 2"], "geocodes": [],
+                                         "polys": []}])
+
+  def test_get_parsed_alert(self):
+    """Tests parsed alerts are memoized by alert UUID and content."""
+    utils.PARSED_ALERT_CACHE.clear()
+    alert_dict = utils.GetParsedAlert(self.valid_alert_content, "xml",
+                                      self.VALID_ALERT_UUID)
+    self.assertEqual(alert_dict.AsDict(), utils.ParseAlert(
+        self.valid_alert_content, "xml", self.VALID_ALERT_UUID))
+    with mock.patch("core.utils.ParseAlert") as parse_alert:
+      self.assertEqual(utils.GetParsedAlert(
+          self.valid_alert_content, "xml", self.VALID_ALERT_UUID), alert_dict)
+      self.assertFalse(parse_alert.called)
+
+    changed_content = self.valid_alert_content.replace("Some headline.",
+                                                       "Changed headline.")
+    changed_dict = utils.GetParsedAlert(changed_content, "xml",
+                                        self.VALID_ALERT_UUID)
+    self.assertEqual(changed_dict["title"], "Changed headline.")
+    stats = utils.PARSED_ALERT_CACHE.stats()
+    self.assertEqual((stats["hits"], stats["misses"]), (1, 2))
+
+  def test_parsed_alert(self):
+    """Tests parsed alert record behaves like ParseAlert dictionary."""
+    alert_dict = utils.ParseAlert(self.valid_alert_content, "xml",
+                                  self.VALID_ALERT_UUID)
+    parsed_alert = utils.ParsedAlert.FromDict(alert_dict)
+    self.assertEqual(parsed_alert.AsDict(), alert_dict)
+    self.assertEqual(parsed_alert["title"], "Some headline.")
+    self.assertEqual(parsed_alert.parameters[0],
+                     utils.NameValuePair("name1", "val1"))
+    self.assertEqual(parsed_alert.parameters[1].value, "val2")
+    self.assertEqual(sorted(parsed_alert), sorted(alert_dict))
+    self.assertFalse("expiresDurationMinutes" in parsed_alert)
+    self.assertRaises(KeyError, lambda: parsed_alert["expiresDurationMinutes"])
+    self.assertEqual(parsed_alert.get("expiresDurationMinutes", ""), "")
+
+  def test_get_alert_entry_not_backfilled(self):
+    """Tests feed entry of alert without CAP fields is parsed from XML."""
+    alert = models.Alert.objects.get(uuid=self.VALID_ALERT_UUID)
+    alert.sender = ""
+    self.assertEqual(utils.GetAlertEntry(alert, "xml")["title"],
+                     "Some headline.")
+
+  def test_parse_cap_date_time(self):
+    """Tests CAP dateTime parsing conformance."""
+    utc = pytz.utc
+    ist = dateutil_tz.tzoffset(None, 5 * 3600 + 30 * 60)
+    pst = dateutil_tz.tzoffset(None, -8 * 3600)
+    # (value, expected datetime or None if invalid, is CAP dateTime)
+    test_table = (
+        ("2014-08-16T00:32:11+00:00",
+         datetime.datetime(2014, 8, 16, 0, 32, 11, 0, utc), True),
+        ("2014-08-16T00:32:11-00:00",
+         datetime.datetime(2014, 8, 16, 0, 32, 11, 0, utc), True),
+        ("2014-08-16T06:02:11+05:30",
+         datetime.datetime(2014, 8, 16, 6, 2, 11, 0, ist), True),
+        ("2014-08-15T16:32:11-08:00",
+         datetime.datetime(2014, 8, 15, 16, 32, 11, 0, pst), True),
+        ("2014-08-16T00:32:11.25+00:00",
+         datetime.datetime(2014, 8, 16, 0, 32, 11, 250000, utc), True),
+        ("2014-08-16T00:32:11Z",
+         datetime.datetime(2014, 8, 16, 0, 32, 11, 0, utc), False),
+        ("2014-08-16 00:32:11+00:00",
+         datetime.datetime(2014, 8, 16, 0, 32, 11, 0, utc), False),
+        ("2014-08-16T00:32:11+0000",
+         datetime.datetime(2014, 8, 16, 0, 32, 11, 0, utc), False),
+        ("Sat, 16 Aug 2014 00:32:11 +0000",
+         datetime.datetime(2014, 8, 16, 0, 32, 11, 0, utc), False),
+        ("2014-13-16T00:32:11+00:00", None, True),
+        ("2014-08-16T24:32:11+00:00", None, True),
+        ("2014-08-16T00:32:11+24:00", None, True),
+        ("not a date", None, False),
+    )
+    for value, expected, is_cap_date_time in test_table:
+      with mock.patch("core.utils.parser.parse",
+                      side_effect=parser.parse) as parse:
+        if expected is None:
+          self.assertRaises(ValueError, utils.ParseCapDateTime, value)
+        else:
+          parsed = utils.ParseCapDateTime(value)
+          self.assertEqual(parsed, expected, value)
+          self.assertEqual(parsed.utcoffset(), expected.utcoffset(), value)
+        self.assertEqual(parse.called, not is_cap_date_time, value)
+
   def test_sign_alert_signed(self):
     """Tests alert signature creation."""
     plain_alert = etree.fromstring(self.valid_alert_content)
@@ -136,6 +275,117 @@ class UtilsTests(test.TestCase):
     del draft_dict["alert_id"]
     self.assertDictEqual(alert_dict, draft_dict)
 
+  def test_create_alert_notification(self):
+    """Tests alert creation notifies subscribers."""
+    subscription = notifications.GetNotifier().subscribe()
+    alert_uuid, _, _ = utils.CreateAlert(self.draft_alert_content,
+                                         self.TEST_USER_NAME)
+    [(_, event)] = subscription.wait(0)
+    self.assertEqual(event["uuid"], alert_uuid)
+    self.assertEqual(event["severity"], "Extreme")
+    self.assertEqual(event["link"], "%s/feed/%s.xml" % (settings.SITE_URL,
+                                                        alert_uuid))
+
+  def test_create_alert_static_files(self):
+    """Tests alert creation publishes static feeds and alert pages."""
+    static_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, static_dir)
+    with test.utils.override_settings(STATIC_FEED_DIR=static_dir):
+      alert_uuid, _, _ = utils.CreateAlert(self.draft_alert_content,
+                                           self.TEST_USER_NAME)
+    alert = models.Alert.objects.get(uuid=alert_uuid)
+
+    with open(os.path.join(static_dir, "feed", alert_uuid + ".xml")) as f:
+      self.assertEqual(f.read(), alert.content)
+    with open(os.path.join(static_dir, "feed.xml")) as f:
+      self.assertEqual(f.read(), utils.GetFeed("xml").encode("utf-8"))
+    for path in ("feed.html", "feed.xml.gz", "feed/%s.html" % alert_uuid,
+                 "feed/%s.xml.gz" % alert_uuid):
+      self.assertTrue(os.path.exists(os.path.join(static_dir, path)), path)
+    # No temporary files are left behind.
+    self.assertFalse([name for name in os.listdir(static_dir) +
+                      os.listdir(os.path.join(static_dir, "feed"))
+                      if name.startswith(".tmp-")])
+
+  @mock.patch("core.utils.GetCurrentDate",
+              lambda: datetime.datetime(2014, 8, 10, 23, 55, 11, 0, pytz.utc))
+  def test_publish_static_feeds_bypasses_cache(self):
+    """Tests static feeds are not rendered from a stale feed cache."""
+    static_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, static_dir)
+    stale_feed = utils.GetFeed("xml")
+    self.assertIn("Fire headline", stale_feed)
+    # Changes alerts without invalidating the feed cache, the way a publisher
+    # process sees changes made by other processes.
+    models.Alert.objects.update(updated=True)
+    self.assertEqual(utils.GetFeed("xml"), stale_feed)
+
+    with test.utils.override_settings(STATIC_FEED_DIR=static_dir):
+      utils.PublishStaticFeeds()
+    with open(os.path.join(static_dir, "feed.xml")) as f:
+      self.assertNotIn("Fire headline", f.read())
+
+  def test_create_alerts(self):
+    """Tests several alerts are saved and supersede alerts at once."""
+    update_content = self.draft_alert_content.replace(
+        "<scope>Public</scope>",
+        "<scope>Public</scope><references>sender,%s,2014-08-16T00:32:11+00:00 "
+        "sender,%s,2014-08-16T00:32:11+00:00</references>" % (
+            self.VALID_ALERT_UUID, self.DRAFT_ALERT_UUID))
+    with CaptureQueriesContext(connection) as queries:
+      results = utils.CreateAlerts(
+          [self.draft_alert_content, self.invalid_alert_content,
+           update_content], self.TEST_USER_NAME)
+    inserts = [query for query in queries if "INSERT INTO" in query["sql"]]
+    updates = [query for query in queries if "UPDATE " in query["sql"]]
+    # Alerts and references are inserted with a query each.
+    self.assertEqual((len(inserts), len(updates)), (2, 1))
+
+    self.assertEqual([valid for _, valid, _ in results], [True, False, True])
+    self.assertEqual(results[1][0], None)
+    self.assertTrue(results[1][2])
+    for alert_uuid, _, error in (results[0], results[2]):
+      self.assertTrue(UUID_RE.match(alert_uuid))
+      self.assertEqual(error, None)
+      self.assertTrue(models.Alert.objects.filter(uuid=alert_uuid).exists())
+    for alert_uuid in (self.VALID_ALERT_UUID, self.DRAFT_ALERT_UUID):
+      self.assertTrue(models.Alert.objects.get(uuid=alert_uuid).updated)
+    self.assertEqual(sorted(models.AlertReference.objects.filter(
+        alert_uuid=results[2][0]).values_list("referenced_uuid", flat=True)),
+                     sorted([self.VALID_ALERT_UUID, self.DRAFT_ALERT_UUID]))
+
+  def test_parse_references(self):
+    """Tests parsing of CAP <references> triplets."""
+    sent = datetime.datetime(2014, 8, 16, 0, 32, 11, 0, dateutil_tz.tzutc())
+    self.assertEqual(utils.ParseReferences(
+        "a@example.com,id-1,2014-08-16T00:32:11+00:00 "
+        "b@example.com,id-2,yesterday malformed ,id-3,"), [
+            ("a@example.com", "id-1", sent),
+            ("b@example.com", "id-2", None),
+            ("", "id-3", None),
+        ])
+    self.assertEqual(utils.ParseReferences(None), [])
+
+  def test_get_alert_history(self):
+    """Tests walking update/cancel chain of an alert."""
+    update_content = self.draft_alert_content.replace(
+        "<scope>Public</scope>",
+        "<scope>Public</scope><references>sender,%s,2014-08-16T00:32:11+00:00"
+        " other@example.com,external,2014-08-16T00:32:11+00:00</references>"
+        % self.VALID_ALERT_UUID)
+    update_uuid = utils.CreateAlert(update_content, self.TEST_USER_NAME)[0]
+    cancel_content = update_content.replace(self.VALID_ALERT_UUID, update_uuid)
+    cancel_uuid = utils.CreateAlert(cancel_content, self.TEST_USER_NAME)[0]
+
+    expected = [self.VALID_ALERT_UUID, update_uuid, cancel_uuid]
+    for alert_uuid in expected:
+      history = utils.GetAlertHistory(alert_uuid)
+      self.assertEqual(sorted(alert.uuid for alert in history),
+                       sorted(expected))
+    self.assertEqual([alert.uuid for alert in utils.GetAlertHistory(
+        self.DRAFT_ALERT_UUID)], [self.DRAFT_ALERT_UUID])
+    self.assertEqual(utils.GetAlertHistory("does not exist"), None)
+
   def test_create_alert_failed(self):
     """Tests alert creation failed for invalid XML tree."""
     uuid, is_valid, error = utils.CreateAlert(self.invalid_alert_content,
@@ -144,6 +394,13 @@ class UtilsTests(test.TestCase):
     self.assertFalse(is_valid)
     self.assertTrue(error)
 
+  def test_generate_feed_hub_link(self):
+    """Tests XML feed advertises configured WebSub hub."""
+    hub_link = "<link href=\"http://hub.example.com/\" rel=\"hub\""
+    self.assertFalse(hub_link in utils.GenerateFeed())
+    with test.utils.override_settings(WEBSUB_HUB_URL="http://hub.example.com/"):
+      self.assertTrue(hub_link in utils.GenerateFeed())
+
   @mock.patch("core.utils.GetCurrentDate",
               lambda: datetime.datetime(2014, 8, 10, 23, 55, 12, 0, pytz.utc))
   def test_generate_feed_active_alert(self):
@@ -192,3 +449,266 @@ class UtilsTests(test.TestCase):
     updated = feed.find("{http://www.w3.org/2005/Atom}updated").text.strip()
     self.assertEqual(len(self.FEED_DATE_FORMAT_RE.findall(updated)), 1)
     self.assertEqual(self.FEED_DATE_FORMAT_RE.findall(updated)[0], updated)
+
+  @mock.patch("core.utils.GetCurrentDate",
+              lambda: datetime.datetime(2014, 8, 10, 23, 55, 11, 0, pytz.utc))
+  def test_get_feed_cached(self):
+    """Tests that materialized feed is rendered only once."""
+    feed = utils.GetFeed()
+    with mock.patch("core.utils.GenerateFeed",
+                    return_value="") as generate_feed:
+      self.assertEqual(utils.GetFeed(), feed)
+      self.assertFalse(generate_feed.called)
+
+      # Other feed types are materialized separately.
+      utils.GetFeed("html")
+      self.assertTrue(generate_feed.called)
+
+  @mock.patch("core.utils.GetCurrentDate",
+              lambda: datetime.datetime(2014, 8, 10, 23, 55, 11, 0, pytz.utc))
+  def test_get_feed_invalidated(self):
+    """Tests that materialized feed is invalidated on alert creation."""
+    utils.GetFeed()
+    utils.CreateAlert(self.draft_alert_content, self.TEST_USER_NAME)
+    with mock.patch("core.utils.GenerateFeed",
+                    return_value="") as generate_feed:
+      utils.GetFeed()
+      self.assertTrue(generate_feed.called)
+
+  @mock.patch("core.utils.GetCurrentDate",
+              lambda: datetime.datetime(2014, 8, 10, 23, 55, 11, 0, pytz.utc))
+  def test_get_feed_expired(self):
+    """Tests that materialized feed is not cached past alert expiration."""
+    with mock.patch.object(caches[settings.FEED_CACHE_ALIAS], "set") as set_:
+      utils.GetFeed()
+      # The earliest alert expires at 2014-08-10T23:55:12+00:00.
+      self.assertEqual(set_.call_args[0][2], 1)
+
+  def test_create_alert_fields(self):
+    """Tests that CAP fields are denormalized on alert creation."""
+    alert_uuid, _, _ = utils.CreateAlert(self.draft_alert_content,
+                                         self.TEST_USER_NAME)
+    alert = models.Alert.objects.get(uuid=alert_uuid)
+    self.assertEqual(alert.sender, "%s@%s" % (self.TEST_USER_NAME,
+                                              settings.SITE_DOMAIN))
+    self.assertEqual(alert.headline, "Fire headline")
+    self.assertEqual(alert.msg_type, "Alert")
+    self.assertEqual(alert.severity, "Extreme")
+    self.assertEqual(alert.area_desc, "Unspecified Area")
+
+  def test_get_alert_entry(self):
+    """Tests that feed entry built from alert fields matches parsed alert."""
+    alert = models.Alert.objects.get(uuid=self.VALID_ALERT_UUID)
+    alert_dict = utils.ParseAlert(alert.content, "xml", alert.uuid)
+    entry = utils.GetAlertEntry(alert, "xml")
+    for key, value in entry.AsDict().iteritems():
+      self.assertEqual(value, alert_dict[key], key)
+
+  @mock.patch("core.utils.GetCurrentDate",
+              lambda: datetime.datetime(2014, 8, 10, 23, 55, 11, 0, pytz.utc))
+  def test_generate_feed_does_not_parse_alerts(self):
+    """Tests that XML feed is built from alert fields."""
+    with mock.patch("core.utils.ParseAlert") as parse_alert:
+      feed = utils.GenerateFeed()
+      self.assertFalse(parse_alert.called)
+    self.assertTrue("Fire headline" in feed)
+
+  @mock.patch("core.utils.GetCurrentDate",
+              lambda: datetime.datetime(2014, 8, 10, 23, 55, 11, 0, pytz.utc))
+  def test_stream_feed(self):
+    """Tests that streamed XML feed has all active alerts in order."""
+    chunks = list(utils.StreamFeed())
+    self.assertEqual(len(chunks), 4)  # Header, two entries and footer.
+
+    feed = xml_etree.fromstring("".join(chunks).encode("utf-8"))
+    entry_ids = [
+        entry.find("{http://www.w3.org/2005/Atom}id").text
+        for entry in feed.findall(".//{http://www.w3.org/2005/Atom}entry")]
+    self.assertEqual(entry_ids, ["uuid:" + self.VALID_ALERT_UUID,
+                                 "uuid:" + self.DRAFT_ALERT_UUID])
+
+  @mock.patch("core.utils.GetCurrentDate",
+              lambda: datetime.datetime(2014, 8, 17, 0, 0, 0, 0, pytz.utc))
+  def test_stream_feed_no_entries(self):
+    """Tests streamed feed with no active alerts."""
+    self.assertEqual(len(list(utils.StreamFeed("html"))), 1)
+
+    chunks = list(utils.StreamFeed())
+    self.assertEqual(len(chunks), 1)
+    feed = xml_etree.fromstring(chunks[0].encode("utf-8"))
+    self.assertEqual(
+        len(feed.findall(".//{http://www.w3.org/2005/Atom}entry")), 0)
+
+  @mock.patch("core.utils.GetCurrentDate",
+              lambda: datetime.datetime(2014, 8, 10, 23, 55, 11, 0, pytz.utc))
+  def test_iterate_alerts(self):
+    """Tests alerts are read in chunks in feed order."""
+    alerts = utils.GetActiveAlerts()
+    with self.assertNumQueries(3):
+      self.assertEqual(
+          [alert.uuid for alert in utils.IterateAlerts(alerts, chunk_size=1)],
+          [self.VALID_ALERT_UUID, self.DRAFT_ALERT_UUID])
+    self.assertEqual(len(list(utils.IterateAlerts(alerts, chunk_size=3))), 2)
+
+  @mock.patch("core.utils.GetCurrentDate",
+              lambda: datetime.datetime(2014, 8, 10, 23, 55, 11, 0, pytz.utc))
+  def test_get_feed_page(self):
+    """Tests keyset pagination of active alerts."""
+    alerts, cursors = utils.GetFeedPage({"limit": 1})
+    self.assertEqual([alert.uuid for alert in alerts], [self.VALID_ALERT_UUID])
+    self.assertEqual(cursors.keys(), ["after"])
+
+    alerts, cursors = utils.GetFeedPage({"limit": 1,
+                                         "after": cursors["after"]})
+    self.assertEqual([alert.uuid for alert in alerts], [self.DRAFT_ALERT_UUID])
+    self.assertEqual(cursors.keys(), ["before"])
+
+    alerts, cursors = utils.GetFeedPage({"limit": 1,
+                                         "before": cursors["before"]})
+    self.assertEqual([alert.uuid for alert in alerts], [self.VALID_ALERT_UUID])
+    self.assertEqual(cursors.keys(), ["after"])
+
+    alerts, cursors = utils.GetFeedPage({"limit": 2})
+    self.assertEqual(len(alerts), 2)
+    self.assertEqual(cursors, {})
+
+  def test_get_feed_params(self):
+    """Tests feed query parameters validation."""
+    alert = models.Alert.objects.get(uuid=self.VALID_ALERT_UUID)
+    cursor = utils.EncodeFeedCursor(alert)
+    self.assertEqual(utils.DecodeFeedCursor(cursor),
+                     (alert.created_at, alert.id))
+    self.assertEqual(
+        utils.GetFeedParams(self.GetQueryDict(limit="10", after=cursor)),
+        {"limit": 10, "after": cursor})
+    self.assertEqual(utils.GetFeedParams(QueryDict("")), {})
+    self.assertEqual(
+        utils.GetFeedParams(QueryDict(
+            "severity=Severe,Extreme&severity=Extreme&category=Met")),
+        {"severity": "Extreme,Severe", "category": "Met"})
+
+    for query in ({"limit": "0"}, {"limit": "many"}, {"after": "cursor"},
+                  {"limit": str(settings.FEED_MAX_PAGE_SIZE + 1)},
+                  {"after": cursor, "before": cursor}):
+      self.assertRaises(ValueError, utils.GetFeedParams,
+                        self.GetQueryDict(**query))
+
+  @mock.patch("core.utils.GetCurrentDate",
+              lambda: datetime.datetime(2014, 8, 10, 23, 55, 11, 0, pytz.utc))
+  def test_get_active_alerts_filtered(self):
+    """Tests active alerts filtering by CAP fields."""
+    def GetAlertUuids(params):
+      return [alert.uuid for alert in utils.GetActiveAlerts(params)]
+
+    self.assertEqual(len(GetAlertUuids({"severity": "Extreme"})), 2)
+    self.assertEqual(GetAlertUuids({"severity": "Severe,Minor"}), [])
+    self.assertEqual(GetAlertUuids({"event": "Fire event",
+                                    "msgType": "Alert"}),
+                     [self.DRAFT_ALERT_UUID])
+
+  @mock.patch("core.utils.GetCurrentDate",
+              lambda: datetime.datetime(2014, 8, 10, 23, 55, 11, 0, pytz.utc))
+  def test_get_active_alerts_filtered_all_info(self):
+    """Tests filters match values of all <info> blocks."""
+    def GetAlertUuids(params):
+      return [alert.uuid for alert in utils.GetActiveAlerts(params)]
+
+    content = self.valid_alert_content
+    start = content.index("<info>")
+    end = content.index("</info>") + len("</info>")
+    info = content[start:end].replace(
+        "<category>Fire</category>",
+        "<category>Met</category><category>Geo</category>").replace(
+            "Fire fire fire.", u"S\xe9isme")
+    [(alert_uuid, valid, error)] = utils.CreateAlerts(
+        [content[:end] + info + content[end:]], self.TEST_USER_NAME)
+    self.assertTrue(valid, error)
+    self.assertEqual(
+        sorted(models.AlertFilterValue.objects.filter(
+            alert_uuid=alert_uuid).values_list("name", "value")),
+        [("category", "Geo"), ("category", "Met"), ("event", u"S\xe9isme")])
+
+    for params in ({"category": "Met"}, {"event": u"S\xe9isme"},
+                   {"category": "Geo,Health", "severity": "Extreme"}):
+      self.assertIn(alert_uuid, GetAlertUuids(params), params)
+    self.assertNotIn(alert_uuid, GetAlertUuids({"category": "Health"}))
+    # First <info> block values still match.
+    self.assertIn(alert_uuid, GetAlertUuids({"event": "Fire fire fire."}))
+
+  def test_get_feed_url_unicode(self):
+    """Tests feed URLs with non-ASCII filter values."""
+    params = {"event": u"S\xe9isme", "limit": 10}
+    self.assertEqual(utils.GetFeedUrl("xml", params),
+                     settings.SITE_URL + "/feed.xml?event=S%C3%A9isme&limit=10")
+    self.assertNotEqual(utils.GetFeedETag("xml", None, params),
+                        utils.GetFeedETag("xml", None, {"limit": 10}))
+
+  def test_compress_content(self):
+    """Tests content precompression."""
+    variants = utils.CompressContent(u"Alert \u0905")
+    self.assertEqual(variants["identity"], u"Alert \u0905")
+    self.assertEqual(
+        gzip.GzipFile(fileobj=StringIO.StringIO(variants["gzip"])).read(),
+        u"Alert \u0905".encode("utf-8"))
+    # Compressed variants are deterministic.
+    self.assertEqual(utils.CompressContent(u"Alert \u0905"), variants)
+
+  @mock.patch("core.utils.CONTENT_ENCODINGS", ("br", "gzip"))
+  def test_choose_content_encoding(self):
+    """Tests content encoding negotiation."""
+    for accept_encoding, content_encoding in (
+        ("", "identity"),
+        ("deflate", "identity"),
+        ("gzip", "gzip"),
+        ("gzip, deflate, br", "br"),
+        ("br;q=0, gzip;q=0.5", "gzip"),
+        ("*", "br"),
+        ("*;q=0, identity", "identity"),
+        ("GZIP;q=invalid", "identity")):
+      self.assertEqual(utils.ChooseContentEncoding(accept_encoding),
+                       content_encoding, accept_encoding)
+
+  def test_get_alert_changes(self):
+    """Tests alert changes since a point in time."""
+    since = datetime.datetime(2014, 8, 10, 23, 0, 0, 0, pytz.utc)
+    self.assertEqual(utils.DecodeChangesToken(
+        utils.EncodeChangesToken(since)), since)
+    self.assertRaises(ValueError, utils.DecodeChangesToken, "token")
+
+    with mock.patch("core.utils.GetCurrentDate",
+                    lambda: datetime.datetime(2014, 8, 16, 1, 0, 0, 0,
+                                              pytz.utc)):
+      created, superseded, expired, until = utils.GetAlertChanges(since)
+      self.assertEqual([alert.uuid for alert in created],
+                       [self.VALID_ALERT_UUID])
+      self.assertEqual(superseded, [])
+      self.assertEqual([alert.uuid for alert in expired],
+                       [self.DRAFT_ALERT_UUID])
+
+      self.assertEqual(until, datetime.datetime(
+          2014, 8, 16, 1, 0, 0, 0, pytz.utc) - datetime.timedelta(
+              seconds=settings.FEED_CHANGES_SAFETY_LAG))
+
+      # Nothing changed since the last call.
+      self.assertEqual(utils.GetAlertChanges(until)[:3], ([], [], []))
+
+      # Changes stamped within the safety lag are reported by the next call.
+      models.Alert.objects.filter(uuid=self.VALID_ALERT_UUID).update(
+          updated=True, last_modified_at=until + datetime.timedelta(
+              seconds=1))
+      self.assertEqual(utils.GetAlertChanges(until)[:3], ([], [], []))
+    with mock.patch("core.utils.GetCurrentDate",
+                    lambda: datetime.datetime(2014, 8, 16, 1, 1, 0, 0,
+                                              pytz.utc)):
+      self.assertEqual(
+          [alert.uuid for alert in utils.GetAlertChanges(until)[1]],
+          [self.VALID_ALERT_UUID])
+    with mock.patch("core.utils.GetCurrentDate",
+                    lambda: datetime.datetime(2014, 8, 16, 1, 0, 0, 0,
+                                              pytz.utc)):
+      models.Alert.objects.filter(uuid=self.VALID_ALERT_UUID).update(
+          updated=True, last_modified_at=until)
+      created, superseded, expired, _ = utils.GetAlertChanges(since)
+      self.assertEqual(created, [])
+      self.assertEqual([alert.uuid for alert in superseded],
+                       [self.VALID_ALERT_UUID])
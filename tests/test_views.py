@@ -2,13 +2,23 @@
 
 __author__ = "arcadiy@google.com (Arkadii Yakovets)"
 
+import gzip
 import json
+import StringIO
 
+from CAPCollector import auth
+from core import ingest
 from core import models
+from core import notifications
+from core import polygons
 from core import utils
+from core import views
 from django.conf import settings
 from django.core.urlresolvers import reverse
 from django.test import Client
+from django.test import override_settings
+from lxml import etree
+import mock
 from tests import CAPCollectorLiveServer
 from tests import TestBase
 from tests import UUID_RE
@@ -20,8 +30,11 @@ class SmokeTests(TestBase):
   fixtures = ["test_alerts.json", "test_auth.json", "test_templates.json",
               "test_geocodepreviewpolygons.json"]
 
+  TEST_ALERT_UUID = "3ff7a28e-44b7-4ca5-aa5f-06dc42e474c1"
+
   def setUp(self):
     super(SmokeTests, self).setUp()
+    polygons.GetPolygonStore().clear()
     self.client = Client()
 
   def login(self):
@@ -33,6 +46,142 @@ class SmokeTests(TestBase):
     response = self.client.get("/feed.xml")
     self.assertEqual(response.status_code, 200)
 
+  def test_feed_xml_paging(self):
+    """Tests XML feed paging links."""
+    response = self.client.get("/feed.xml?limit=1")
+    self.assertEqual(response.status_code, 200)
+    self.assertTrue('rel="first"' in response.content)
+
+    response = self.client.get("/feed.xml?limit=invalid")
+    self.assertEqual(response.status_code, 400)
+
+  def test_feed_xml_filtered(self):
+    """Tests XML feed filtering."""
+    response = self.client.get("/feed.xml?severity=Extreme&limit=1")
+    self.assertEqual(response.status_code, 200)
+    self.assertTrue("severity=Extreme" in response.content)
+
+    response = self.client.get("/feed.xml?event=S%C3%A9isme")
+    self.assertEqual(response.status_code, 200)
+    self.assertTrue("event=S%C3%A9isme" in response.content)
+
+  def test_feed_xml_streaming(self):
+    """Tests that XML feed can be streamed."""
+    with self.settings(FEED_STREAMING=True):
+      response = self.client.get("/feed.xml")
+    self.assertEqual(response.status_code, 200)
+    self.assertTrue(response.streaming)
+    self.assertTrue("".join(response.streaming_content).startswith("<?xml"))
+
+  def test_feed_xml_not_modified(self):
+    """Tests conditional GET of XML feed."""
+    response = self.client.get("/feed.xml")
+    etag = response["ETag"]
+    last_modified = response["Last-Modified"]
+
+    response = self.client.get("/feed.xml", HTTP_IF_NONE_MATCH=etag)
+    self.assertEqual(response.status_code, 304)
+    self.assertEqual(response.content, "")
+    response = self.client.get("/feed.xml",
+                               HTTP_IF_MODIFIED_SINCE=last_modified)
+    self.assertEqual(response.status_code, 304)
+
+    # Publishing an alert changes the feed.
+    alert = models.Alert.objects.get(uuid=self.TEST_ALERT_UUID)
+    utils.CreateAlert(alert.content, self.TEST_USER_LOGIN)
+    response = self.client.get("/feed.xml", HTTP_IF_NONE_MATCH=etag)
+    self.assertEqual(response.status_code, 200)
+    self.assertNotEqual(response["ETag"], etag)
+
+  def test_alert_xml_not_modified(self):
+    """Tests conditional GET of alert XML."""
+    url = "/feed/%s.xml" % self.TEST_ALERT_UUID
+    response = self.client.get(url)
+    self.assertEqual(response.status_code, 200)
+    self.assertTrue("max-age=%d" % views.FeedView.ALERT_XML_MAX_AGE in
+                    response["Cache-Control"])
+
+    response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+    self.assertEqual(response.status_code, 304)
+    self.assertTrue("Cache-Control" in response)
+
+    response = self.client.get("/feed/%s.html" % self.TEST_ALERT_UUID,
+                               HTTP_IF_NONE_MATCH=response["ETag"])
+    self.assertEqual(response.status_code, 200)
+
+  def test_feed_xml_gzip(self):
+    """Tests that XML feed and alerts are served compressed."""
+    for url in ("/feed.xml", "/feed/%s.xml" % self.TEST_ALERT_UUID):
+      response = self.client.get(url)
+      self.assertFalse(response.has_header("Content-Encoding"))
+      self.assertTrue("Accept-Encoding" in response["Vary"])
+
+      gzip_response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+      self.assertEqual(gzip_response["Content-Encoding"], "gzip")
+      self.assertTrue("Accept-Encoding" in gzip_response["Vary"])
+      self.assertNotEqual(gzip_response["ETag"], response["ETag"])
+      gzip_file = gzip.GzipFile(
+          fileobj=StringIO.StringIO(gzip_response.content))
+      self.assertEqual(gzip_file.read(), response.content)
+
+  def test_feed_changes(self):
+    """Tests alert changes feed."""
+    response = self.client.get("/feed/changes.xml")
+    self.assertEqual(response.status_code, 200)
+    feed = etree.fromstring(response.content)
+    next_url = feed.find("{http://www.w3.org/2005/Atom}link[@rel='next']")
+    response = self.client.get(
+        next_url.get("href").replace(settings.SITE_URL, ""))
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(etree.fromstring(response.content).findall(
+        "{http://www.w3.org/2005/Atom}entry"), [])
+
+    response = self.client.get("/feed/changes.xml?since=invalid")
+    self.assertEqual(response.status_code, 400)
+
+  def test_notifications_disabled(self):
+    """Tests alert notifications are not served unless enabled."""
+    response = self.client.get("/notifications", {"timeout": 0})
+    self.assertEqual(response.status_code, 404)
+
+  @override_settings(ALERT_NOTIFICATIONS_ENABLED=True)
+  def test_notifications_long_poll(self):
+    """Tests long-poll alert notifications."""
+    notifier = notifications.GetNotifier()
+    last_event_id = notifier.publish({"uuid": self.TEST_ALERT_UUID})
+    response = self.client.get("/notifications",
+                               {"last_event_id": last_event_id - 1})
+    self.assertEqual(response.status_code, 200)
+    response_dict = json.loads(response.content)
+    self.assertEqual(response_dict["events"],
+                     [{"id": last_event_id, "uuid": self.TEST_ALERT_UUID}])
+    self.assertEqual(response_dict["last_event_id"], last_event_id)
+
+    response = self.client.get("/notifications", {"timeout": 0})
+    self.assertEqual(json.loads(response.content),
+                     {"events": [], "last_event_id": last_event_id})
+
+    response = self.client.get("/notifications", {"last_event_id": "id"})
+    self.assertEqual(response.status_code, 400)
+    for timeout in ("nan", "inf", "-inf"):
+      response = self.client.get("/notifications", {"timeout": timeout})
+      self.assertEqual(response.status_code, 400, timeout)
+
+  @override_settings(ALERT_NOTIFICATIONS_ENABLED=True,
+                     ALERT_NOTIFICATIONS_SSE_DURATION=0.5)
+  def test_notifications_sse(self):
+    """Tests Server-Sent Events alert notifications."""
+    notifier = notifications.GetNotifier()
+    last_event_id = notifier.publish({"uuid": self.TEST_ALERT_UUID})
+    response = self.client.get("/notifications",
+                               HTTP_ACCEPT="text/event-stream",
+                               HTTP_LAST_EVENT_ID=str(last_event_id - 1))
+    self.assertEqual(response["Content-Type"], "text/event-stream")
+    self.assertEqual(
+        "".join(response.streaming_content),
+        "retry: 3000\n\nid: %d\nevent: alert\ndata: {\"uuid\": \"%s\"}\n\n"
+        ": keepalive\n\n" % (last_event_id, self.TEST_ALERT_UUID))
+
   def test_malformed_alert_post(self):
     """Tests if error occurs on malformed alert request attempt."""
     self.login()
@@ -49,11 +198,115 @@ class SmokeTests(TestBase):
                                            "xml": "<some_xml>"})
     self.assertEqual(response.status_code, 400)
 
+  def test_batch_alert_post(self):
+    """Tests creation of several alerts with a single request."""
+    self.login()
+    alert_content = models.Alert.objects.get(uuid=self.TEST_ALERT_UUID).content
+    response = self.client.post("/post/batch/", {
+        "uid": self.TEST_USER_LOGIN,
+        "password": self.TEST_USER_PASSWORD,
+        "xml": [alert_content, "<some_xml>"],
+    })
+    self.assertEqual(response.status_code, 200)
+    created, malformed = json.loads(response.content)
+    self.assertTrue(created["valid"])
+    self.assertTrue(UUID_RE.match(created["uuid"]))
+    self.assertEqual(created["error"], None)
+    self.assertFalse(malformed["valid"])
+    self.assertEqual(malformed["uuid"], None)
+    self.assertTrue(malformed["error"].startswith("Malformed XML"))
+
+    # No xml field.
+    response = self.client.post("/post/batch/", {
+        "uid": self.TEST_USER_LOGIN, "password": self.TEST_USER_PASSWORD})
+    self.assertEqual(response.status_code, 400)
+
+  def test_token_alert_post(self):
+    """Tests alert creation with an API token."""
+    alert_content = models.Alert.objects.get(uuid=self.TEST_ALERT_UUID).content
+    token = auth.create_api_token(self.test_user, "script")
+    client = Client(enforce_csrf_checks=True)
+    response = client.post("/post/", {"xml": alert_content},
+                           HTTP_AUTHORIZATION="Token " + token)
+    self.assertEqual(response.status_code, 200)
+    self.assertTrue(json.loads(response.content)["valid"])
+
+    response = client.post("/post/batch/", {"xml": [alert_content]},
+                           HTTP_AUTHORIZATION="Token " + token)
+    self.assertEqual(response.status_code, 200)
+    self.assertTrue(json.loads(response.content)[0]["valid"])
+
+    # No session login.
+    response = client.post("/post/", {"xml": alert_content})
+    self.assertEqual(response.status_code, 302)
+
+    self.test_user.api_tokens.update(revoked=True)
+    response = client.post("/post/", {"xml": alert_content},
+                           HTTP_AUTHORIZATION="Token " + token)
+    self.assertEqual(response.status_code, 403)
+
+  @override_settings(ALERT_INGEST_ASYNC=True)
+  @mock.patch("core.ingest.GetIngester")
+  def test_async_alert_post(self, get_ingester):
+    """Tests queued alert creation and job status."""
+    self.login()
+    alert_content = models.Alert.objects.get(uuid=self.TEST_ALERT_UUID).content
+    response = self.client.post("/post/", {
+        "uid": self.TEST_USER_LOGIN,
+        "password": self.TEST_USER_PASSWORD,
+        "xml": alert_content,
+    })
+    self.assertEqual(response.status_code, 202)
+    job_id = json.loads(response.content)["job_id"]
+    status_url = reverse("ingest_job", args=[job_id])
+    self.assertTrue(response["Location"].endswith(status_url))
+    self.assertTrue(get_ingester.return_value.notify.called)
+
+    response = self.client.get(status_url)
+    self.assertEqual(json.loads(response.content)["status"], "pending")
+
+    ingest.Ingester(workers=1).process_next(0)
+    job = json.loads(self.client.get(status_url).content)
+    self.assertEqual(job["status"], "done")
+    self.assertTrue(job["valid"])
+    self.assertTrue(UUID_RE.match(job["uuid"]))
+    self.assertEqual(job["error"], None)
+
+    response = self.client.get(reverse("ingest_job", args=["unknown"]))
+    self.assertEqual(response.status_code, 404)
+
+    # Jobs of other alert creators are not visible.
+    models.IngestJob.objects.filter(job_id=job_id).update(username="other")
+    self.assertEqual(self.client.get(status_url).status_code, 404)
+
   def test_alert_xml_does_not_exist(self):
     """Tests proper handling for invalid alert IDs."""
     response = self.client.get("/feed/1111-12-12.xml")
     self.assertEqual(response.status_code, 404)
 
+  def test_alert_html(self):
+    """Tests alert HTML page."""
+    response = self.client.get("/feed/%s.html" % self.TEST_ALERT_UUID)
+    self.assertEqual(response.status_code, 200)
+    self.assertTrue("Some headline." in response.content)
+    self.assertTrue("This and that area." in response.content)
+
+  def test_alert_history(self):
+    """Tests alert history JSON."""
+    models.AlertReference.objects.create(
+        alert_uuid=self.TEST_ALERT_UUID, referenced_uuid="external",
+        sender="other@example.com")
+    response = self.client.get("/feed/%s/history" % self.TEST_ALERT_UUID)
+    self.assertEqual(response.status_code, 200)
+    history = json.loads(response.content)
+    self.assertEqual([alert["uuid"] for alert in history],
+                     [self.TEST_ALERT_UUID])
+    self.assertTrue(history[0]["link"].endswith(
+        reverse("alert", args=[self.TEST_ALERT_UUID, "xml"])))
+
+    response = self.client.get("/feed/1111-12-12/history")
+    self.assertEqual(response.status_code, 404)
+
   def test_alert_html_does_not_exist(self):
     """Tests proper handling for invalid alert IDs."""
     response = self.client.get("/feed/1111-12-12.html")
@@ -108,6 +361,64 @@ class SmokeTests(TestBase):
     parsed = json.loads(response.content)
     self.assertEquals(2, len(parsed))
 
+    # Fixture polygons have no simplified levels.
+    response = self.client.post("/preview/polygons",
+                                {"geocodes": json.dumps(request), "zoom": 5})
+    self.assertEqual(json.loads(response.content), parsed)
+
+    response = self.client.post(
+        "/preview/polygons", {"geocodes": json.dumps(request)},
+        HTTP_ACCEPT=polygons.POLYLINE_CONTENT_TYPE)
+    self.assertEqual(response["Content-Type"], polygons.POLYLINE_CONTENT_TYPE)
+    self.assertIn("Accept", response["Vary"].split(", "))
+    encoded = json.loads(response.content)
+    self.assertEqual([polygons.DecodePolygons(item["polylines"])
+                      for item in encoded],
+                     [polygons.DecodePolygons(polygons.EncodePolygons(
+                         item["content"])) for item in parsed])
+
+    for params in ({"zoom": "x"}, {"zoom": 2000}, {"zoom": -1},
+                   {"tolerance": "nan"}, {"tolerance": "inf"},
+                   {"tolerance": -1}):
+      params["geocodes"] = json.dumps(request)
+      response = self.client.post("/preview/polygons", params)
+      self.assertEqual(response.status_code, 400, params)
+
+    response = self.client.get("/preview/polygons/stats")
+    self.assertEqual(response.status_code, 200)
+    stats = json.loads(response.content)
+    self.assertEquals((5, 3), (stats["hits"], stats["misses"]))
+    self.assertEqual(stats["parsed_alerts"],
+                     utils.PARSED_ALERT_CACHE.stats())
+
+  def test_geocodepreviewpolygons_search(self):
+    for params in ({}, {"bbox": "1,2,3"}, {"bbox": "3,0,1,1"},
+                   {"bbox": "a,b,c,d"}, {"point": "91,0"}):
+      response = self.client.get("/preview/polygons/search", params)
+      self.assertEqual(response.status_code, 400, params)
+
+    response = self.client.get("/preview/polygons/search",
+                               {"bbox": "29,78,30,79"})
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(json.loads(response.content), [
+        {"id": "IN_IMD_DISTRICTS|36", "valueName": "IN_IMD_DISTRICTS",
+         "value": "36"},
+        {"id": "geocode1|one", "valueName": "geocode1", "value": "one"},
+    ])
+
+    response = self.client.get("/preview/polygons/search",
+                               {"bbox": "-10,-10,10,10"})
+    self.assertEqual(json.loads(response.content), [])
+
+    response = self.client.get("/preview/polygons/search",
+                               {"point": "29.3,78.6"})
+    self.assertEqual([item["id"] for item in json.loads(response.content)],
+                     ["IN_IMD_DISTRICTS|36", "geocode1|one"])
+
+    # Within the bounding box but outside of the polygons.
+    response = self.client.get("/preview/polygons/search", {"point": "28,77"})
+    self.assertEqual(json.loads(response.content), [])
+
 
 class End2EndTests(CAPCollectorLiveServer):
   """End to end views tests."""
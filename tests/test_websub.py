@@ -0,0 +1,101 @@
+"""CAP Collector WebSub publisher tests."""
+
+import BaseHTTPServer
+import threading
+import urlparse
+
+from core import websub
+from django import test
+
+
+class RecordingHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+  """Records POST requests and answers with queued status codes."""
+
+  def do_POST(self):
+    body = self.rfile.read(int(self.headers["Content-Length"]))
+    self.server.requests.append((self.path, dict(self.headers.items()), body))
+    status = self.server.statuses.pop(0) if self.server.statuses else 204
+    self.send_response(status)
+    self.send_header("Content-Length", "0")
+    self.end_headers()
+
+  def log_message(self, *args):
+    pass
+
+
+class WebSubTests(test.SimpleTestCase):
+  """WebSub publisher unit tests."""
+
+  TOPIC_URL = "http://localhost/feed.xml"
+  CONTENT = "<feed />"
+  SECRET = "secret"
+
+  def setUp(self):
+    # A single local server stands in for both the hub and the subscriber.
+    self.server = BaseHTTPServer.HTTPServer(("localhost", 0), RecordingHandler)
+    self.server.requests = []
+    self.server.statuses = []
+    thread = threading.Thread(target=self.server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    server_url = "http://localhost:%d" % self.server.server_port
+    self.hub_url = server_url + "/hub"
+    self.callback_url = server_url + "/callback"
+
+  def tearDown(self):
+    self.server.shutdown()
+    self.server.server_close()
+
+  def GetPublisher(self, **kwargs):
+    return websub.Publisher(self.hub_url, [(self.callback_url, self.SECRET)],
+                            batch_interval=0.1, retry_delay=0.01, **kwargs)
+
+  def test_publish(self):
+    """Tests hub ping and signed content distribution."""
+    publisher = self.GetPublisher(workers=1)
+    self.assertTrue(publisher.publish(self.TOPIC_URL, lambda: self.CONTENT))
+    self.assertTrue(publisher.publish(self.TOPIC_URL, lambda: self.CONTENT))
+    publisher.join()
+
+    # Both updates of the topic are delivered in a single batch.
+    self.assertEqual(len(self.server.requests), 2)
+    hub_request, callback_request = self.server.requests
+    self.assertEqual(hub_request[0], "/hub")
+    self.assertEqual(urlparse.parse_qs(hub_request[2]),
+                     {"hub.mode": ["publish"], "hub.url": [self.TOPIC_URL]})
+
+    path, headers, body = callback_request
+    self.assertEqual(path, "/callback")
+    self.assertEqual(body, self.CONTENT)
+    self.assertEqual(headers["content-type"], "application/atom+xml")
+    self.assertEqual(headers["x-hub-signature"],
+                     websub.GetSignature(self.SECRET, self.CONTENT))
+    self.assertEqual(headers["link"], "<%s>; rel=\"self\", <%s>; rel=\"hub\""
+                     % (self.TOPIC_URL, self.hub_url))
+
+  def test_publish_unicode(self):
+    """Tests non-ASCII content is distributed and signed as UTF-8."""
+    content = u"<feed><title>S\xe9isme \u0905</title></feed>"
+    publisher = self.GetPublisher(workers=1)
+    publisher.publish(self.TOPIC_URL, lambda: content)
+    publisher.join()
+
+    _, headers, body = self.server.requests[1]
+    self.assertEqual(body, content.encode("utf-8"))
+    self.assertEqual(headers["x-hub-signature"],
+                     websub.GetSignature(self.SECRET, content.encode("utf-8")))
+
+  def test_publish_retried(self):
+    """Tests failed requests are retried."""
+    self.server.statuses = [500, 503]
+    publisher = self.GetPublisher(workers=1, max_retries=2)
+    publisher.publish(self.TOPIC_URL, lambda: self.CONTENT)
+    publisher.join()
+    self.assertEqual([request[0] for request in self.server.requests],
+                     ["/hub", "/hub", "/hub", "/callback"])
+
+  def test_publish_queue_full(self):
+    """Tests publishing does not block when the queue is full."""
+    publisher = self.GetPublisher(workers=0, queue_size=1)
+    self.assertTrue(publisher.publish(self.TOPIC_URL, lambda: self.CONTENT))
+    self.assertFalse(publisher.publish(self.TOPIC_URL, lambda: self.CONTENT))